@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import config
+from app.ingest import file_digest
+
+# Keeps the Excel files in data/ in sync with Vercel Blob. The store is listed
+# once, then the files are downloaded concurrently over one pooled HTTP
+# session. A manifest records what each file was synced from (listing size and
+# upload time, response ETag / Last-Modified, SHA-256), so an unchanged blob
+# costs no request at all, or at most a conditional one answered with 304.
+# Bodies are streamed to a temp file next to the target and swapped in only
+# when their hash differs from the local copy.
+
+MANIFEST_FILE = "blob_sync.json"
+
+CHUNK_SIZE = 1024 * 1024
+
+DOWNLOAD_TIMEOUT = 60
+
+def list_blobs() -> Dict[str, dict]:
+    """Every blob in the store by pathname, following the listing's pages"""
+    import vercel_blob
+    blobs = {}
+    options = {}
+    while True:
+        page = vercel_blob.list(options)
+        for blob in page.get("blobs", []):
+            blobs[blob["pathname"]] = blob
+        if not page.get("hasMore") or not page.get("cursor"):
+            return blobs
+        options = {"cursor": page["cursor"]}
+
+def create_session(pool_size: int):
+    """requests session whose connection pool fits pool_size concurrent downloads"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def read_manifest(data_dir: Path) -> Dict[str, dict]:
+    try:
+        with open(data_dir / MANIFEST_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(data_dir: Path, manifest: Dict[str, dict]):
+    # Written to a temp file and renamed, so a crash never leaves half a manifest
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir, prefix=f".{MANIFEST_FILE}.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, data_dir / MANIFEST_FILE)
+
+# Helper to get the hash of the local copy, trusting the manifest while the file's size still matches
+def local_digest(local_path: Path, previous: Optional[dict]) -> Optional[str]:
+    if not local_path.exists():
+        return None
+    if previous and previous.get("sha256") and local_path.stat().st_size == previous.get("bytes"):
+        return previous["sha256"]
+    return file_digest(local_path)
+
+def sync_blob(session, blob: dict, local_path: Path, previous: Optional[dict]) -> dict:
+    """Bring local_path up to date with blob; returns its manifest entry plus the sync status"""
+    listed = {"size": blob.get("size"), "uploaded_at": blob.get("uploadedAt")}
+    intact = previous is not None and local_path.exists() and local_path.stat().st_size == previous.get("bytes")
+
+    # Listing says nothing changed since the last sync: no request needed
+    if intact and listed["size"] is not None and listed == {"size": previous.get("size"), "uploaded_at": previous.get("uploaded_at")}:
+        return {**previous, "status": "unchanged"}
+
+    headers = {}
+    if intact:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    with session.get(blob.get("downloadUrl") or blob["url"], headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            return {**previous, **listed, "status": "unchanged"}
+        response.raise_for_status()
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=local_path.parent, prefix=f".{local_path.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            entry = {
+                **listed,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": digest.hexdigest(),
+                "bytes": size
+            }
+            # Leave an identical local copy (and its mtime) alone
+            if local_digest(local_path, previous) == entry["sha256"]:
+                return {**entry, "status": "unchanged"}
+            os.replace(tmp_path, local_path)
+            return {**entry, "status": "downloaded"}
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+def sync_blobs(filenames: List[str], data_dir: Path, blobs: Dict[str, dict], workers: Optional[int] = None) -> Dict[str, dict]:
+    """Sync filenames from the listed blobs into data_dir; returns each file's entry and status
+
+    status is "downloaded", "unchanged", "missing" (not in the store) or
+    "failed" (with an "error").
+    """
+    data_dir.mkdir(exist_ok=True)
+    manifest = read_manifest(data_dir)
+    results = {}
+    wanted = []
+    for filename in filenames:
+        if filename in blobs:
+            wanted.append(filename)
+        else:
+            results[filename] = {"status": "missing"}
+            print(f"[BlobSync] {filename} not found in Vercel Blob")
+
+    workers = max(1, min(workers or config.BLOB_SYNC_CONCURRENCY, len(wanted) or 1))
+    session = create_session(workers)
+
+    def sync_one(filename: str) -> dict:
+        start = time.perf_counter()
+        try:
+            result = sync_blob(session, blobs[filename], data_dir / filename, manifest.get(filename))
+        except Exception as e:
+            print(f"[BlobSync] Failed to sync {filename}: {e}")
+            return {"status": "failed", "error": str(e)}
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blob-sync") as pool:
+            results.update(zip(wanted, pool.map(sync_one, wanted)))
+    finally:
+        session.close()
+
+    for filename in wanted:
+        if results[filename]["status"] in ("downloaded", "unchanged"):
+            manifest[filename] = {key: value for key, value in results[filename].items() if key not in ("status", "ms")}
+    write_manifest(data_dir, manifest)
+    return results
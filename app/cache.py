@@ -0,0 +1,394 @@
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import config
+
+# Search result cache, one shard per dataset. Each shard is bounded by an
+# estimated byte budget rather than an entry count, can be invalidated on
+# its own, and uses a TinyLFU admission policy: a new entry only evicts
+# entries that have been requested less often than it has, so one large
+# one-off result can't flush the hot queries out of the cache.
+#
+# Entries are tagged with the dataset version they were computed at and the
+# query words. After an incremental upload an older entry is still served
+# (and retagged) when none of the changed rows matches its query, checked
+# against the change log; after a full replace it is a miss.
+
+# (namespace, from version, to version) -> search texts of the rows changed
+# in between, or None if they can't be told
+ChangeTexts = Callable[[str, int, int], Optional[List[str]]]
+
+def still_valid(entry_version: Optional[int], words: Optional[List[str]], version: Optional[int],
+                change_texts: Optional[ChangeTexts], namespace: str) -> bool:
+    """Whether a result cached at entry_version is still the result at version"""
+    if entry_version == version:
+        return True
+    if change_texts is None or words is None or entry_version is None or version is None or entry_version > version:
+        return False
+    texts = change_texts(namespace, entry_version, version)
+    # Only rows matching every query word can change the result
+    return texts is not None and not any(all(word in text for word in words) for text in texts)
+
+def estimate_size(value: Any) -> int:
+    """Rough in-memory size of a cached value in bytes"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value) + 48
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class FrequencySketch:
+    """Count-min sketch of request frequencies with periodic aging (TinyLFU)"""
+
+    DEPTH = 4
+
+    def __init__(self, width: int = 4096, sample_size: int = 40960):
+        self.width = width
+        self.sample_size = sample_size
+        self.tables = [[0] * width for _ in range(self.DEPTH)]
+        self.additions = 0
+
+    def _slots(self, key: str):
+        return [hash((i, key)) % self.width for i in range(self.DEPTH)]
+
+    def record(self, key: str):
+        for table, slot in zip(self.tables, self._slots(key)):
+            if table[slot] < 255:
+                table[slot] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            # Halve every counter so old popularity fades out
+            self.tables = [[count >> 1 for count in table] for table in self.tables]
+            self.additions //= 2
+
+    def estimate(self, key: str) -> int:
+        return min(table[slot] for table, slot in zip(self.tables, self._slots(key)))
+
+class CacheShard:
+    """Byte-bounded LRU of one dataset's results, guarded by its own lock"""
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()  # key -> [value, size, stored_at, version, words]
+        self.bytes = 0
+        self.sketch = FrequencySketch()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        self.bytes -= entry[1]
+
+    def get(self, key: str, version: Optional[int] = None, is_valid: Optional[Callable] = None) -> Optional[Any]:
+        with self.lock:
+            self.sketch.record(key)
+            entry = self.entries.get(key)
+            if entry is not None:
+                if time.time() - entry[2] < self.ttl and (
+                    entry[3] == version or (is_valid is not None and is_valid(entry[3], entry[4], version))
+                ):
+                    entry[3] = version
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                # Expired or out of date, remove
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any, version: Optional[int] = None, words: Optional[List[str]] = None) -> bool:
+        """Store a value; returns False if the admission policy rejected it"""
+        size = estimate_size(value)
+        with self.lock:
+            # The lookup that missed already counted this request
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self.rejections += 1
+                return False
+
+            # Pick LRU victims until the new entry fits; give up if any of them
+            # is requested more often than the candidate
+            victims = []
+            freed = 0
+            now = time.time()
+            candidate_freq = self.sketch.estimate(key)
+            for victim_key, (_, victim_size, stored_at, _, _) in self.entries.items():
+                if self.bytes - freed + size <= self.max_bytes:
+                    break
+                if now - stored_at < self.ttl and self.sketch.estimate(victim_key) > candidate_freq:
+                    self.rejections += 1
+                    return False
+                victims.append(victim_key)
+                freed += victim_size
+
+            for victim_key in victims:
+                self._remove(victim_key)
+                self.evictions += 1
+            self.entries[key] = [value, size, now, version, words]
+            self.bytes += size
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        now = time.time()
+        with self.lock:
+            return {
+                "total_entries": len(self.entries),
+                "active_entries": sum(1 for entry in self.entries.values() if now - entry[2] < self.ttl),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejections": self.rejections
+            }
+
+class ResultCache:
+    """Search result cache namespaced by dataset"""
+
+    def __init__(self, change_texts: Optional[ChangeTexts] = None):
+        self.shards: Dict[str, CacheShard] = {}
+        self.lock = threading.Lock()
+        self.change_texts = change_texts
+
+    def shard(self, namespace: str) -> CacheShard:
+        shard = self.shards.get(namespace)
+        if shard is None:
+            with self.lock:
+                shard = self.shards.get(namespace)
+                if shard is None:
+                    max_bytes, ttl = config.cache_settings(namespace)
+                    shard = self.shards[namespace] = CacheShard(max_bytes, ttl)
+        return shard
+
+    def get(self, namespace: str, key: str, version: Optional[int] = None) -> Optional[Any]:
+        """Cached value if it was stored at version, or at an older one the changes since don't affect"""
+        def is_valid(entry_version, words, version):
+            return still_valid(entry_version, words, version, self.change_texts, namespace)
+        return self.shard(namespace).get(key, version, is_valid)
+
+    def set(self, namespace: str, key: str, value: Any, version: Optional[int] = None, words: Optional[List[str]] = None) -> bool:
+        """Cache a value computed at a dataset version for the given query words"""
+        return self.shard(namespace).set(key, value, version, words)
+
+    def invalidate(self, namespace: str):
+        """Drop every cached result of one dataset"""
+        self.shard(namespace).clear()
+
+    def clear(self):
+        for shard in list(self.shards.values()):
+            shard.clear()
+
+    def get_stats(self):
+        datasets = {namespace: shard.get_stats() for namespace, shard in list(self.shards.items())}
+        return {
+            "total_entries": sum(s["total_entries"] for s in datasets.values()),
+            "active_entries": sum(s["active_entries"] for s in datasets.values()),
+            "bytes": sum(s["bytes"] for s in datasets.values()),
+            "max_bytes": sum(s["max_bytes"] for s in datasets.values()),
+            "hits": sum(s["hits"] for s in datasets.values()),
+            "misses": sum(s["misses"] for s in datasets.values()),
+            "datasets": datasets
+        }
+
+class DiskCache:
+    """Result cache in a local SQLite file, shared by every worker on the host
+
+    Entries survive restarts. Values must be bytes (encoded response bodies).
+    Every call runs SQLite transactions, so callers go through run_io, as
+    they do for the memory cache (its validity checks read the change log).
+    Reads don't write (except to retag an entry an incremental upload didn't
+    affect), so eviction is by age (oldest stored first) within each
+    dataset's byte budget rather than LRU.
+    """
+
+    def __init__(self, path: str, timeout: float = 0.1, change_texts: Optional[ChangeTexts] = None):
+        self.path = path
+        self.timeout = timeout
+        self.change_texts = change_texts
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            # Short timeout: a busy cache is treated as a miss rather than stalling the request
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+            if columns and "version" not in columns:
+                # Written before entries were tagged with versions, start over
+                conn.execute("DROP TABLE cache_entries")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, "
+                "version INTEGER, "
+                "words TEXT, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_age ON cache_entries (namespace, stored_at)")
+            conn.commit()
+            self.conn = conn
+        return self.conn
+
+    def get(self, namespace: str, key: str, version: Optional[int] = None) -> Optional[bytes]:
+        _, ttl = config.cache_settings(namespace)
+        with self.lock:
+            try:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT value, version, words FROM cache_entries WHERE namespace = ? AND key = ? AND stored_at > ?",
+                    (namespace, key, time.time() - ttl)
+                ).fetchone()
+                if row is not None and row[1] != version:
+                    words = row[2].split() if row[2] is not None else None
+                    if still_valid(row[1], words, version, self.change_texts, namespace):
+                        with conn:
+                            conn.execute("UPDATE cache_entries SET version = ? WHERE namespace = ? AND key = ?", (version, namespace, key))
+                    else:
+                        row = None
+            except sqlite3.Error as e:
+                print(f"[Cache] Warning: Disk cache read failed: {e}")
+                self.errors += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, namespace: str, key: str, value: bytes, version: Optional[int] = None, words: Optional[List[str]] = None) -> bool:
+        max_bytes, ttl = config.cache_settings(namespace)
+        if len(value) > max_bytes:
+            return False
+        now = time.time()
+        with self.lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND stored_at <= ?", (namespace, now - ttl))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, stored_at, version, words) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (namespace, key, value, len(value), now, version, " ".join(words) if words is not None else None)
+                    )
+                    # Drop the oldest entries until the dataset is back within budget
+                    total = conn.execute("SELECT SUM(size) FROM cache_entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+                    if total > max_bytes:
+                        for old_key, size in conn.execute(
+                            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY stored_at", (namespace,)
+                        ).fetchall():
+                            if total <= max_bytes:
+                                break
+                            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, old_key))
+                            total -= size
+                return True
+            except sqlite3.Error as e:
+                print(f"[Cache] Warning: Disk cache write failed: {e}")
+                self.errors += 1
+                return False
+
+    def _delete(self, where: str = "", params: tuple = ()):
+        with self.lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute(f"DELETE FROM cache_entries {where}", params)
+            except sqlite3.Error as e:
+                print(f"[Cache] Warning: Disk cache delete failed: {e}")
+                self.errors += 1
+
+    def invalidate(self, namespace: str):
+        """Drop every cached result of one dataset, for all workers"""
+        self._delete("WHERE namespace = ?", (namespace,))
+
+    def clear(self):
+        self._delete()
+
+    def get_stats(self):
+        datasets = {}
+        with self.lock:
+            try:
+                for namespace, entries, size in self._connect().execute(
+                    "SELECT namespace, COUNT(*), SUM(size) FROM cache_entries GROUP BY namespace"
+                ):
+                    datasets[namespace] = {"total_entries": entries, "bytes": size}
+            except sqlite3.Error as e:
+                print(f"[Cache] Warning: Could not read disk cache stats: {e}")
+        return {
+            "path": self.path,
+            "total_entries": sum(s["total_entries"] for s in datasets.values()),
+            "bytes": sum(s["bytes"] for s in datasets.values()),
+            # Hits and misses are counted by this worker only
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "datasets": datasets
+        }
+
+class TieredCache:
+    """Per-worker memory cache in front of the shared disk cache"""
+
+    def __init__(self, memory: ResultCache, disk: DiskCache):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, namespace: str, key: str, version: Optional[int] = None) -> Optional[Any]:
+        value = self.memory.get(namespace, key, version)
+        if value is None:
+            value = self.disk.get(namespace, key, version)
+            if value is not None:
+                # The query words aren't kept in memory for promoted entries, so
+                # after the next upload they are checked against the disk copy
+                self.memory.set(namespace, key, value, version)
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, version: Optional[int] = None, words: Optional[List[str]] = None) -> bool:
+        stored = self.memory.set(namespace, key, value, version, words)
+        return self.disk.set(namespace, key, value, version, words) or stored
+
+    def invalidate(self, namespace: str):
+        self.memory.invalidate(namespace)
+        self.disk.invalidate(namespace)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+    def get_stats(self):
+        return {
+            "backend": "disk",
+            "backends": {
+                "memory": self.memory.get_stats(),
+                "disk": self.disk.get_stats()
+            }
+        }
+
+def create_search_cache(change_texts: Optional[ChangeTexts] = None):
+    """Search cache for the configured CACHE_BACKEND; change_texts reads the incremental upload log"""
+    if config.CACHE_BACKEND == "disk":
+        print(f"[Cache] Using shared disk cache at {config.CACHE_DISK_PATH}")
+        return TieredCache(ResultCache(change_texts), DiskCache(config.CACHE_DISK_PATH, change_texts=change_texts))
+    return ResultCache(change_texts)
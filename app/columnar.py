@@ -0,0 +1,183 @@
+import sys
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Column-wise storage of a dataset's rows. Lists of row dicts repeat every key
+# and every repeated value per row; here each column is either a plain list of
+# values or, when values repeat (category names, sources, PDP strings), a
+# dictionary of its distinct values (strings interned) plus one code per row.
+# Rows are only built as dicts for the ones a search returns.
+
+# Dictionary-encode a column when it has at most this share of distinct values
+DICTIONARY_MAX_DISTINCT = 0.5
+
+CODE_TYPE = "I"
+
+# (values, codes): codes is None for a plain column, else values holds the distinct values
+Column = Tuple[list, Optional[array]]
+
+# Helper to key distinct values so 1, 1.0 and True stay apart
+def _value_key(value):
+    return type(value), value
+
+def encode_column(values: Sequence) -> Column:
+    """Dictionary-encode a column of values if enough of them repeat"""
+    positions: Dict[tuple, int] = {}
+    distinct = []
+    codes = array(CODE_TYPE)
+    limit = len(values) * DICTIONARY_MAX_DISTINCT
+    for value in values:
+        key = _value_key(value)
+        code = positions.get(key)
+        if code is None:
+            if len(distinct) >= limit:
+                return list(values), None
+            code = positions[key] = len(distinct)
+            distinct.append(sys.intern(value) if type(value) is str else value)
+        codes.append(code)
+    return distinct, codes
+
+class ColumnarTable:
+    """Rows of a table stored column by column; rows[i] builds row i as a dict (None if deleted)"""
+
+    def __init__(self, names: List[str], columns: List[Column], length: int, deleted: Optional[frozenset] = None):
+        self.names = names
+        self.columns = columns
+        self.length = length
+        self.deleted = deleted or frozenset()
+        self._lowered: Dict[str, list] = {}  # lowercased distinct values of encoded columns
+
+    @classmethod
+    def from_columns(cls, names: List[str], columns: List[Sequence]) -> "ColumnarTable":
+        """Table from one sequence of values per column"""
+        length = len(columns[0]) if columns else 0
+        return cls(list(names), [encode_column(values) for values in columns], length)
+
+    @classmethod
+    def from_records(cls, names: List[str], records: List[tuple]) -> "ColumnarTable":
+        """Table from row tuples, e.g. a cursor's fetchall()"""
+        columns = list(zip(*records)) if records else [() for _ in names]
+        return cls.from_columns(names, columns)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, row_id: int) -> Optional[dict]:
+        if row_id in self.deleted:
+            return None
+        return {
+            name: values[row_id] if codes is None else values[codes[row_id]]
+            for name, (values, codes) in zip(self.names, self.columns)
+        }
+
+    def take(self, row_ids: List[int]) -> List[Optional[dict]]:
+        """Rows by id as dicts, gathered a column at a time"""
+        gathered = [
+            [values[row_id] for row_id in row_ids] if codes is None else [values[codes[row_id]] for row_id in row_ids]
+            for values, codes in self.columns
+        ]
+        names = self.names
+        rows = [dict(zip(names, row_values)) for row_values in zip(*gathered)] if gathered else [{} for _ in row_ids]
+        if self.deleted:
+            rows = [None if row_id in self.deleted else row for row_id, row in zip(row_ids, rows)]
+        return rows
+
+    def __iter__(self) -> Iterator[Optional[dict]]:
+        for row_id in range(self.length):
+            yield self[row_id]
+
+    def column_values(self, name: str) -> list:
+        """All values of a column, one per row"""
+        values, codes = self.columns[self.names.index(name)]
+        return list(values) if codes is None else [values[code] for code in codes]
+
+    def value_counts(self, name: str) -> Dict[object, int]:
+        """Number of rows holding each value of a column, leaving out NULLs and deleted rows"""
+        values, codes = self.columns[self.names.index(name)]
+        counts: Dict[object, int] = {}
+        if codes is None:
+            for row_id, value in enumerate(values):
+                if value is not None and row_id not in self.deleted:
+                    counts[value] = counts.get(value, 0) + 1
+            return counts
+        code_counts = [0] * len(values)
+        for row_id, code in enumerate(codes):
+            if row_id not in self.deleted:
+                code_counts[code] += 1
+        return {values[code]: count for code, count in enumerate(code_counts) if count and values[code] is not None}
+
+    def lowered_getter(self, name: str) -> Callable[[int], Optional[str]]:
+        """Function returning a column's lowercased value of a row id (None for NULLs and missing columns)"""
+        if name not in self.names:
+            return lambda row_id: None
+        values, codes = self.columns[self.names.index(name)]
+        if codes is None:
+            return lambda row_id: None if values[row_id] is None else str(values[row_id]).lower()
+        lowered = self._lowered.get(name)
+        if lowered is None:
+            # Lowercase each distinct value once and keep it, the table never changes
+            lowered = self._lowered[name] = [None if value is None else str(value).lower() for value in values]
+        return lambda row_id: lowered[codes[row_id]]
+
+    def search_texts(self, columns: List[str]) -> List[Optional[str]]:
+        """Lowercased search text of each row, same as row_search_text (None for deleted rows)"""
+        parts = []
+        for name in columns:
+            if name not in self.names:
+                continue
+            values, codes = self.columns[self.names.index(name)]
+            # Lowercase each distinct value once
+            lowered = [None if value is None else str(value).lower() for value in values]
+            parts.append(lowered if codes is None else [lowered[code] for code in codes])
+        if not parts:
+            texts = [""] * self.length
+        else:
+            texts = [" ".join(part for part in row_parts if part is not None) for row_parts in zip(*parts)]
+        for row_id in self.deleted:
+            texts[row_id] = None
+        return texts
+
+    def patch(self, updates: Dict[int, Optional[dict]], appended: List[dict]) -> "ColumnarTable":
+        """Copy of the table with rows replaced by id (None deletes) and rows appended; self is left as is"""
+        deleted = set(self.deleted)
+        for row_id, row in updates.items():
+            if row is None:
+                deleted.add(row_id)
+            else:
+                deleted.discard(row_id)
+
+        columns = []
+        for name, (values, codes) in zip(self.names, self.columns):
+            values = list(values)
+            if codes is None:
+                for row_id, row in updates.items():
+                    if row is not None:
+                        values[row_id] = row.get(name)
+                values.extend(row.get(name) for row in appended)
+            else:
+                codes = array(CODE_TYPE, codes)
+                positions = {_value_key(value): code for code, value in enumerate(values)}
+
+                def code_of(value) -> int:
+                    key = _value_key(value)
+                    code = positions.get(key)
+                    if code is None:
+                        code = positions[key] = len(values)
+                        values.append(sys.intern(value) if type(value) is str else value)
+                    return code
+
+                for row_id, row in updates.items():
+                    if row is not None:
+                        codes[row_id] = code_of(row.get(name))
+                codes.extend(code_of(row.get(name)) for row in appended)
+            columns.append((values, codes))
+        return ColumnarTable(self.names, columns, self.length + len(appended), frozenset(deleted))
+
+    def memory_bytes(self) -> int:
+        """Rough size of the stored values and codes"""
+        total = 0
+        for values, codes in self.columns:
+            total += sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+            if codes is not None:
+                total += codes.itemsize * len(codes)
+        return total
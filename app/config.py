@@ -1,18 +1,68 @@
 import os
-from typing import Optional
+import tempfile
+from typing import Dict, Optional
 
 class Config:
     """Application configuration"""
     
     # Vercel Blob Storage configuration
     BLOB_READ_WRITE_TOKEN: Optional[str] = os.getenv("BLOB_READ_WRITE_TOKEN")
+
+    # Concurrent downloads (and pooled connections) when syncing files from Vercel Blob
+    BLOB_SYNC_CONCURRENCY: int = int(os.getenv("BLOB_SYNC_CONCURRENCY", "4"))
     
     # Admin configuration
     ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD", "admin123")  # Change this in production
     
     # App configuration
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
-    
+
+    # Put the database in WAL mode when ingesting (if its directory is writable), so searches keep reading while an upload is written
+    SQLITE_WAL: bool = os.getenv("SQLITE_WAL", "True").lower() == "true"
+
+    # Read connections (one per I/O thread, kept open): memory map and page cache size
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_KB: int = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+
+    # Search engine: "memory" (in-process trigram index) or "fts" (SQLite FTS5)
+    SEARCH_ENGINE: str = os.getenv("SEARCH_ENGINE", "memory").lower()
+
+    # Search results per page when a request doesn't ask for a limit, and the largest limit allowed
+    SEARCH_PAGE_SIZE: int = int(os.getenv("SEARCH_PAGE_SIZE", "100"))
+    SEARCH_MAX_LIMIT: int = int(os.getenv("SEARCH_MAX_LIMIT", "1000"))
+    # Largest limit of a streamed (NDJSON) search, its rows are sent a chunk at a time
+    SEARCH_STREAM_MAX_LIMIT: int = int(os.getenv("SEARCH_STREAM_MAX_LIMIT", "100000"))
+    # Most edits a fuzzy search corrects a query word by (1-2); 0 skips building the fuzzy index
+    FUZZY_MAX_DISTANCE: int = int(os.getenv("FUZZY_MAX_DISTANCE", "2"))
+
+    # Executors: threads for SQLite I/O, optional worker processes for scans (0 = run scans on threads)
+    IO_THREADS: int = int(os.getenv("IO_THREADS", "4"))
+    SCAN_PROCESSES: int = int(os.getenv("SCAN_PROCESSES", "0"))
+
+    # How often (seconds) datasets are checked for changes and refreshed in the background
+    DATA_REFRESH_INTERVAL: int = int(os.getenv("DATA_REFRESH_INTERVAL", "600"))
+
+    # How often (seconds) each worker checks dataset_versions for uploads made by other workers
+    VERSION_CHECK_INTERVAL: float = float(os.getenv("VERSION_CHECK_INTERVAL", "1"))
+
+    # Search result cache: byte budget and TTL per dataset table
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+    CACHE_TTL: int = int(os.getenv("CACHE_TTL", "600"))
+    CACHE_DATASET_SETTINGS: Dict[str, Dict[str, int]] = {
+        "attributes": {"max_bytes": 16 * 1024 * 1024},
+        "rms_manufacturer_brands": {"max_bytes": 16 * 1024 * 1024},
+        "category_pdp_plp": {"max_bytes": 8 * 1024 * 1024},
+        "ptypes_dump": {"max_bytes": 8 * 1024 * 1024},
+    }
+
+    # Startup warmup: preload every dataset, then replay queries from a JSON file ({"<table>": ["query", ...]})
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
+    WARMUP_QUERIES_FILE: Optional[str] = os.getenv("WARMUP_QUERIES_FILE")
+
+    # Cache backend: "memory" (per worker) or "disk" (memory in front of a SQLite file shared by all workers on the host)
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory").lower()
+    CACHE_DISK_PATH: str = os.getenv("CACHE_DISK_PATH", os.path.join(tempfile.gettempdir(), "custom_search_cache.db"))
+
     @classmethod
     def validate_blob_config(cls) -> bool:
         """Validate that Vercel Blob is properly configured"""
@@ -22,17 +72,64 @@ class Config:
         print(f"✓ BLOB_READ_WRITE_TOKEN is set. Length: {len(cls.BLOB_READ_WRITE_TOKEN)}")
         return True
 
+    @classmethod
+    def cache_settings(cls, dataset: str):
+        """(max_bytes, ttl) of a dataset's result cache, overridable with CACHE_<TABLE>_MAX_BYTES / CACHE_<TABLE>_TTL"""
+        settings = cls.CACHE_DATASET_SETTINGS.get(dataset, {})
+        prefix = f"CACHE_{dataset.upper()}_"
+        max_bytes = int(os.getenv(prefix + "MAX_BYTES", settings.get("max_bytes", cls.CACHE_MAX_BYTES)))
+        ttl = int(os.getenv(prefix + "TTL", settings.get("ttl", cls.CACHE_TTL)))
+        return max_bytes, ttl
+
     @classmethod
     def debug_print(cls):
         print(f"BLOB_READ_WRITE_TOKEN: {cls.BLOB_READ_WRITE_TOKEN}")
+        print(f"BLOB_SYNC_CONCURRENCY: {cls.BLOB_SYNC_CONCURRENCY}")
         print(f"ADMIN_PASSWORD: {cls.ADMIN_PASSWORD}")
         print(f"DEBUG: {cls.DEBUG}")
+        print(f"SQLITE_WAL: {cls.SQLITE_WAL}")
+        print(f"SQLITE_MMAP_SIZE: {cls.SQLITE_MMAP_SIZE}")
+        print(f"SQLITE_CACHE_KB: {cls.SQLITE_CACHE_KB}")
+        print(f"SEARCH_ENGINE: {cls.SEARCH_ENGINE}")
+        print(f"SEARCH_PAGE_SIZE: {cls.SEARCH_PAGE_SIZE}")
+        print(f"SEARCH_MAX_LIMIT: {cls.SEARCH_MAX_LIMIT}")
+        print(f"SEARCH_STREAM_MAX_LIMIT: {cls.SEARCH_STREAM_MAX_LIMIT}")
+        print(f"FUZZY_MAX_DISTANCE: {cls.FUZZY_MAX_DISTANCE}")
+        print(f"IO_THREADS: {cls.IO_THREADS}")
+        print(f"SCAN_PROCESSES: {cls.SCAN_PROCESSES}")
+        print(f"DATA_REFRESH_INTERVAL: {cls.DATA_REFRESH_INTERVAL}")
+        print(f"VERSION_CHECK_INTERVAL: {cls.VERSION_CHECK_INTERVAL}")
+        print(f"CACHE_MAX_BYTES: {cls.CACHE_MAX_BYTES}")
+        print(f"CACHE_TTL: {cls.CACHE_TTL}")
+        print(f"CACHE_BACKEND: {cls.CACHE_BACKEND}")
+        print(f"WARMUP_ON_STARTUP: {cls.WARMUP_ON_STARTUP}")
+        print(f"WARMUP_QUERIES_FILE: {cls.WARMUP_QUERIES_FILE}")
+        print(f"CACHE_DISK_PATH: {cls.CACHE_DISK_PATH}")
 
     @classmethod
     def reload_env(cls):
         cls.BLOB_READ_WRITE_TOKEN = os.getenv("BLOB_READ_WRITE_TOKEN")
+        cls.BLOB_SYNC_CONCURRENCY = int(os.getenv("BLOB_SYNC_CONCURRENCY", "4"))
         cls.ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
         cls.DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+        cls.SQLITE_WAL = os.getenv("SQLITE_WAL", "True").lower() == "true"
+        cls.SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+        cls.SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+        cls.SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "memory").lower()
+        cls.SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "100"))
+        cls.SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "1000"))
+        cls.SEARCH_STREAM_MAX_LIMIT = int(os.getenv("SEARCH_STREAM_MAX_LIMIT", "100000"))
+        cls.FUZZY_MAX_DISTANCE = int(os.getenv("FUZZY_MAX_DISTANCE", "2"))
+        cls.IO_THREADS = int(os.getenv("IO_THREADS", "4"))
+        cls.SCAN_PROCESSES = int(os.getenv("SCAN_PROCESSES", "0"))
+        cls.DATA_REFRESH_INTERVAL = int(os.getenv("DATA_REFRESH_INTERVAL", "600"))
+        cls.VERSION_CHECK_INTERVAL = float(os.getenv("VERSION_CHECK_INTERVAL", "1"))
+        cls.CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+        cls.CACHE_TTL = int(os.getenv("CACHE_TTL", "600"))
+        cls.CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+        cls.WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
+        cls.WARMUP_QUERIES_FILE = os.getenv("WARMUP_QUERIES_FILE")
+        cls.CACHE_DISK_PATH = os.getenv("CACHE_DISK_PATH", os.path.join(tempfile.gettempdir(), "custom_search_cache.db"))
 
 # Global config instance
 config = Config() 
\ No newline at end of file
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config import config
+
+# Long-lived SQLite connections shared by every router. Reads go through one
+# read-only connection per thread (in practice the sqlite-io pool), opened
+# with mode=ro and query_only and given a larger page cache and a memory map,
+# which then survive between requests instead of being rebuilt by a fresh
+# connect() every time. Writes (admin ingestion) go through a single writer
+# connection per database, which also serializes this process's uploads.
+
+class QueryStats:
+    """Count and timings of the blocks run on one kind of connection"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, ms: float):
+        with self.lock:
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 1)
+        }
+
+# Helper to identify the database file, so connections notice when it's replaced
+def file_id(db_file: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = db_file.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+class ConnectionManager:
+    """Per-thread read-only connections and one writer connection for a database file"""
+
+    def __init__(self, db_file: Path):
+        self.db_file = Path(db_file)
+        self.local = threading.local()
+        self.readers: Dict[int, sqlite3.Connection] = {}  # by thread id
+        self.writer: Optional[sqlite3.Connection] = None
+        self.writer_file = None
+        self.write_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reads = QueryStats()
+        self.writes = QueryStats()
+
+    def _open_reader(self) -> sqlite3.Connection:
+        # check_same_thread=False only so close() can run on another thread
+        conn = sqlite3.connect(f"{self.db_file.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_KB}")
+        with self.lock:
+            self.opened += 1
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        current = file_id(self.db_file)
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and self.local.file_id != current:
+            # The database was replaced (e.g. a deploy copied a new file over it)
+            self._close_reader(conn)
+            conn = None
+        if conn is None:
+            conn = self._open_reader()
+            self.local.conn, self.local.file_id = conn, current
+            with self.lock:
+                self.readers[threading.get_ident()] = conn
+        return conn
+
+    def _close_reader(self, conn: sqlite3.Connection):
+        with self.lock:
+            self.readers.pop(threading.get_ident(), None)
+        self.local.conn = None
+        conn.close()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """The calling thread's read-only connection; a transaction begun in the block is ended with it"""
+        conn = self._reader()
+        start = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.reads.add((time.perf_counter() - start) * 1000)
+
+    def _writer_conn(self) -> sqlite3.Connection:
+        current = file_id(self.db_file)
+        if self.writer is not None and self.writer_file != current:
+            self.writer.close()
+            self.writer = None
+        if self.writer is None:
+            self.writer = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            # Persistent: from now on readers don't wait for writers (and vice versa). Only where the
+            # directory is writable, WAL readers have to create the -wal/-shm files next to the database
+            if config.SQLITE_WAL and os.access(self.db_file.parent, os.W_OK):
+                self.writer.execute("PRAGMA journal_mode=WAL")
+            self.writer_file = file_id(self.db_file)
+            with self.lock:
+                self.opened += 1
+        return self.writer
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """The database's writer connection, held exclusively for the block"""
+        with self.write_lock:
+            conn = self._writer_conn()
+            start = time.perf_counter()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self.writes.add((time.perf_counter() - start) * 1000)
+
+    def close(self):
+        """Close every connection (application shutdown); threads reopen theirs if used again"""
+        with self.lock:
+            readers = list(self.readers.values())
+            self.readers.clear()
+        for conn in readers:
+            conn.close()
+        with self.write_lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+        self.local = threading.local()
+
+    def get_stats(self) -> dict:
+        return {
+            "db_file": str(self.db_file),
+            "readers": len(self.readers),
+            "writer": self.writer is not None,
+            "opened": self.opened,
+            "reads": self.reads.to_dict(),
+            "writes": self.writes.to_dict()
+        }
+
+_managers: Dict[Path, ConnectionManager] = {}
+_managers_pid = os.getpid()
+_managers_lock = threading.Lock()
+
+def connections(db_file: Path) -> ConnectionManager:
+    """The process's connection manager for a database file"""
+    global _managers_pid
+    with _managers_lock:
+        # Connections can't cross a fork: a worker process starts over
+        if _managers_pid != os.getpid():
+            _managers.clear()
+            _managers_pid = os.getpid()
+        manager = _managers.get(db_file)
+        if manager is None:
+            manager = _managers[db_file] = ConnectionManager(db_file)
+        return manager
+
+def close_connections():
+    """Close every manager's connections (application shutdown)"""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.close()
+
+def get_connection_stats() -> Dict[str, dict]:
+    with _managers_lock:
+        return {manager.db_file.name: manager.get_stats() for manager in _managers.values()}
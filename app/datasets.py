@@ -0,0 +1,454 @@
+import asyncio
+import itertools
+import json
+import math
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.columnar import ColumnarTable
+from app.config import config
+from app.connections import connections
+from app.executor import run_io, run_scan, get_scan_executor
+from app.fts import fts_search
+from app.fuzzy import MAX_DISTANCE, FuzzyIndex
+from app.ranking import Corrections, ranked_matches, top_matches
+from app.search_index import TrigramIndex
+from app.singleflight import SingleFlight
+from app.snapshots import load_snapshot
+from app.suggest import SuggestIndex
+from app.versions import VersionTracker, read_change_texts, read_changed_rowids, read_source, read_version
+
+# Only one reload per table and one scan per distinct query run at a time;
+# concurrent callers wait for that call and share its result
+flights = SingleFlight()
+
+# Every Dataset by table name, so ingestion can invalidate any of them
+DATASETS: Dict[str, "Dataset"] = {}
+
+_version_trackers: Dict[Path, VersionTracker] = {}
+
+def get_version_tracker(db_file: Path) -> VersionTracker:
+    tracker = _version_trackers.get(db_file)
+    if tracker is None:
+        tracker = _version_trackers[db_file] = VersionTracker(db_file, config.VERSION_CHECK_INTERVAL)
+    return tracker
+
+def invalidate_dataset(table: str):
+    """Drop this process's snapshot of a table so the next request reloads it"""
+    dataset = DATASETS.get(table)
+    if dataset is not None:
+        dataset.invalidate()
+
+def refresh_dataset_version(table: str):
+    """Have this process pick up a table's new version on the next request, patching rather than dropping its data"""
+    dataset = DATASETS.get(table)
+    if dataset is not None:
+        get_version_tracker(dataset.db_file).refresh()
+
+def db_token(db_file: Path) -> Optional[int]:
+    """Cheap fingerprint of the database file, to notice changes to databases without a versions table"""
+    try:
+        return db_file.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def read_table_with_rowids(db_file: Path, table: str) -> Tuple[List[int], ColumnarTable]:
+    """Read a whole table (blocking); returns the rowids and the rows, NULLs come back as None"""
+    with connections(db_file).read() as conn:
+        cursor = conn.execute(f'SELECT rowid, * FROM "{table}"')
+        names = [description[0] for description in cursor.description][1:]
+        records = cursor.fetchall()
+    rowids = [record[0] for record in records]
+    return rowids, ColumnarTable.from_records(names, [record[1:] for record in records])
+
+def read_versioned_table(db_file: Path, table: str) -> Tuple[Optional[int], ColumnarTable]:
+    """Read a whole table and the version it's at in one read transaction (blocking)"""
+    with connections(db_file).read() as conn:
+        conn.execute("BEGIN")
+        version = read_version(conn, table)
+        cursor = conn.execute(f'SELECT * FROM "{table}"')
+        names = [description[0] for description in cursor.description]
+        return version, ColumnarTable.from_records(names, cursor.fetchall())
+
+def read_versioned_value_counts(db_file: Path, table: str, columns: List[str]) -> Tuple[Optional[int], List[Tuple[str, Dict[object, int]]]]:
+    """Rows holding each value of some columns and the version they're at, in one read transaction (blocking)"""
+    with connections(db_file).read() as conn:
+        conn.execute("BEGIN")
+        version = read_version(conn, table)
+        table_columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        value_counts = []
+        for name in columns:
+            if name in table_columns:
+                cursor = conn.execute(f'SELECT "{name}", COUNT(*) FROM "{table}" WHERE "{name}" IS NOT NULL GROUP BY "{name}"')
+                value_counts.append((name, dict(cursor.fetchall())))
+        return version, value_counts
+
+def read_table(db_file: Path, table: str) -> ColumnarTable:
+    """Read a whole table column by column (blocking); NULLs come back as None"""
+    return read_table_with_rowids(db_file, table)[1]
+
+def read_rows_by_rowid(conn: sqlite3.Connection, table: str, rowids) -> Dict[int, dict]:
+    """Rows of a table by rowid; rowids that no longer exist are left out"""
+    cursor = conn.execute(f'SELECT rowid, * FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?))', (json.dumps(sorted(rowids)),))
+    names = [description[0] for description in cursor.description][1:]
+    return {record[0]: dict(zip(names, record[1:])) for record in cursor}
+
+# Change texts per (table, from version, to version); a given range never changes
+_change_texts: Dict[tuple, Optional[List[str]]] = {}
+
+def dataset_change_texts(table: str, from_version: int, to_version: int) -> Optional[List[str]]:
+    """Search texts of the rows a dataset's incremental uploads changed in a version range, None if unknown"""
+    key = (table, from_version, to_version)
+    if key not in _change_texts:
+        dataset = DATASETS.get(table)
+        if dataset is None or not dataset.db_file.exists():
+            return None
+        if len(_change_texts) >= 256:
+            _change_texts.clear()
+        with connections(dataset.db_file).read() as conn:
+            _change_texts[key] = read_change_texts(conn, table, from_version, to_version)
+    return _change_texts[key]
+
+def build_results(rows: List[dict], columns: List[str], query_words: List[str]) -> List[dict]:
+    """Shape matched rows for the JSON response, noting which columns matched
+
+    rows must be built for this search (as ColumnarTable.take does), they are cleaned in place.
+    """
+    results = []
+    for row in rows:
+        matches = {col: row[col] for col in columns if col in row and row[col] is not None and any(word in str(row[col]).lower() for word in query_words)}
+        for col, value in row.items():
+            if isinstance(value, float) and math.isnan(value):
+                row[col] = None
+        results.append({
+            "row_data": row,
+            "matched_columns": matches
+        })
+    return results
+
+# Rows per chunk of a streamed search, each chunk is built and encoded in one go off the event loop
+STREAM_CHUNK_SIZE = 50
+
+def scored_results(table: ColumnarTable, best: List[Tuple[int, float]], columns: List[str], query_words: List[str]) -> List[dict]:
+    """Results for ranked (row id, score) pairs"""
+    results = build_results(table.take([row_id for row_id, _ in best]), columns, query_words)
+    for result, (_, score) in zip(results, best):
+        result["score"] = round(score, 3)
+    return results
+
+def match_words(query_words: List[str], corrections: Optional[Corrections]) -> List[str]:
+    """The query words and their corrections, any of which marks a column as matched"""
+    return query_words + [correction for found in (corrections or {}).values() for correction, _ in found]
+
+def build_page(table: ColumnarTable, row_ids: Sequence[int], columns: List[str], query_words: List[str],
+               offset: int, limit: int, corrections: Optional[Corrections] = None) -> Tuple[List[dict], int]:
+    """Results offset to offset + limit of the matches ranked by relevance, and the number of matches"""
+    best = top_matches(table, row_ids, columns, query_words, offset + limit, corrections)[offset:]
+    return scored_results(table, best, columns, match_words(query_words, corrections)), len(row_ids)
+
+def next_results(ranked: Iterator[Tuple[int, float]], table: ColumnarTable, columns: List[str], query_words: List[str]) -> List[dict]:
+    """The next chunk of results of a streamed search (empty once it's done)"""
+    return scored_results(table, list(itertools.islice(ranked, STREAM_CHUNK_SIZE)), columns, query_words)
+
+# Per-process snapshots used when scans run in the process pool
+_WORKER_INDEXES: Dict[str, tuple] = {}
+
+def scan_in_worker(db_file: Path, table: str, columns: List[str], version: int, query_words: List[str]) -> Optional[List[int]]:
+    """Match row ids inside a scan worker process, or None if its snapshot isn't at the caller's version"""
+    cached = _WORKER_INDEXES.get(table)
+    if cached is None or cached[0] != version:
+        # Keyed on the dataset version: under WAL a commit doesn't touch the main file's mtime
+        read_at, rows = read_versioned_table(db_file, table)
+        _WORKER_INDEXES[table] = cached = (read_at, TrigramIndex(rows, columns))
+        if read_at != version:
+            return None
+    return cached[1].search_ids(query_words)
+
+class Dataset:
+    """In-memory snapshot of one SQLite table (stored column by column) and its search, suggest and fuzzy indexes"""
+
+    def __init__(self, db_file: Path, table: str, search_columns: List[str], label: str,
+                 suggest_columns: Optional[List[str]] = None):
+        self.db_file = db_file
+        self.table = table
+        self.search_columns = search_columns
+        self.suggest_columns = suggest_columns or []
+        self.label = label
+        self.rows: Optional[ColumnarTable] = None
+        self.index: Optional[TrigramIndex] = None
+        self.suggestions: Optional[SuggestIndex] = None
+        self.fuzzy: Optional[FuzzyIndex] = None
+        # (version or file fingerprint, index) built from the suggest columns alone, for FTS mode where the rows aren't loaded
+        self.key_suggestions: Optional[Tuple[object, SuggestIndex]] = None
+        self.timestamp = 0  # when the current snapshot was loaded
+        self.checked_at = 0  # when the database was last checked for changes
+        self.token = None
+        self.version: Optional[int] = None  # dataset_versions entry the snapshot was read at
+        self.rowids: List[int] = []  # SQLite rowid of each row, to apply incremental changes
+        # Bumped on invalidation so in-flight loads of the old data are discarded
+        self.generation = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.load_stats: Dict[str, object] = {}  # where the last load came from and how long it took
+        DATASETS[table] = self
+
+    def invalidate(self):
+        self.generation += 1
+        self.rows = None
+        self.index = None
+        self.suggestions = None
+        self.fuzzy = None
+        self.key_suggestions = None
+        self.timestamp = 0
+        self.checked_at = 0
+
+    def current_version(self) -> Optional[int]:
+        """Latest version of this dataset in the database (cheap, checked at most every VERSION_CHECK_INTERVAL)"""
+        return get_version_tracker(self.db_file).get(self.table)
+
+    def _load_snapshot(self):
+        start = time.perf_counter()
+        token = db_token(self.db_file)
+        # Read the version before the rows: a concurrent bump then only costs an extra reload
+        with connections(self.db_file).read() as conn:
+            version = read_version(conn, self.table)
+            source = read_source(conn, self.table)
+        # Prefer the compiled snapshot written at ingestion, it comes with its index prebuilt
+        snapshot = load_snapshot(self.db_file, self.table, version, source, self.search_columns)
+        if snapshot is not None:
+            rows, index, rowids = snapshot
+            source = "snapshot"
+        else:
+            rowids, rows = read_table_with_rowids(self.db_file, self.table)
+            index = TrigramIndex(rows, self.search_columns)
+            source = "sqlite"
+        suggestions = SuggestIndex.build(rows, self.suggest_columns)
+        fuzzy = self._fuzzy_index(index)
+        load_stats = {"source": source, "load_ms": round((time.perf_counter() - start) * 1000, 1),
+                      "memory_kb": rows.memory_bytes() // 1024, "suggestions": len(suggestions),
+                      "fuzzy_words": len(fuzzy) if fuzzy is not None else 0}
+        return rows, index, suggestions, fuzzy, rowids, token, version, load_stats
+
+    def _fuzzy_index(self, index: TrigramIndex, previous: Optional[FuzzyIndex] = None) -> Optional[FuzzyIndex]:
+        """Fuzzy index over the search texts, None when FUZZY_MAX_DISTANCE turns fuzzy search off"""
+        distance = min(config.FUZZY_MAX_DISTANCE, MAX_DISTANCE)
+        if distance <= 0:
+            return None
+        return FuzzyIndex.build(index.texts, distance, previous)
+
+    def _read_changes(self, from_version: int):
+        """Rows changed since from_version (blocking): (version, token, {rowid: row or None if deleted}),
+        or None when the change log can't cover it and the table has to be reloaded"""
+        token = db_token(self.db_file)
+        with connections(self.db_file).read() as conn:
+            # One read transaction, so the rows match the version
+            conn.execute("BEGIN")
+            version = read_version(conn, self.table)
+            rowids = read_changed_rowids(conn, self.table, from_version, version)
+            # Past half the table a reload is cheaper than patching
+            if rowids is None or len(rowids) > len(self.rowids) // 2:
+                return None
+            rows = read_rows_by_rowid(conn, self.table, rowids)
+        return version, token, {rowid: rows.get(rowid) for rowid in rowids}
+
+    def _patched_snapshot(self, changes: Dict[int, Optional[dict]]):
+        positions = {rowid: position for position, rowid in enumerate(self.rowids)}
+        updates, appended, rowids = {}, [], list(self.rowids)
+        # Rowids only grow, so new rows go at the end in the order a fresh read would return them
+        for rowid in sorted(changes):
+            if rowid in positions:
+                updates[positions[rowid]] = changes[rowid]
+            elif changes[rowid] is not None:
+                appended.append(changes[rowid])
+                rowids.append(rowid)
+        index = self.index.patch(updates, appended)
+        return index, SuggestIndex.build(index.rows, self.suggest_columns), self._fuzzy_index(index, self.fuzzy), rowids
+
+    async def _patch(self) -> bool:
+        """Apply incremental uploads to the loaded snapshot; False if the table has to be reloaded instead"""
+        generation, from_version = self.generation, self.version
+        if self.rows is None or from_version is None:
+            return False
+        try:
+            changes = await run_io(self._read_changes, from_version)
+            if changes is None:
+                return False
+            version, token, changed_rows = changes
+            index, suggestions, fuzzy, rowids = await run_io(self._patched_snapshot, changed_rows)
+        except Exception as e:
+            print(f"[{self.label}] Warning: Failed to apply changes, reloading: {e}")
+            return False
+        if generation != self.generation or from_version != self.version:
+            # Reloaded or invalidated meanwhile
+            return True
+        print(f"[{self.label}] Applied {len(changed_rows)} changed rows (version {from_version} -> {version}) at {datetime.now()}")
+        self.rows, self.index, self.suggestions, self.fuzzy = index.rows, index, suggestions, fuzzy
+        self.rowids, self.token, self.version = rowids, token, version
+        self.checked_at = datetime.now().timestamp()
+        return True
+
+    def _behind(self, version: Optional[int]) -> bool:
+        # Versions only grow; the tracker may briefly lag behind a snapshot that was just loaded
+        return version is not None and (self.version is None or version > self.version)
+
+    def _unchanged(self) -> bool:
+        version = self.current_version()
+        if version is None:
+            # No versions table in this database, fall back to the file fingerprint
+            return db_token(self.db_file) == self.token
+        return not self._behind(version)
+
+    async def load(self) -> ColumnarTable:
+        """Return the current rows; stale snapshots keep being served while a refresh runs"""
+        if self.rows is not None and self._behind(self.current_version()):
+            # New data was ingested (possibly by another worker), don't serve the old
+            # snapshot: patch in incremental uploads, reload after anything else
+            if not await flights.do(f"patch:{self.table}:{self.generation}", self._patch):
+                self.invalidate()
+        if self.rows is None:
+            return await flights.do(f"load:{self.table}:{self.generation}", self._reload)
+        if datetime.now().timestamp() - self.checked_at >= config.DATA_REFRESH_INTERVAL:
+            self._schedule_refresh()
+        return self.rows
+
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(
+                flights.do(f"load:{self.table}:{self.generation}", self._refresh)
+            )
+
+    async def _refresh(self) -> ColumnarTable:
+        # Skip the reload entirely when the database hasn't changed since the last load
+        if self.rows is not None and self._unchanged():
+            self.checked_at = datetime.now().timestamp()
+            return self.rows
+        return await self._reload()
+
+    async def _reload(self) -> ColumnarTable:
+        now = datetime.now().timestamp()
+        generation = self.generation
+        try:
+            if self.db_file.exists():
+                rows, index, suggestions, fuzzy, rowids, token, version, load_stats = await run_io(self._load_snapshot)
+                if generation != self.generation:
+                    # Invalidated while loading, this data may predate the change
+                    return rows
+                print(f"[{self.label}] Data loaded from {load_stats['source']} in {load_stats['load_ms']}ms at {datetime.now()}")
+                # Swap the whole snapshot at once so searches never mix old and new
+                self.rows, self.index, self.suggestions, self.fuzzy = rows, index, suggestions, fuzzy
+                self.rowids, self.token, self.version = rowids, token, version
+                self.load_stats = load_stats
+                self.timestamp = self.checked_at = now
+                return rows
+            else:
+                print(f"[{self.label}] Warning: Database file not found at {self.db_file}")
+                return []
+        except Exception as e:
+            print(f"[{self.label}] Warning: Failed to load data: {e}")
+            return []
+
+    async def _corrections(self, query_words: List[str], fuzzy: bool) -> Corrections:
+        """Corrections of the query words for a fuzzy search (empty for an exact one)"""
+        if not fuzzy:
+            return {}
+        await self.load()
+        if self.fuzzy is None:
+            return {}
+        return await run_io(self.fuzzy.expand, query_words)
+
+    async def _match_rows(self, query_words: List[str], corrections: Optional[Corrections] = None) -> Tuple[ColumnarTable, Sequence[int]]:
+        """The matched rows as a table and the ids of the matches in it"""
+        if corrections:
+            # Rows with each query word or one of its corrections, always matched in memory
+            data = await self.load()
+            if not data:
+                return ColumnarTable([], [], 0), []
+            index = self.index
+            groups = [[word] + [correction for correction, _ in corrections.get(word, ())] for word in query_words]
+            return index.rows, await run_io(index.search_any_ids, groups)
+
+        # Push the query down to SQLite when the FTS engine is enabled
+        if config.SEARCH_ENGINE == "fts":
+            rows = await run_io(fts_search, self.db_file, self.table, query_words)
+            if rows is not None:
+                return rows, range(len(rows))
+
+        data = await self.load()
+        if not data:
+            return ColumnarTable([], [], 0), []
+        index, version = self.index, self.version
+        # Scan workers read the table fresh, their row ids don't line up with a patched index;
+        # without a versions table they can't tell which data they read
+        if get_scan_executor() is not None and not index.patched and version is not None:
+            row_ids = await run_scan(scan_in_worker, self.db_file, self.table, self.search_columns, version, query_words)
+            if row_ids is not None:
+                return index.rows, row_ids
+        # Only rows sharing the query's trigrams are checked
+        return index.rows, await run_io(index.search_ids, query_words)
+
+    async def _search(self, query_words: List[str], offset: int, limit: int, fuzzy: bool) -> Tuple[List[dict], int]:
+        corrections = await self._corrections(query_words, fuzzy)
+        rows, row_ids = await self._match_rows(query_words, corrections)
+        return await run_io(build_page, rows, row_ids, self.search_columns, query_words, offset, limit, corrections)
+
+    async def search(self, query_words: List[str], offset: int = 0, limit: Optional[int] = None,
+                     fuzzy: bool = False) -> Tuple[List[dict], int]:
+        """One page of search results ranked by relevance and the total number of matches, computed off the event loop;
+        a fuzzy search also matches words a typo or two away from the query words"""
+        limit = config.SEARCH_PAGE_SIZE if limit is None else limit
+        mode = "fuzzy" if fuzzy else "exact"
+        key = f"search:{self.table}:{self.generation}:{mode}:{offset}:{limit}:{' '.join(query_words)}"
+        return await flights.do(key, lambda: self._search(query_words, offset, limit, fuzzy))
+
+    async def stream(self, query_words: List[str], offset: int, limit: int,
+                     fuzzy: bool = False) -> Tuple[int, AsyncIterator[List[dict]]]:
+        """Total number of matches and an iterator over chunks of the results offset to offset + limit,
+        in the same order as search(); each chunk is ranked and built off the event loop as it's read"""
+        corrections = await self._corrections(query_words, fuzzy)
+        rows, row_ids = await self._match_rows(query_words, corrections)
+        ranked = itertools.islice(ranked_matches(rows, row_ids, self.search_columns, query_words, corrections), offset, offset + limit)
+        words = match_words(query_words, corrections)
+
+        async def chunks():
+            while True:
+                results = await run_io(next_results, ranked, rows, self.search_columns, words)
+                if not results:
+                    return
+                yield results
+
+        return len(row_ids), chunks()
+
+    async def _load_key_suggestions(self, stamp) -> Optional[SuggestIndex]:
+        generation = self.generation
+        try:
+            version, value_counts = await run_io(read_versioned_value_counts, self.db_file, self.table, self.suggest_columns)
+        except Exception as e:
+            print(f"[{self.label}] Warning: Failed to read suggestions: {e}")
+            return None
+        suggestions = SuggestIndex(value_counts)
+        if generation == self.generation:
+            self.key_suggestions = (version if version is not None else stamp, suggestions)
+        return suggestions
+
+    async def _suggestions(self) -> Optional[SuggestIndex]:
+        if config.SEARCH_ENGINE == "fts" and self.rows is None:
+            # FTS searches don't load the rows, so build just the key index from the suggest columns.
+            # Without a versions table, the file fingerprint tells whether it's still current
+            stamp = self.current_version()
+            if stamp is None:
+                stamp = db_token(self.db_file)
+            if self.key_suggestions is not None and self.key_suggestions[0] == stamp:
+                return self.key_suggestions[1]
+            return await flights.do(f"suggest:{self.table}:{self.generation}:{stamp}", lambda: self._load_key_suggestions(stamp))
+        await self.load()
+        return self.suggestions
+
+    async def suggest(self, prefix: str, limit: int) -> List[dict]:
+        """Values of the suggest columns starting with prefix (or with a later word starting with it)"""
+        suggestions = await self._suggestions()
+        if suggestions is None:
+            return []
+        # A couple of bisections, no need to leave the event loop
+        return suggestions.lookup(prefix, limit)
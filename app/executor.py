@@ -0,0 +1,50 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from typing import Optional
+
+from app.config import config
+
+# Blocking work (SQLite reads, Excel parsing, index builds and scans) must never run
+# on the event loop, otherwise one slow request stalls every other request in
+# the worker. SQLite I/O goes to a thread pool; scans can optionally go to a
+# process pool so they don't compete for the GIL.
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_scan_executor: Optional[ProcessPoolExecutor] = None
+
+def get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=max(1, config.IO_THREADS), thread_name_prefix="sqlite-io")
+    return _io_executor
+
+def get_scan_executor() -> Optional[ProcessPoolExecutor]:
+    """Process pool for scans, or None when SCAN_PROCESSES is 0"""
+    global _scan_executor
+    if _scan_executor is None and config.SCAN_PROCESSES > 0:
+        _scan_executor = ProcessPoolExecutor(max_workers=config.SCAN_PROCESSES)
+    return _scan_executor
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking I/O call on the thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), partial(func, *args, **kwargs))
+
+async def run_scan(func, *args, **kwargs):
+    """Run a CPU-bound call on the process pool (or the thread pool if disabled)"""
+    executor = get_scan_executor()
+    if executor is None:
+        return await run_io(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+def shutdown_executors():
+    """Stop the pools on application shutdown"""
+    global _io_executor, _scan_executor
+    if _scan_executor is not None:
+        _scan_executor.shutdown(wait=False, cancel_futures=True)
+        _scan_executor = None
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=False, cancel_futures=True)
+        _io_executor = None
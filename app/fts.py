@@ -0,0 +1,66 @@
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+from app.columnar import ColumnarTable
+from app.connections import connections
+from app.search_columns import TABLE_SEARCH_COLUMNS
+from app.search_index import row_search_text, TRIGRAM_SIZE
+
+def fts_table_name(table: str) -> str:
+    return f"{table}_fts"
+
+def build_fts_table(conn: sqlite3.Connection, table: str, source_table: Optional[str] = None):
+    """(Re)build the FTS5 trigram table holding each row's search text
+
+    source_table reads the rows of a differently named copy of table (e.g. a
+    staging table), building the FTS table that goes with that copy.
+    """
+    columns = TABLE_SEARCH_COLUMNS.get(table)
+    if columns is None:
+        raise ValueError(f"No search columns configured for table: {table}")
+
+    source_table = source_table or table
+    fts_table = fts_table_name(source_table)
+    conn.execute(f'DROP TABLE IF EXISTS "{fts_table}"')
+    # The trigram tokenizer lets MATCH answer arbitrary substring queries
+    conn.execute(f'CREATE VIRTUAL TABLE "{fts_table}" USING fts5(search_text, tokenize="trigram")')
+
+    cursor = conn.execute(f'SELECT rowid, * FROM "{source_table}"')
+    names = [d[0] for d in cursor.description]
+    rows = ((values[0], row_search_text(dict(zip(names, values)), columns)) for values in cursor)
+    conn.executemany(f'INSERT INTO "{fts_table}" (rowid, search_text) VALUES (?, ?)', rows)
+
+def fts_search(db_file: Path, table: str, query_words: List[str]) -> Optional[ColumnarTable]:
+    """Rows whose search text contains every word, or None if FTS is unavailable"""
+    if not query_words:
+        return ColumnarTable([], [], 0)
+    if not db_file.exists():
+        return None
+    fts_table = fts_table_name(table)
+
+    conditions = []
+    params = []
+    # Words of at least one trigram are narrowed down by the FTS index
+    phrases = ['"' + word.replace('"', '""') + '"' for word in query_words if len(word) >= TRIGRAM_SIZE]
+    if phrases:
+        conditions.append(f'"{fts_table}" MATCH ?')
+        params.append(' AND '.join(phrases))
+    # Verify every word with an exact substring check on the stored text
+    for word in query_words:
+        conditions.append("instr(f.search_text, ?) > 0")
+        params.append(word)
+
+    sql = (
+        f'SELECT t.* FROM "{table}" t JOIN "{fts_table}" f ON f.rowid = t.rowid '
+        f'WHERE {" AND ".join(conditions)} ORDER BY t.rowid'
+    )
+    try:
+        with connections(db_file).read() as conn:
+            cursor = conn.execute(sql, params)
+            names = [description[0] for description in cursor.description]
+            # Only the page the ranking picks is built as dicts
+            return ColumnarTable.from_records(names, cursor.fetchall())
+    except sqlite3.OperationalError as e:
+        print(f"[FTS] Warning: FTS search on {table} failed, falling back to in-memory search: {e}")
+        return None
@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# Typo-tolerant search terms, SymSpell style. Every distinct word of a
+# dataset's search texts is filed under each string left after deleting up
+# to FUZZY_MAX_DISTANCE of its characters ("nestle" under "nstle", "nesle",
+# "netle"...). Two words within that many edits share such a deletion, so a
+# lookup only generates the deletions of the query word, collects the words
+# filed under them and verifies each with a bounded edit distance: no scan
+# of the rows or of the vocabulary. Built with the dataset like the suggest
+# index; an incremental patch keeps it unless the vocabulary changed.
+
+# Vocabulary words start with a letter: ids and codes aren't spelled, a typo there is another id
+_WORD = re.compile(r"[^\W\d_]\w*")
+
+# Shortest vocabulary word; shorter query words aren't corrected either
+MIN_WORD_LENGTH = 3
+
+# Most edits the index is built for: the deletions per word grow combinatorially past that
+MAX_DISTANCE = 2
+
+# Most corrections kept per query word, closest first
+MAX_CORRECTIONS = 25
+
+def max_distance(word: str, limit: int) -> int:
+    """Edits allowed for a query word: none below 4 characters, 1 up to 6, then 2 (at most limit)"""
+    return min(limit, max(0, (len(word) - 1) // 3))
+
+def deletions(word: str, distance: int) -> Set[str]:
+    """The word and every string left after deleting up to distance of its characters"""
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {text[:i] + text[i + 1:] for text in frontier for i in range(len(text))}
+        found |= frontier
+    return found
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein distance (optimal string alignment), or limit + 1 once it's past limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            # Swapped neighbouring letters count as one edit
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+def vocabulary(texts: List[Optional[str]]) -> List[str]:
+    """Distinct words of the search texts long enough to be corrected to, sorted"""
+    words = set()
+    for text in texts:
+        if text:
+            words.update(_WORD.findall(text))
+    return sorted(word for word in words if len(word) >= MIN_WORD_LENGTH)
+
+class FuzzyIndex:
+    """Deletion dictionary over the words of a dataset's search texts"""
+
+    def __init__(self, words: List[str], distance: int):
+        self.words = words
+        self.distance = distance
+        # deletion -> ids of the words it was made from
+        self.deletes: Dict[str, List[int]] = {}
+        for word_id, word in enumerate(words):
+            for deleted in deletions(word, distance):
+                ids = self.deletes.get(deleted)
+                if ids is None:
+                    self.deletes[deleted] = [word_id]
+                else:
+                    ids.append(word_id)
+
+    @classmethod
+    def build(cls, texts: List[Optional[str]], distance: int, previous: Optional["FuzzyIndex"] = None) -> "FuzzyIndex":
+        """Index of the words of texts; previous is reused when the vocabulary hasn't changed (most patches)"""
+        words = vocabulary(texts)
+        if previous is not None and previous.distance == distance and previous.words == words:
+            return previous
+        return cls(words, distance)
+
+    def __len__(self):
+        return len(self.words)
+
+    def corrections(self, word: str) -> List[Tuple[str, int]]:
+        """Vocabulary words within a few edits of word (not word itself) as (word, distance), closest first"""
+        distance = max_distance(word, self.distance)
+        if distance == 0 or not _WORD.fullmatch(word):
+            return []
+        candidates = set()
+        for deleted in deletions(word, distance):
+            candidates.update(self.deletes.get(deleted, ()))
+        found = []
+        for word_id in candidates:
+            candidate = self.words[word_id]
+            if candidate != word:
+                edits = edit_distance(word, candidate, distance)
+                if edits <= distance:
+                    found.append((edits, candidate))
+        found.sort()
+        return [(candidate, edits) for edits, candidate in found[:MAX_CORRECTIONS]]
+
+    def expand(self, words: List[str]) -> Dict[str, List[Tuple[str, int]]]:
+        """Corrections of each query word that has any"""
+        expanded = {}
+        for word in words:
+            found = self.corrections(word)
+            if found:
+                expanded[word] = found
+        return expanded
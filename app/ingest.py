@@ -0,0 +1,376 @@
+import hashlib
+import itertools
+import json
+import re
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.connections import connections
+from app.fts import build_fts_table, fts_table_name
+from app.search_columns import TABLE_SEARCH_COLUMNS
+from app.search_index import row_search_text
+from app.snapshots import write_snapshot
+from app.versions import bump_version, read_content_hash, read_version, record_changes, record_content_hash
+
+# Excel ingestion in a single pass: the upload is spooled to a temp file, rows
+# are streamed with openpyxl's read-only reader and inserted in batches, so
+# memory stays bounded whatever the workbook size. The header is validated
+# from the first row and the row count comes from the same pass. Rows go to a
+# staging table that is swapped in with a rename once it is complete.
+#
+# Incremental uploads instead diff the workbook against the table on each
+# row's natural key and only write the rows that were added, changed or
+# removed, logging them so workers patch their copy (see app/versions.py).
+
+BATCH_SIZE = 1000
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Called with each stage name ("parse", "validate", "write", "index") as ingestion enters it.
+# Rows are parsed while they are written, so "parse" only covers opening the workbook
+Progress = Optional[Callable[[str], None]]
+
+class IngestionError(ValueError):
+    """The workbook can't be ingested (unreadable, missing columns or no rows)"""
+
+def spool_upload(source: BinaryIO, suffix: str = ".xlsx") -> Tuple[Path, str]:
+    """Copy an uploaded file object to a temp file in chunks (blocking); returns its path and
+    SHA-256, the caller deletes it"""
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        for chunk in iter(lambda: source.read(SPOOL_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            tmp.write(chunk)
+    return Path(tmp.name), digest.hexdigest()
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(SPOOL_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_unchanged(db_file: Path, table: str, content_hash: str) -> bool:
+    """Whether a table was last ingested from a file with this hash (blocking)"""
+    if not Path(db_file).exists():
+        return False
+    with connections(db_file).read() as conn:
+        return _table_exists(conn, table) and read_content_hash(conn, table) == content_hash
+
+# Helper to store cell values the way pandas' to_sql used to
+def _cell_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return value
+
+def _column_names(header: tuple) -> List[str]:
+    names = [None if value is None else str(value) for value in header]
+    # Read-only sheets can report empty trailing cells
+    while names and names[-1] is None:
+        names.pop()
+    return [f"Unnamed: {i}" if name is None else name for i, name in enumerate(names)]
+
+@contextmanager
+def open_excel_rows(path: Path):
+    """Stream the first sheet of a workbook; yields (column names, iterator of row tuples)"""
+    # openpyxl is only needed for ingestion, keep it out of app startup
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        raise IngestionError(f"Error reading Excel file: {str(e)}")
+    try:
+        sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = _column_names(next(sheet_rows, ()))
+        width = len(columns)
+
+        def rows() -> Iterator[tuple]:
+            for values in sheet_rows:
+                values = tuple(values[:width]) + (None,) * (width - len(values))
+                # Skip blank rows
+                if any(value is not None for value in values):
+                    yield tuple(_cell_value(value) for value in values)
+
+        yield columns, rows()
+    finally:
+        workbook.close()
+
+def read_workbook(path: Path) -> Tuple[List[str], List[tuple]]:
+    """Column names and all rows of a workbook's first sheet (blocking), for loaders that need them at once"""
+    with open_excel_rows(path) as (columns, rows):
+        return columns, list(rows)
+
+def infer_column_types(columns: List[str], rows: List[tuple]) -> List[str]:
+    """Declared SQLite type per column, the same ones pandas' to_sql picks (so integers with gaps are REAL)"""
+    types = []
+    for i in range(len(columns)):
+        kinds = set()
+        has_nulls = False
+        for row in rows:
+            if row[i] is None:
+                has_nulls = True
+            else:
+                kinds.add(type(row[i]))
+        if kinds <= {int, bool} and kinds and not has_nulls:
+            types.append("INTEGER")
+        elif kinds <= {int, float, bool}:
+            types.append("REAL")
+        else:
+            types.append("TEXT")
+    return types
+
+def staging_table_name(table: str) -> str:
+    return f"{table}__staging"
+
+def retired_table_name(table: str) -> str:
+    return f"{table}__retired"
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def _drop_tables(conn: sqlite3.Connection, *tables: str):
+    for table in tables:
+        conn.execute(f'DROP TABLE IF EXISTS "{fts_table_name(table)}"')
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+def _shadow_index_name(name: str) -> str:
+    # Index names are unique per database, so the copy built on the staging
+    # table toggles between two names, e.g. idx_x on one upload and
+    # idx_x__shadow on the next
+    return name[:-len("__shadow")] if name.endswith("__shadow") else f"{name}__shadow"
+
+INDEX_SQL = re.compile(r'CREATE\s+(UNIQUE\s+)?INDEX\s+.+?\s+ON\s+(?:"[^"]+"|\S+?)\s*(\(.*)$', re.IGNORECASE | re.DOTALL)
+
+def _copy_indexes(conn: sqlite3.Connection, table: str, staging_table: str):
+    """Create the live table's indexes on the staging table"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    ).fetchall()
+    for name, sql in indexes:
+        match = INDEX_SQL.match(sql)
+        if match is None:
+            print(f"  ⚠️  Could not copy index {name}: {sql}")
+            continue
+        conn.execute(f'CREATE {match.group(1) or ""}INDEX "{_shadow_index_name(name)}" ON "{staging_table}" {match.group(2)}')
+
+def insert_rows(conn: sqlite3.Connection, table: str, columns: List[str], rows: Iterator[tuple]) -> int:
+    """Insert streamed rows in batches into table (an SQL name, quoted as needed); returns the row count"""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    insert_sql = f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})'
+    row_count = 0
+    while True:
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        conn.executemany(insert_sql, batch)
+        row_count += len(batch)
+    return row_count
+
+def ingest_excel(db_file: Path, path: Path, table: str, required_columns: list, progress: Progress = None,
+                 content_hash: Optional[str] = None) -> int:
+    """Replace a table's rows with a workbook's (blocking); returns the row count
+
+    Rows are loaded into a staging table with its own indexes and FTS table,
+    which then replaces the live table in one short transaction, so searches
+    never wait for the upload or see it half written. content_hash (of the
+    workbook) is recorded with the swap.
+    """
+    staging_table = staging_table_name(table)
+    retired_table = retired_table_name(table)
+    report = progress or (lambda stage: None)
+
+    report("parse")
+    with open_excel_rows(path) as (columns, rows):
+        report("validate")
+        missing_columns = [str(col) for col in required_columns if str(col) not in columns]
+        if missing_columns:
+            raise IngestionError(f"Missing required columns: {missing_columns}. Found columns: {columns}")
+
+        column_list = ", ".join(f'"{column}"' for column in columns)
+
+        # The process's single writer connection, so uploads to different tables queue up here
+        with connections(db_file).write() as conn:
+            try:
+                with conn:
+                    # Leftovers of an interrupted upload
+                    _drop_tables(conn, staging_table, retired_table)
+                    report("write")
+                    if _table_exists(conn, table):
+                        # Same columns and types as the live table
+                        conn.execute(f'CREATE TABLE "{staging_table}" AS SELECT * FROM "{table}" WHERE 0')
+                    else:
+                        conn.execute(f'CREATE TABLE "{staging_table}" ({column_list})')
+
+                    row_count = insert_rows(conn, f'"{staging_table}"', columns, rows)
+                    if row_count == 0:
+                        raise IngestionError("Excel file is empty")
+
+                    report("index")
+                    _copy_indexes(conn, table, staging_table)
+                    # FTS5 search table for the new rows, renamed along with them
+                    build_fts_table(conn, table, source_table=staging_table)
+            except BaseException:
+                # The live table is untouched, just don't leave the staging copy behind
+                with conn:
+                    _drop_tables(conn, staging_table)
+                raise
+
+            # The swap: a few renames, so the write lock is only held briefly
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if _table_exists(conn, table):
+                    conn.execute(f'ALTER TABLE "{table}" RENAME TO "{retired_table}"')
+                    if _table_exists(conn, fts_table_name(table)):
+                        conn.execute(f'ALTER TABLE "{fts_table_name(table)}" RENAME TO "{fts_table_name(retired_table)}"')
+                conn.execute(f'ALTER TABLE "{staging_table}" RENAME TO "{table}"')
+                conn.execute(f'ALTER TABLE "{fts_table_name(staging_table)}" RENAME TO "{fts_table_name(table)}"')
+                # Bump the dataset version so every worker drops its cached copy
+                bump_version(conn, table)
+                if content_hash is not None:
+                    record_content_hash(conn, table, content_hash)
+
+            with conn:
+                _drop_tables(conn, retired_table)
+
+            # Compile the snapshot workers memory-map on their next load, reading
+            # the version and the rows in one transaction so they always match
+            try:
+                with conn:
+                    conn.execute("BEGIN")
+                    write_snapshot(conn, db_file, table, read_version(conn, table))
+            except Exception as e:
+                # The upload itself is committed; workers fall back to reading SQLite
+                print(f"  ⚠️  Could not write snapshot for {table}: {e}")
+
+    print(f"✓ Updated {table} table with {row_count} rows")
+    return row_count
+
+# Helper to compare columns of two aliased tables, NULLs included
+def _same_values(left: str, right: str, columns: List[str]) -> str:
+    return " AND ".join(f'{left}."{column}" IS {right}."{column}"' for column in columns)
+
+def _search_texts(conn: sqlite3.Connection, table: str, rowids: Iterable[int]) -> Dict[int, str]:
+    """Search text of each of the given rows, by rowid"""
+    cursor = conn.execute(f'SELECT rowid, * FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?))', (json.dumps(list(rowids)),))
+    names = [description[0] for description in cursor.description][1:]
+    return {record[0]: row_search_text(dict(zip(names, record[1:])), TABLE_SEARCH_COLUMNS[table]) for record in cursor}
+
+def ingest_excel_incremental(db_file: Path, path: Path, table: str, required_columns: list, key_columns: List[str],
+                             progress: Progress = None, content_hash: Optional[str] = None) -> Dict[str, int]:
+    """Apply a workbook to a table as inserts, updates and deletes (blocking); returns the count of each
+
+    Rows are matched on their natural key (key_columns); rows sharing a key
+    are paired up in order. Only the changed rows are written and re-indexed,
+    and the version's change log lets workers patch their data and keep the
+    cached results the changes don't touch. content_hash is recorded with them.
+    """
+    report = progress or (lambda stage: None)
+
+    report("parse")
+    with open_excel_rows(path) as (columns, rows):
+        report("validate")
+        missing_columns = [str(col) for col in list(required_columns) + list(key_columns) if str(col) not in columns]
+        if missing_columns:
+            raise IngestionError(f"Missing required columns: {missing_columns}. Found columns: {columns}")
+
+        # The process's single writer connection, so uploads to different tables queue up here
+        with connections(db_file).write() as conn:
+            if not _table_exists(conn, table):
+                raise IngestionError(f"The {table} table doesn't exist yet, upload the full file first")
+            table_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+            unknown_columns = [column for column in columns if column not in table_columns]
+            if unknown_columns:
+                raise IngestionError(f"Columns not in the {table} table: {unknown_columns}. Upload the full file to change columns")
+
+            report("write")
+            # Parse into a temp table first: it takes the live table's column
+            # types, so values compare the way they are stored, and filling it
+            # doesn't hold the database's write lock
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS temp.incoming")
+                conn.execute(f'CREATE TEMP TABLE incoming AS SELECT * FROM main."{table}" WHERE 0')
+                row_count = insert_rows(conn, "temp.incoming", columns, rows)
+            if row_count == 0:
+                raise IngestionError("Excel file is empty")
+
+            keys = ", ".join(f'"{column}"' for column in key_columns)
+            column_list = ", ".join(f'"{column}"' for column in columns)
+
+            with conn:
+                # Hold the write lock from the diff to the commit, so it's applied to the rows it was computed on
+                conn.execute("BEGIN IMMEDIATE")
+                # Pair rows on (key, n-th occurrence of the key)
+                for name, source in (("live_keys", f'main."{table}"'), ("incoming_keys", "temp.incoming")):
+                    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+                    conn.execute(
+                        f"CREATE TEMP TABLE {name} AS SELECT rowid AS id, {keys}, "
+                        f"ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY rowid) AS seq FROM {source}"
+                    )
+                conn.execute(f"CREATE INDEX temp.incoming_keys_key ON incoming_keys ({keys}, seq)")
+                conn.execute("DROP TABLE IF EXISTS temp.pairs")
+                conn.execute(
+                    "CREATE TEMP TABLE pairs AS SELECT l.id AS live_id, i.id AS incoming_id "
+                    f"FROM temp.live_keys l JOIN temp.incoming_keys i ON {_same_values('l', 'i', key_columns)} AND l.seq = i.seq"
+                )
+                deleted = [rowid for rowid, in conn.execute("SELECT id FROM temp.live_keys WHERE id NOT IN (SELECT live_id FROM temp.pairs)")]
+                inserted = [rowid for rowid, in conn.execute("SELECT id FROM temp.incoming_keys WHERE id NOT IN (SELECT incoming_id FROM temp.pairs)")]
+                updated = conn.execute(
+                    f'SELECT p.live_id, p.incoming_id FROM temp.pairs p JOIN main."{table}" l ON l.rowid = p.live_id '
+                    f"JOIN temp.incoming i ON i.rowid = p.incoming_id WHERE NOT ({_same_values('l', 'i', columns)})"
+                ).fetchall()
+                paired = conn.execute("SELECT COUNT(*) FROM temp.pairs").fetchone()[0]
+                counts = {"inserted": len(inserted), "updated": len(updated), "deleted": len(deleted),
+                          "unchanged": paired - len(updated)}
+
+                if inserted or updated or deleted:
+                    old_texts = _search_texts(conn, table, [live_id for live_id, _ in updated] + deleted)
+                    # Insert first: new rows then get rowids past every existing one
+                    max_rowid = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+                    conn.execute(
+                        f'INSERT INTO "{table}" ({column_list}) SELECT {column_list} FROM temp.incoming '
+                        "WHERE rowid IN (SELECT value FROM json_each(?)) ORDER BY rowid",
+                        (json.dumps(inserted),)
+                    )
+                    conn.executemany(
+                        f'UPDATE "{table}" SET ({column_list}) = (SELECT {column_list} FROM temp.incoming WHERE rowid = ?) WHERE rowid = ?',
+                        [(incoming_id, live_id) for live_id, incoming_id in updated]
+                    )
+                    conn.execute(f'DELETE FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?))', (json.dumps(deleted),))
+                    new_rowids = [rowid for rowid, in conn.execute(f'SELECT rowid FROM "{table}" WHERE rowid > ?', (max_rowid,))]
+                    new_texts = _search_texts(conn, table, [live_id for live_id, _ in updated] + new_rowids)
+
+                    report("index")
+                    fts_table = fts_table_name(table)
+                    if _table_exists(conn, fts_table):
+                        conn.execute(f'DELETE FROM "{fts_table}" WHERE rowid IN (SELECT value FROM json_each(?))', (json.dumps(list(old_texts)),))
+                        conn.executemany(f'INSERT INTO "{fts_table}" (rowid, search_text) VALUES (?, ?)', new_texts.items())
+
+                    version = bump_version(conn, table)
+                    record_changes(conn, table, version, [
+                        (rowid, old_texts.get(rowid), new_texts.get(rowid)) for rowid in sorted(old_texts.keys() | new_texts.keys())
+                    ])
+                if content_hash is not None:
+                    record_content_hash(conn, table, content_hash)
+                for name in ("pairs", "live_keys", "incoming_keys", "incoming"):
+                    conn.execute(f"DROP TABLE temp.{name}")
+
+            if inserted or updated or deleted:
+                # The snapshot is still compiled whole, for cold starts
+                try:
+                    with conn:
+                        conn.execute("BEGIN")
+                        write_snapshot(conn, db_file, table, read_version(conn, table))
+                except Exception as e:
+                    print(f"  ⚠️  Could not write snapshot for {table}: {e}")
+
+    print(f"✓ Applied {row_count} rows to {table} table: {counts['inserted']} inserted, {counts['updated']} updated, "
+          f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+    return counts
+
@@ -0,0 +1,158 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Background queue for admin uploads. The upload request only spools the file
+# and submits a job; a per-dataset worker task then runs it through its
+# stages (parse, validate, write, index, invalidate) while the admin UI polls
+# the job's status. One job per dataset runs at a time, and a newer upload
+# replaces one still waiting, which is marked superseded.
+#
+# Jobs only live in the memory of the process that accepted the upload, so
+# polling their status needs a single worker process (see README, Admin).
+
+STAGES = ["parse", "validate", "write", "index", "invalidate"]
+
+# Finished jobs kept for status polling
+MAX_FINISHED_JOBS = 100
+
+class IngestionJob:
+    """One upload waiting for or going through ingestion"""
+
+    def __init__(self, dataset: str, details: dict, work: Callable[["IngestionJob"], Awaitable[dict]],
+                 cleanup: Optional[Callable[[], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.dataset = dataset
+        self.details = details  # e.g. file type, mode and filename, echoed in the status
+        self.work = work
+        self.cleanup = cleanup
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.stage_started = 0.0
+        self.stage_ms: Dict[str, float] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.superseded_by: Optional[str] = None
+        self.submitted_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+
+    def enter_stage(self, stage: Optional[str]):
+        """Start timing a stage, ending the current one; safe to call from a worker thread"""
+        now = time.perf_counter()
+        if self.stage is not None:
+            self.stage_ms[self.stage] = round((now - self.stage_started) * 1000, 1)
+        self.stage, self.stage_started = stage, now
+
+    def _end_stage(self):
+        if self.stage is not None:
+            self.enter_stage(None)
+
+    def finish(self, status: str):
+        """Record the outcome and release the job's resources"""
+        self._end_stage()
+        self.status = status
+        self.finished_at = datetime.now().isoformat()
+        if self.cleanup is not None:
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"[Jobs] Warning: Cleanup of job {self.id} failed: {e}")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "dataset": self.dataset,
+            **self.details,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": [{"name": stage, "ms": self.stage_ms.get(stage)} for stage in STAGES if stage in self.stage_ms or stage == self.stage],
+            "result": self.result,
+            "error": self.error,
+            "superseded_by": self.superseded_by,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class IngestionQueue:
+    """Per-dataset job queues run by tasks on the event loop"""
+
+    def __init__(self):
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self.pending: Dict[str, IngestionJob] = {}
+        self.running: Dict[str, IngestionJob] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        """Queue a job behind the dataset's running one, replacing any job still waiting"""
+        waiting = self.pending.get(job.dataset)
+        if waiting is not None:
+            waiting.superseded_by = job.id
+            waiting.finish("superseded")
+            print(f"[Jobs] Job {waiting.id} for {job.dataset} superseded by {job.id}")
+        self.pending[job.dataset] = job
+        self.jobs[job.id] = job
+        self._prune()
+        if job.dataset not in self.workers:
+            self.workers[job.dataset] = asyncio.ensure_future(self._work(job.dataset))
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[dict]:
+        """Every known job, newest first"""
+        return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    async def _work(self, dataset: str):
+        try:
+            while True:
+                job = self.pending.pop(dataset, None)
+                if job is None:
+                    return
+                self.running[dataset] = job
+                await self._run(job)
+                del self.running[dataset]
+        finally:
+            self.running.pop(dataset, None)
+            self.workers.pop(dataset, None)
+
+    async def _run(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+        print(f"[Jobs] Started job {job.id} for {job.dataset}")
+        try:
+            job.result = await job.work(job)
+        except asyncio.CancelledError:
+            job.error = "Cancelled on shutdown"
+            job.finish("cancelled")
+            raise
+        except Exception as e:
+            stage = job.stage
+            job.error = str(e)
+            job.finish("failed")
+            print(f"[Jobs] Job {job.id} for {job.dataset} failed in stage {stage or '-'}: {e}")
+            return
+        job.finish("succeeded")
+        print(f"[Jobs] Finished job {job.id} for {job.dataset} in {time.perf_counter() - start:.2f}s")
+
+    def shutdown(self):
+        """Cancel running jobs and drop queued ones (application shutdown)"""
+        for job in list(self.pending.values()):
+            job.error = "Cancelled on shutdown"
+            job.finish("cancelled")
+        self.pending.clear()
+        for task in list(self.workers.values()):
+            task.cancel()
+
+ingestion_jobs = IngestionQueue()
@@ -1,72 +1,45 @@
 from fastapi import FastAPI, APIRouter
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse, JSONResponse
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
 import time
-from collections import OrderedDict
-from typing import Dict, Any, Optional
 
+from app.cache import create_search_cache
+from app.config import config
+from app.connections import close_connections, get_connection_stats
+from app.datasets import dataset_change_texts
+from app.executor import run_io, shutdown_executors
+from app.jobs import ingestion_jobs
 from app.routes import pdp_plp, attributes, concat_rule, category_tree, rejections, ptypes_dump, admin, color_code, rms_manufacturer_brand, magazine
+from app.warmup import warm_up, warmup_status
 
-# Simple in-memory cache with TTL
-class SimpleCache:
-    def __init__(self, max_size: int = 100, ttl: int = 300):  # 5 minutes TTL
-        self.max_size = max_size
-        self.ttl = ttl
-        self.cache: OrderedDict = OrderedDict()
-        self.timestamps: Dict[str, float] = {}
-    
-    def get(self, key: str) -> Optional[Any]:
-        if key in self.cache:
-            if time.time() - self.timestamps[key] < self.ttl:
-                # Move to end (LRU)
-                self.cache.move_to_end(key)
-                return self.cache[key]
-            else:
-                # Expired, remove
-                del self.cache[key]
-                del self.timestamps[key]
-        return None
-    
-    def set(self, key: str, value: Any):
-        if key in self.cache:
-            # Update existing
-            self.cache.move_to_end(key)
-        else:
-            # Add new
-            if len(self.cache) >= self.max_size:
-                # Remove oldest
-                oldest = next(iter(self.cache))
-                del self.cache[oldest]
-                del self.timestamps[oldest]
-        
-        self.cache[key] = value
-        self.timestamps[key] = time.time()
-    
-    def clear(self):
-        self.cache.clear()
-        self.timestamps.clear()
-    
-    def get_stats(self):
-        current_time = time.time()
-        active_entries = sum(1 for ts in self.timestamps.values() if current_time - ts < self.ttl)
-        return {
-            "total_entries": len(self.cache),
-            "active_entries": active_entries,
-            "max_size": self.max_size,
-            "ttl_seconds": self.ttl
-        }
+# Global cache instance: byte-bounded, one shard per dataset, optionally
+# backed by a disk cache shared across workers (see app/cache.py). Entries
+# older than an incremental upload are checked against its change log
+search_cache = create_search_cache(dataset_change_texts)
 
-# Global cache instance
-search_cache = SimpleCache(max_size=200, ttl=600)  # 10 minutes TTL, 200 entries
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so /health answers while datasets load; /ready reports progress
+    warmup_task = None
+    if config.WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(warm_up())
+    else:
+        warmup_status["ready"] = True
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    ingestion_jobs.shutdown()
+    shutdown_executors()
+    close_connections()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 router = APIRouter()
 
 current_dir = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=current_dir / "static"), name="static")
-templates = Jinja2Templates(directory=current_dir / "templates")
 
 @router.get("/")
 async def homepage():
@@ -77,15 +50,22 @@ async def health_check():
     """Health check endpoint for Vercel deployment"""
     return JSONResponse({"status": "healthy", "message": "Custom Search App is running"})
 
+@router.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 503 until every dataset has been warmed up, with per-dataset timings"""
+    return JSONResponse(warmup_status, status_code=200 if warmup_status["ready"] else 503)
+
 @router.get("/cache/stats")
 async def get_cache_stats():
-    """Get cache statistics for monitoring"""
-    return JSONResponse(search_cache.get_stats())
+    """Get cache statistics for monitoring, with SQLite connection counts and timings"""
+    from app.datasets import flights
+    stats = await run_io(search_cache.get_stats)
+    return JSONResponse({**stats, "single_flight": flights.get_stats(), "connections": get_connection_stats()})
 
 @router.post("/cache/clear")
 async def clear_cache():
     """Clear all cached search results"""
-    search_cache.clear()
+    await run_io(search_cache.clear)
     return JSONResponse({"message": "Cache cleared successfully", "timestamp": time.time()})
 
 app.include_router(router)
@@ -0,0 +1,98 @@
+import heapq
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.columnar import ColumnarTable
+
+# Relevance ranking of search matches. Each matched row is scored from its
+# lowercased search column values: a word equal to a whole field beats one
+# the field starts with, which beats one starting a later word of the field,
+# which beats a plain substring. Earlier search columns (ids, names) weigh
+# more than later ones, and shorter fields score higher since the query
+# covers more of them. Only the best offset + limit rows are kept in a
+# bounded heap (heapq.nsmallest), so a page never sorts or builds the rest
+# of the matches. Streamed searches heapify every match instead and pop rows
+# as the client reads them. Fuzzy searches also score each query word's
+# corrections, at a fraction of the points for every edit.
+
+EXACT_SCORE = 10.0
+PREFIX_SCORE = 6.0
+WORD_PREFIX_SCORE = 4.0
+SUBSTRING_SCORE = 1.0
+
+def column_weights(columns: List[str]) -> List[float]:
+    """Weight of each search column, from 2.0 for the first down towards 1.0 for the last"""
+    count = len(columns)
+    return [1.0 + (count - position) / count for position in range(count)]
+
+def score_word(value: str, word: str) -> float:
+    """Score of one query word against one lowercased field value (0.0 if it isn't in there)"""
+    position = value.find(word)
+    if position < 0:
+        return 0.0
+    if position == 0:
+        points = EXACT_SCORE if len(value) == len(word) else PREFIX_SCORE
+    elif not value[position - 1].isalnum() or f" {word}" in value:
+        points = WORD_PREFIX_SCORE
+    else:
+        points = SUBSTRING_SCORE
+    # The more of the field the word covers, the closer to full points
+    return points * (1.0 + len(word) / len(value)) / 2.0
+
+# Corrections of query words as {word: [(correction, edits)]}, see app/fuzzy.py
+Corrections = Dict[str, List[Tuple[str, int]]]
+
+def score_value(value: str, words: List[str], corrections: Optional[Corrections] = None) -> float:
+    """Unweighted relevance of one lowercased field value to the query words"""
+    score = 0.0
+    if len(words) > 1 and value == " ".join(words):
+        # The whole query is the field
+        score += EXACT_SCORE
+    for word in words:
+        points = score_word(value, word)
+        if corrections and word in corrections:
+            # A word as typed beats its corrections, closer corrections beat farther ones
+            for correction, edits in corrections[word]:
+                points = max(points, score_word(value, correction) / (1 + edits))
+        score += points
+    return score
+
+def row_scorer(table: ColumnarTable, columns: List[str], words: List[str],
+               corrections: Optional[Corrections] = None) -> Callable[[int], float]:
+    """Function scoring a row of the table by id"""
+    getters: List[Callable[[int], Optional[str]]] = [table.lowered_getter(name) for name in columns]
+    weights = column_weights(columns)
+    # Values repeat across rows (most columns are dictionary-encoded), score each once
+    memos: List[Dict[str, float]] = [{} for _ in columns]
+    fields = list(zip(getters, weights, memos))
+
+    def score_row(row_id: int) -> float:
+        score = 0.0
+        for get, weight, memo in fields:
+            value = get(row_id)
+            if value:
+                points = memo.get(value)
+                if points is None:
+                    points = memo[value] = score_value(value, words, corrections) * weight
+                score += points
+        return score
+
+    return score_row
+
+def top_matches(table: ColumnarTable, row_ids: Sequence[int], columns: List[str], words: List[str], count: int,
+                corrections: Optional[Corrections] = None) -> List[Tuple[int, float]]:
+    """The count best (row id, score) of the matched rows, by score then row order"""
+    if count <= 0 or not row_ids:
+        return []
+    score_row = row_scorer(table, columns, words, corrections)
+    scored = ((-score_row(row_id), row_id) for row_id in row_ids)
+    return [(row_id, -negative_score) for negative_score, row_id in heapq.nsmallest(count, scored)]
+
+def ranked_matches(table: ColumnarTable, row_ids: Sequence[int], columns: List[str], words: List[str],
+                   corrections: Optional[Corrections] = None) -> Iterator[Tuple[int, float]]:
+    """Every matched (row id, score) in the same order as top_matches, popped off a heap as they're taken"""
+    score_row = row_scorer(table, columns, words, corrections)
+    heap = [(-score_row(row_id), row_id) for row_id in row_ids]
+    heapq.heapify(heap)
+    while heap:
+        negative_score, row_id = heapq.heappop(heap)
+        yield row_id, -negative_score
@@ -0,0 +1,108 @@
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.config import config
+from app.executor import run_io
+
+try:
+    import orjson
+except ImportError:  # Optional speedup, fall back to the stdlib encoder
+    orjson = None
+
+# Search responses are encoded once and cached as bytes, so a cache hit is a
+# plain bytes write instead of re-encoding thousands of result rows.
+#
+# Searches can also be streamed as NDJSON (stream=1 or Accept:
+# application/x-ndjson): a "meta" record with the match count, one "result"
+# record per row, sent a chunk at a time as the rows are built, and a
+# trailing "summary" record (or an "error" record if the search failed).
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def dumps(content: Any) -> bytes:
+    """Encode content as compact UTF-8 JSON (same output shape as JSONResponse)"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class RawJSONResponse(Response):
+    """Response for an already encoded JSON body"""
+    media_type = "application/json"
+
+def search_response_bodies(result_data: dict) -> Tuple[bytes, bytes]:
+    """Encode a search result once; returns the (fresh, cached) response bodies"""
+    # "cached" is spliced in as the last key so both bodies share one encoding
+    # of the results; the timestamp stays the time the results were computed
+    body = dumps({key: value for key, value in result_data.items() if key != "cached"})
+    return body[:-1] + b',"cached":false}', body[:-1] + b',"cached":true}'
+
+def page_bounds(limit: Optional[int], offset: Optional[int], stream: bool = False) -> Tuple[int, int]:
+    """The (limit, offset) a search asked for, SEARCH_PAGE_SIZE by default; ValueError if out of range"""
+    max_limit = config.SEARCH_STREAM_MAX_LIMIT if stream else config.SEARCH_MAX_LIMIT
+    limit = config.SEARCH_PAGE_SIZE if limit is None else limit
+    offset = offset or 0
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    if offset < 0:
+        raise ValueError("offset cannot be negative")
+    return limit, offset
+
+# Helper to find where the next page starts, None after the last one
+def next_page_offset(offset: int, returned: int, total: int) -> Optional[int]:
+    next_offset = offset + returned
+    return next_offset if next_offset < total else None
+
+def search_result_data(query: str, results: List[dict], total: int, limit: int, offset: int) -> dict:
+    """Response content of one page of search results; next_offset is None on the last page"""
+    return {
+        "query": query,
+        "results": results,
+        "total_matches": total,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": next_page_offset(offset, len(results), total),
+        "timestamp": datetime.now().isoformat(),
+        "cached": False
+    }
+
+def wants_stream(request: Request, stream: bool = False) -> bool:
+    """Whether a search asked for an NDJSON stream, with stream=1 (form or query string) or the Accept header"""
+    if stream or request.query_params.get("stream", "").lower() in ("1", "true"):
+        return True
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def wants_fuzzy(request: Request, fuzzy: bool = False) -> bool:
+    """Whether a search asked for typo-tolerant matching, with fuzzy=1 (form or query string)"""
+    return fuzzy or request.query_params.get("fuzzy", "").lower() in ("1", "true")
+
+def ndjson_results(results: List[dict]) -> bytes:
+    """Encode a chunk of results as NDJSON "result" records"""
+    return b"".join(dumps({"type": "result", **result}) + b"\n" for result in results)
+
+def search_stream_response(query: str, total: int, chunks: AsyncIterator[List[dict]], limit: int, offset: int) -> StreamingResponse:
+    """Stream a search's results as NDJSON, encoding each chunk off the event loop as it's produced"""
+    async def body():
+        start = time.perf_counter()
+        yield dumps({"type": "meta", "query": query, "total_matches": total, "limit": limit, "offset": offset,
+                     "timestamp": datetime.now().isoformat()}) + b"\n"
+        returned = 0
+        try:
+            async for results in chunks:
+                yield await run_io(ndjson_results, results)
+                returned += len(results)
+        except Exception as e:
+            print(f"[Search] Warning: Streaming results for '{query}' failed: {e}")
+            yield dumps({"type": "error", "error": str(e)}) + b"\n"
+            return
+        yield dumps({"type": "summary", "query": query, "total_matches": total, "limit": limit, "offset": offset,
+                     "returned": returned, "next_offset": next_page_offset(offset, returned, total),
+                     "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}) + b"\n"
+
+    # X-Accel-Buffering stops proxies like nginx from holding the chunks back
+    headers = {"Cache-Control": "no-cache, no-store, must-revalidate", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
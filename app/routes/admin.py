@@ -1,20 +1,21 @@
-from fastapi import APIRouter, Request, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Request, UploadFile, File, Form, Header, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
 from pathlib import Path
-import pandas as pd
+from typing import Optional
 import os
-import sqlite3
 from datetime import datetime
-import asyncio
-import requests
-import io
+import time
 
 from app.config import config
+from app.connections import connections
+from app.executor import run_io
+from app.ingest import IngestionError, Progress, content_unchanged, ingest_excel, ingest_excel_incremental, spool_upload
+from app.jobs import IngestionJob, ingestion_jobs
+from app.datasets import flights, invalidate_dataset, refresh_dataset_version
+from app.templating import templates
 
 router = APIRouter()
 current_dir = Path(__file__).parent.parent
-templates = Jinja2Templates(directory=current_dir / "templates")
 
 # Database file path
 DB_FILE = current_dir.parent / "data" / "custom_search.db"
@@ -24,11 +25,14 @@ EXCEL_FILES = {
     "attributes": {
         "filename": "attributes.xlsx",
         "required_columns": ["AttributeID", "AttributeName", "Source", "2"],
+        # An attribute is listed once per product type (column "2")
+        "natural_key": ["AttributeID", "Source", "2"],
         "description": "Attributes data"
     },
     "category_pdp_plp": {
         "filename": "category_pdp_plp.xlsx",
         "required_columns": ["L0_category", "L1_category", "L1_category_id", "L2_category", "L2_category_id"],
+        "natural_key": ["L2_category_id"],
         "description": "Category PDP/PLP data"
     },
     "concat_rule": {
@@ -49,6 +53,7 @@ EXCEL_FILES = {
     "ptypes_dump": {
         "filename": "ptypes_dump.xlsx",
         "required_columns": ["ptype_id", "ptype_name"],
+        "natural_key": ["ptype_id"],
         "description": "Product types data"
     },
     "color_code": {
@@ -59,6 +64,7 @@ EXCEL_FILES = {
     "rms_manufacturer_brand": {
         "filename": "rms_manufacturer_brand.xlsx",
         "required_columns": ["MfgID", "MfgName", "BrandID", "BrandName"],
+        "natural_key": ["BrandID"],
         "description": "RMS Manufacturer Brand data"
     },
     "magazine": {
@@ -68,141 +74,117 @@ EXCEL_FILES = {
     }
 }
 
-def validate_excel_file(file_content: bytes, required_columns: list) -> bool:
-    """Validate Excel file structure"""
-    try:
-        # Read Excel file
-        df = pd.read_excel(io.BytesIO(file_content), header=0)
-        
-        # Convert column names to strings for comparison
-        df_columns = [str(col) for col in df.columns]
-        required_columns_str = [str(col) for col in required_columns]
-        
-        print(f"Debug: Found columns: {df_columns}")
-        print(f"Debug: Required columns: {required_columns_str}")
-        
-        # Check if required columns exist
-        missing_columns = []
-        for col in required_columns_str:
-            if col not in df_columns:
-                missing_columns.append(col)
-        
-        if missing_columns:
-            return False, f"Missing required columns: {missing_columns}. Found columns: {df_columns}"
-        
-        # Check if file has data
-        if len(df) == 0:
-            return False, "Excel file is empty"
-        
-        return True, f"Valid file with {len(df)} rows"
-    except Exception as e:
-        return False, f"Error reading Excel file: {str(e)}"
+# Map file types to table names
+TABLE_MAPPING = {
+    "attributes": "attributes",
+    "category_pdp_plp": "category_pdp_plp", 
+    "concat_rule": "concat_rule",
+    "category_tree": "category_tree",
+    "rejection_reasons": "rejection_reasons",
+    "ptypes_dump": "ptypes_dump",
+    "color_code": "color_codes",
+    "rms_manufacturer_brand": "rms_manufacturer_brands",
+    "magazine": "magazine"
+}
 
-async def update_sqlite_table(file_type: str, file_content: bytes):
-    """Update SQLite table with new Excel data (REPLACE existing)"""
+async def update_sqlite_table(file_type: str, upload_path: Path, progress: Progress = None, content_hash: str = None) -> int:
+    """Update SQLite table with the spooled Excel upload (REPLACE existing); returns the row count"""
     
-    # Map file types to table names
-    table_mapping = {
-        "attributes": "attributes",
-        "category_pdp_plp": "category_pdp_plp", 
-        "concat_rule": "concat_rule",
-        "category_tree": "category_tree",
-        "rejection_reasons": "rejection_reasons",
-        "ptypes_dump": "ptypes_dump",
-        "color_code": "color_codes",
-        "rms_manufacturer_brand": "rms_manufacturer_brands",
-        "magazine": "magazine"
-    }
-    
-    table_name = table_mapping.get(file_type)
+    table_name = TABLE_MAPPING.get(file_type)
     if not table_name:
         raise ValueError(f"Unknown file type: {file_type}")
     
-    # Read Excel data
-    df = pd.read_excel(io.BytesIO(file_content))
-    
-    # Connect to SQLite database
-    with sqlite3.connect(DB_FILE) as conn:
-        # DELETE existing data (same as current "replace" behavior)
-        conn.execute(f"DELETE FROM {table_name}")
-        
-        # INSERT new data
-        df.to_sql(table_name, conn, if_exists='append', index=False)
-        
-        # Commit changes
-        conn.commit()
-        
-        print(f"✓ Updated {table_name} table with {len(df)} rows")
+    # Validate, parse and write in one streaming pass, off the event loop
+    return await run_io(ingest_excel, DB_FILE, upload_path, table_name, EXCEL_FILES[file_type]["required_columns"], progress, content_hash)
 
-async def download_from_vercel_blob(filename: str, local_path: str):
-    """Download file from Vercel Blob Storage to local directory"""
-    try:
-        import vercel_blob
-        blobs = vercel_blob.list()
-        download_url = None
-        for blob in blobs['blobs']:
-            if blob['pathname'] == filename:
-                download_url = blob.get('downloadUrl') or blob.get('url')
-                break
-        if download_url:
-            response = requests.get(download_url)
-            response.raise_for_status()
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, "wb") as f:
-                f.write(response.content)
-            return True
-        else:
-            print(f"Failed to find {filename} in Vercel Blob.")
-            return False
-    except Exception as e:
-        print(f"Failed to download {filename}: {str(e)}")
-        return False
+async def upsert_sqlite_table(file_type: str, upload_path: Path, progress: Progress = None, content_hash: str = None) -> dict:
+    """Apply the spooled Excel upload as inserts, updates and deletes on the file's natural key; returns the counts"""
+    table_name = TABLE_MAPPING[file_type]
+    config_excel = EXCEL_FILES[file_type]
+    return await run_io(ingest_excel_incremental, DB_FILE, upload_path, table_name,
+                        config_excel["required_columns"], config_excel["natural_key"], progress, content_hash)
 
-async def download_all_files_from_blob():
-    """Download all Excel files from Vercel Blob Storage to local directory"""
-    data_dir = current_dir.parent / "data"
-    data_dir.mkdir(exist_ok=True)
-    
-    success_count = 0
-    total_count = len(EXCEL_FILES)
-    
-    for file_type, config in EXCEL_FILES.items():
-        filename = config["filename"]
-        local_path = data_dir / filename
-        
+def queue_ingestion(file_type: str, path: Path, content_hash: str, mode: str = "replace", source: str = "upload", cleanup=None) -> IngestionJob:
+    """Submit a background job ingesting the Excel file at path into the file type's table"""
+    config_excel = EXCEL_FILES[file_type]
+    table_name = TABLE_MAPPING[file_type]
+
+    async def ingest(job: IngestionJob) -> dict:
         try:
-            success = await download_from_vercel_blob(filename, str(local_path))
-            if success:
-                success_count += 1
-                print(f"✓ Downloaded {filename}")
-            else:
-                print(f"⚠ Failed to download {filename}")
+            # Checked in the job, so it's against whatever the uploads queued before it wrote
+            if await run_io(content_unchanged, DB_FILE, table_name, content_hash):
+                print(f"[Admin] {config_excel['filename']} is unchanged, skipping ingestion")
+                return {
+                    "message": f"{config_excel['description']} is unchanged, nothing to update",
+                    "skipped": True,
+                    "rows_processed": 0
+                }
+
+            if mode == "incremental":
+                changes = await upsert_sqlite_table(file_type, path, job.enter_stage, content_hash)
+                job.enter_stage("invalidate")
+                # Workers patch the changed rows into their data and keep the cached
+                # results those rows can't affect; make this one notice right away
+                refresh_dataset_version(table_name)
+                return {
+                    "message": f"{config_excel['description']} updated incrementally in database",
+                    "rows_processed": changes["inserted"] + changes["updated"] + changes["unchanged"],
+                    **changes
+                }
+
+            # Update SQLite database (REPLACE existing data)
+            rows_processed = await update_sqlite_table(file_type, path, job.enter_stage, content_hash)
+            job.enter_stage("invalidate")
+            # Drop this dataset's cached results (import here to avoid circular import)
+            from app.main import search_cache
+            await run_io(search_cache.invalidate, table_name)
+            # Invalidate this worker's in-memory data right away; other workers
+            # pick up the version bump on their next request
+            invalidate_dataset(table_name)
+            return {
+                "message": f"{config_excel['description']} updated successfully in database",
+                "rows_processed": rows_processed
+            }
+        except IngestionError:
+            # Invalid workbook, nothing was written
+            raise
         except Exception as e:
-            print(f"⚠ Error downloading {filename}: {str(e)}")
-    
-    print(f"Downloaded {success_count}/{total_count} files from Vercel Blob")
-    return success_count
+            raise RuntimeError(f"Database update failed: {str(e)}") from e
 
-async def get_file_content_from_blob(filename: str) -> bytes:
-    """Get file content directly from Vercel Blob Storage"""
-    try:
-        import vercel_blob
-        blobs = vercel_blob.list()
-        download_url = None
-        for blob in blobs['blobs']:
-            if blob['pathname'] == filename:
-                download_url = blob.get('downloadUrl') or blob.get('url')
-                break
-        if download_url:
-            response = requests.get(download_url)
-            response.raise_for_status()
-            return response.content
-        else:
-            print(f"Failed to find {filename} in Vercel Blob.")
-            return None
-    except Exception as e:
-        print(f"Failed to get {filename} from blob: {str(e)}")
-        return None
+    # Parsing and writing happen in the background; the admin UI polls the job
+    return ingestion_jobs.submit(IngestionJob(
+        table_name,
+        {"file_type": file_type, "filename": config_excel["filename"], "mode": mode, "source": source},
+        ingest,
+        cleanup=cleanup
+    ))
+
+async def download_all_files_from_blob() -> dict:
+    """Sync all Excel files from Vercel Blob Storage into data/ and queue ingestion of the changed ones"""
+    from app.blob_sync import list_blobs, sync_blobs
+    data_dir = current_dir.parent / "data"
+    start = time.perf_counter()
+
+    # One listing for all files, then concurrent conditional downloads
+    blobs = await run_io(list_blobs)
+    files = await run_io(sync_blobs, [config_excel["filename"] for config_excel in EXCEL_FILES.values()], data_dir, blobs)
+
+    jobs = {}
+    for file_type, config_excel in EXCEL_FILES.items():
+        result = files[config_excel["filename"]]
+        if result["status"] not in ("downloaded", "unchanged"):
+            continue
+        # Only datasets whose table wasn't ingested from this exact file are reloaded
+        if await run_io(content_unchanged, DB_FILE, TABLE_MAPPING[file_type], result["sha256"]):
+            continue
+        job = queue_ingestion(file_type, data_dir / config_excel["filename"], result["sha256"], source="blob")
+        jobs[file_type] = {"job_id": job.id, "status_url": f"/admin/jobs/{job.id}"}
+
+    counts = {status: sum(1 for result in files.values() if result["status"] == status)
+              for status in ("downloaded", "unchanged", "missing", "failed")}
+    print(f"[Admin] Synced {len(files)} files from Vercel Blob in {time.perf_counter() - start:.2f}s "
+          f"({', '.join(f'{count} {status}' for status, count in counts.items())}), queued {len(jobs)} ingestion jobs")
+    return {"files": files, "counts": counts, "jobs": jobs}
 
 @router.get("/admin", response_class=HTMLResponse)
 async def admin_home(request: Request):
@@ -213,9 +195,14 @@ async def admin_home(request: Request):
 async def upload_excel_file(
     file_type: str,
     file: UploadFile = File(...),
-    admin_password: str = Form(...)
+    admin_password: str = Form(...),
+    mode: str = Form("replace")
 ):
-    """Upload Excel file and update SQLite database"""
+    """Queue an Excel upload for ingestion into SQLite; returns the job to poll (202)
+
+    mode "replace" swaps in the whole file; "incremental" only applies the rows
+    that changed, matched on the file's natural key.
+    """
     
     # Admin authentication
     if admin_password != config.ADMIN_PASSWORD:
@@ -228,114 +215,93 @@ async def upload_excel_file(
     if not file.filename.endswith('.xlsx'):
         raise HTTPException(status_code=400, detail="Only .xlsx files are allowed")
     
-    # Read file content
-    file_content = await file.read()
-    
-    # Validate Excel structure
     config_excel = EXCEL_FILES[file_type]
-    is_valid, message = validate_excel_file(file_content, config_excel["required_columns"])
-    
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=message)
+
+    if mode not in ("replace", "incremental"):
+        raise HTTPException(status_code=400, detail="Invalid mode, use 'replace' or 'incremental'")
+    if mode == "incremental" and "natural_key" not in config_excel:
+        raise HTTPException(status_code=400, detail=f"Incremental uploads aren't supported for {file_type}")
     
-    try:
-        # Update SQLite database (REPLACE existing data)
-        await update_sqlite_table(file_type, file_content)
-        
-        # Clear cache (import here to avoid circular import)
-        from app.main import search_cache
-        search_cache.clear()
-        # Invalidate in-memory data cache for the relevant route
-        if file_type == "attributes":
-            import app.routes.attributes as mod
-            mod.DATA_CACHE = None
-            mod.DATA_CACHE_TIMESTAMP = 0
-        elif file_type == "category_pdp_plp":
-            import app.routes.pdp_plp as mod
-            mod.DATA_CACHE = None
-            mod.DATA_CACHE_TIMESTAMP = 0
-        elif file_type == "concat_rule":
-            import app.routes.concat_rule as mod
-            mod.DATA_CACHE = None
-            mod.DATA_CACHE_TIMESTAMP = 0
-        elif file_type == "category_tree":
-            import app.routes.category_tree as mod
-            mod.DATA_CACHE = None
-            mod.DATA_CACHE_TIMESTAMP = 0
-        elif file_type == "rejection_reasons":
-            import app.routes.rejections as mod
-            mod.DATA_CACHE = None
-            mod.DATA_CACHE_TIMESTAMP = 0
-        elif file_type == "ptypes_dump":
-            import app.routes.ptypes_dump as mod
-            mod.DATA_CACHE = None
-            mod.DATA_CACHE_TIMESTAMP = 0
-        return JSONResponse({
-            "success": True,
-            "message": f"{config_excel['description']} updated successfully in database",
+    # Spool the upload to a temp file instead of reading it into memory
+    upload_path, content_hash = await run_io(spool_upload, file.file)
+    job = queue_ingestion(file_type, upload_path, content_hash, mode, cleanup=lambda: os.unlink(upload_path))
+    return JSONResponse({
+        "success": True,
+        "message": f"{config_excel['description']} upload queued",
+        "job_id": job.id,
+        "status_url": f"/admin/jobs/{job.id}",
+        "timestamp": datetime.now().isoformat()
+    }, status_code=202)
+
+# Job status is polled with GET, so the password comes in a header instead of a form field
+@router.get("/admin/jobs")
+async def list_ingestion_jobs(admin_password: Optional[str] = Header(None, alias="X-Admin-Password")):
+    """Recent upload jobs, newest first"""
+    if admin_password != config.ADMIN_PASSWORD:
+        raise HTTPException(status_code=401, detail="Invalid admin password")
+    return JSONResponse({"jobs": ingestion_jobs.list()})
+
+@router.get("/admin/jobs/{job_id}")
+async def get_ingestion_job(job_id: str, admin_password: Optional[str] = Header(None, alias="X-Admin-Password")):
+    """Status of an upload job, with the time spent in each stage"""
+    if admin_password != config.ADMIN_PASSWORD:
+        raise HTTPException(status_code=401, detail="Invalid admin password")
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(job.to_dict())
+
+def read_table_status() -> dict:
+    """Row count of each file type's table (blocking), 0 if it doesn't exist yet"""
+    row_counts = {}
+    if DB_FILE.exists():
+        with connections(DB_FILE).read() as conn:
+            existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            for file_type, table_name in TABLE_MAPPING.items():
+                if table_name in existing_tables:
+                    row_counts[file_type] = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+
+    status = {}
+    for file_type, config_excel in EXCEL_FILES.items():
+        row_count = row_counts.get(file_type, 0)
+        status[file_type] = {
             "filename": config_excel["filename"],
-            "rows_processed": len(pd.read_excel(io.BytesIO(file_content))),
-            "timestamp": datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database update failed: {str(e)}")
+            "uploaded": row_count > 0,
+            "description": config_excel["description"],
+            "row_count": row_count
+        }
+    return status
 
 @router.get("/admin/status")
 async def get_upload_status():
     """Get status of database tables"""
     try:
-        status = {}
-        
-        if DB_FILE.exists():
-            with sqlite3.connect(DB_FILE) as conn:
-                # Get list of tables
-                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                existing_tables = [row[0] for row in cursor.fetchall()]
-                
-                for file_type, config in EXCEL_FILES.items():
-                    table_name = file_type.replace('_', '')  # Simple mapping
-                    if file_type == "category_pdp_plp":
-                        table_name = "category_pdp_plp"
-                    elif file_type == "concat_rule":
-                        table_name = "concat_rule"
-                    elif file_type == "category_tree":
-                        table_name = "category_tree"
-                    elif file_type == "rejection_reasons":
-                        table_name = "rejection_reasons"
-                    elif file_type == "ptypes_dump":
-                        table_name = "ptypes_dump"
-                    elif file_type == "attributes":
-                        table_name = "attributes"
-                    
-                    # Check if table exists and has data
-                    table_exists = table_name in existing_tables
-                    row_count = 0
-                    if table_exists:
-                        cursor = conn.execute(f"SELECT COUNT(*) FROM {table_name}")
-                        row_count = cursor.fetchone()[0]
-                    
-                    status[file_type] = {
-                        "filename": config["filename"],
-                        "uploaded": table_exists and row_count > 0,
-                        "description": config["description"],
-                        "row_count": row_count
-                    }
-        else:
-            # Database doesn't exist yet
-            for file_type, config in EXCEL_FILES.items():
-                status[file_type] = {
-                    "filename": config["filename"],
-                    "uploaded": False,
-                    "description": config["description"],
-                    "row_count": 0
-                }
-        
-        return JSONResponse(status)
-        
+        return JSONResponse(await run_io(read_table_status))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get status: {str(e)}")
 
+@router.post("/admin/sync-blob")
+async def sync_blob_endpoint(admin_password: str = Form(...)):
+    """Sync the Excel files from Vercel Blob Storage; changed datasets are re-ingested as background jobs"""
+    if admin_password != config.ADMIN_PASSWORD:
+        raise HTTPException(status_code=401, detail="Invalid admin password")
+
+    if not config.validate_blob_config():
+        raise HTTPException(status_code=400, detail="Vercel Blob is not configured")
+
+    try:
+        # Concurrent requests share one sync
+        result = await flights.do("blob-sync", download_all_files_from_blob)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Blob sync failed: {str(e)}")
+
+    return JSONResponse({
+        "success": True,
+        "message": f"Synced files from Vercel Blob, {len(result['jobs'])} datasets queued for update",
+        **result,
+        "timestamp": datetime.now().isoformat()
+    })
+
 @router.post("/admin/clear-cache")
 async def clear_cache_endpoint(admin_password: str = Form(...)):
     """Clear search cache"""
@@ -343,7 +309,7 @@ async def clear_cache_endpoint(admin_password: str = Form(...)):
         raise HTTPException(status_code=401, detail="Invalid admin password")
     
     from app.main import search_cache
-    search_cache.clear()
+    await run_io(search_cache.clear)
     
     return JSONResponse({
         "success": True,
@@ -1,75 +1,44 @@
 from fastapi import APIRouter, Request, Form, Response, Depends
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
 from pathlib import Path
-import pandas as pd
-import re
-import math
 import hashlib
+from typing import Optional
 from datetime import datetime
-import io
-import requests
-import sqlite3
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 
 security = HTTPBasic()
 
 from app.config import config
+from app.datasets import Dataset
+from app.executor import run_io
+from app.responses import (
+    RawJSONResponse, dumps, page_bounds, search_response_bodies, search_result_data, search_stream_response,
+    wants_fuzzy, wants_stream
+)
+from app.search_columns import TABLE_SEARCH_COLUMNS
+from app.suggest import MAX_SUGGESTIONS
+from app.templating import templates
 
 router = APIRouter()
 current_dir = Path(__file__).parent.parent
 DB_FILE = current_dir.parent / "data" / "custom_search.db"
-templates = Jinja2Templates(directory=current_dir / "templates")
-
-SEARCH_COLUMNS = [
-    "Category Name", "L1", "L2", "Concat Rule"
-]
-
-# Data file cache (in-memory)
-DATA_CACHE = None
-DATA_CACHE_TIMESTAMP = 0
-DATA_CACHE_TTL = 600  # seconds (10 minutes)
-
-# Helper to clean NaN for JSON
-def clean_data_for_json(data):
-    if isinstance(data, dict):
-        return {k: clean_data_for_json(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [clean_data_for_json(v) for v in data]
-    elif isinstance(data, float) and math.isnan(data):
-        return None
-    return data
+
+SEARCH_COLUMNS = TABLE_SEARCH_COLUMNS["concat_rule"]
+
+# Key columns offered as typeahead suggestions
+SUGGEST_COLUMNS = ["Category Name"]
+
+# In-memory snapshot of the table, loaded and searched off the event loop
+dataset = Dataset(DB_FILE, "concat_rule", SEARCH_COLUMNS, label="Concat Rule", suggest_columns=SUGGEST_COLUMNS)
 
 # Helper to generate cache key
-def generate_cache_key(query: str) -> str:
-    return hashlib.md5(f"concat_rule_search_{query.lower().strip()}".encode()).hexdigest()
+def generate_cache_key(query: str, limit: int, offset: int, fuzzy: bool = False) -> str:
+    # Entries are tagged with the dataset version instead (see app/cache.py)
+    return hashlib.md5(f"concat_rule_search_{query.lower().strip()}_{offset}_{limit}{'_fuzzy' if fuzzy else ''}".encode()).hexdigest()
 
 # Load data from SQLite database
 async def load_data():
-    global DATA_CACHE, DATA_CACHE_TIMESTAMP
-    now = datetime.now().timestamp()
-    # Check if data is cached and not expired
-    if DATA_CACHE is not None and (now - DATA_CACHE_TIMESTAMP) < DATA_CACHE_TTL:
-        return DATA_CACHE
-    try:
-        if DB_FILE.exists():
-            with sqlite3.connect(DB_FILE) as conn:
-                # Query from SQLite database
-                query = "SELECT * FROM concat_rule"
-                df = pd.read_sql_query(query, conn)
-                df = df.where(pd.notnull(df), None)
-                data = df.to_dict(orient="records")
-                print(f"[Concat Rule] Data loaded from SQLite database at {datetime.now()}")
-                # Cache the data
-                DATA_CACHE = data
-                DATA_CACHE_TIMESTAMP = now
-                return data
-        else:
-            print(f"[Concat Rule] Warning: Database file not found at {DB_FILE}")
-            return []
-    except Exception as e:
-        print(f"[Concat Rule] Warning: Failed to load data: {e}")
-        return []
+    return await dataset.load()
 
 # Routes
 @router.get("/concat-rule", response_class=HTMLResponse)
@@ -77,7 +46,9 @@ async def concat_rule_home(request: Request):
     return templates.TemplateResponse("concat_rule.html", {"request": request})
 
 @router.post("/concat-rule/search")
-async def concat_rule_search(request: Request, response: Response, query: str = Form(...)):
+async def concat_rule_search(request: Request, response: Response, query: str = Form(...),
+        limit: Optional[int] = Form(None), offset: int = Form(0), stream: bool = Form(False),
+        fuzzy: bool = Form(False)):
     print(f"[Concat Rule] Search query: '{query}' @ {datetime.now()}")
 
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
@@ -88,44 +59,51 @@ async def concat_rule_search(request: Request, response: Response, query: str =
     if not query:
         return JSONResponse({"error": "Query cannot be empty"}, status_code=400)
 
-    # Load data from SQLite database
-    data = await load_data()
+    streaming = wants_stream(request, stream)
+    fuzzy = wants_fuzzy(request, fuzzy)
+    try:
+        limit, offset = page_bounds(limit, offset, streaming)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if streaming:
+        # Streamed results are sent as they're built and not cached
+        query_words = query.lower().split()
+        total, chunks = await dataset.stream(query_words, offset, limit, fuzzy)
+        print(f"[Concat Rule] Streaming {total} matches for query '{query}' from offset {offset}")
+        return search_stream_response(query, total, chunks, limit, offset)
 
     # Check cache first
     from app.main import search_cache
-    cache_key = generate_cache_key(query)
-    cached_result = search_cache.get(cache_key)
+    cache_key = generate_cache_key(query, limit, offset, fuzzy)
+    version = dataset.current_version()
+    cached_result = await run_io(search_cache.get, dataset.table, cache_key, version)
     
     if cached_result:
         print(f"[Concat Rule] Cache hit for query '{query}'")
-        return JSONResponse(cached_result)
+        return RawJSONResponse(cached_result)
 
     # Perform search if not in cache
     query_words = query.lower().split()
-    results = []
-
-    for row in data:
-        row_text = ' '.join(str(row[col]).lower() for col in SEARCH_COLUMNS if col in row and row[col] is not None)
-        if all(word in row_text for word in query_words):
-            matches = {col: row[col] for col in SEARCH_COLUMNS if col in row and row[col] is not None and any(word in str(row[col]).lower() for word in query_words)}
-            results.append({
-                "row_data": clean_data_for_json(row),
-                "matched_columns": matches
-            })
-
-    result_data = {
-        "query": query,
-        "results": results,
-        "total_matches": len(results),
-        "timestamp": datetime.now().isoformat(),
-        "cached": False
-    }
-
-    # Cache the result
-    search_cache.set(cache_key, result_data)
-    print(f"[Concat Rule] Found {len(results)} matches for query '{query}' (cached)")
-
-    return JSONResponse(result_data)
+    results, total = await dataset.search(query_words, offset, limit, fuzzy)
+
+    result_data = search_result_data(query, results, total, limit, offset)
+
+    # Encode once off the event loop and cache the bytes served on a hit
+    body, cached_body = await run_io(search_response_bodies, result_data)
+    # Fuzzy results depend on the whole vocabulary, so any new version invalidates them
+    await run_io(search_cache.set, dataset.table, cache_key, cached_body, version, None if fuzzy else query_words)
+    print(f"[Concat Rule] Found {total} matches for query '{query}', returned {len(results)} from offset {offset} (cached)")
+
+    return RawJSONResponse(body)
+
+@router.get("/concat-rule/suggest")
+async def concat_rule_suggest(q: str = "", limit: int = 10):
+    # Prefix lookups on the loaded dataset, answered without touching SQLite
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return JSONResponse({"error": f"limit must be between 1 and {MAX_SUGGESTIONS}"}, status_code=400)
+    suggestions = await dataset.suggest(q, limit)
+    return RawJSONResponse(dumps({"query": q, "suggestions": suggestions}))
 
 # Monitoring endpoint
 @router.get("/concat-rule/db-status")
@@ -133,4 +111,4 @@ async def db_status(credentials: HTTPBasicCredentials = Depends(security)):
     if credentials.username != "admin" or credentials.password != config.ADMIN_PASSWORD:
         from fastapi import HTTPException
         raise HTTPException(status_code=401, detail="Unauthorized")
-    return {"cache_timestamp": DATA_CACHE_TIMESTAMP, "db_file_exists": DB_FILE.exists()}
+    return {"cache_timestamp": dataset.timestamp, "db_file_exists": DB_FILE.exists()}
@@ -0,0 +1,22 @@
+# Searchable columns of each SQLite table. Routers search them in memory, and
+# the FTS tables, snapshots and incremental change log texts are built from
+# them, so every engine and the cache validity checks see the same text.
+TABLE_SEARCH_COLUMNS = {
+    "attributes": ["AttributeID", "AttributeName", "Source", "2"],
+    "category_pdp_plp": [
+        "L0_category", "L1_category", "L1_category_id",
+        "L2_category", "L2_category_id",
+        "PDP1", "PDP2", "PDP3", "PDP4", "PDP5", "PDP6",
+        "PDP7", "PDP8", "PDP9", "PDP10", "PDP11",
+        "PLP1", "PLP2", "PLP3", "PLP4"
+    ],
+    "concat_rule": ["Category Name", "L1", "L2", "Concat Rule"],
+    "category_tree": [
+        "l0_category_id", "l0_category", "l1_category_id", "l1_category", "l2_category_id", "l2_category"
+    ],
+    "rejection_reasons": ["Reason", "Justification"],
+    "ptypes_dump": ["ptype_id", "ptype_name"],
+    "color_codes": ["Color Name", "Hex Code"],
+    "rms_manufacturer_brands": ["MfgID", "MfgName", "BrandID", "BrandName"],
+    "magazine": ["brand_name", "l2_category", "ptype"]
+}
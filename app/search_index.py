@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional, Sequence
+
+from app.columnar import ColumnarTable
+
+# Trigram inverted index over the searchable columns of a dataset.
+# A row matches a query when every query word is a substring of the row's
+# search text, so every trigram of a word must occur in the row. Candidate
+# rows come from intersecting the posting lists of those trigrams and are
+# then verified with the same substring check the routers always used.
+#
+# Incremental uploads patch a copy of the index instead of rebuilding it:
+# changed rows get their new text and are added to small overlay postings,
+# deleted rows become None. Base postings (possibly memory-mapped) are never
+# modified; a stale entry there only yields a candidate the check rejects.
+
+TRIGRAM_SIZE = 3
+
+def row_search_text(row: dict, columns: List[str]) -> str:
+    """Build the lowercased text a row is searched against"""
+    return ' '.join(str(row[col]).lower() for col in columns if col in row and row[col] is not None)
+
+def trigrams(text: str) -> set:
+    """All distinct trigrams of a string"""
+    return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+class TrigramIndex:
+    def __init__(self, rows: ColumnarTable, columns: List[str]):
+        self.rows = rows
+        self.columns = columns
+        self.texts: List[Optional[str]] = rows.search_texts(columns)
+        self.postings: Dict[str, List[int]] = {}
+        self.overlay: Dict[str, List[int]] = {}
+        self.patched = False  # row ids no longer match a fresh read of the table
+
+        for row_id, text in enumerate(self.texts):
+            for gram in trigrams(text):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    self.postings[gram] = [row_id]
+                else:
+                    posting.append(row_id)
+
+    @classmethod
+    def from_parts(cls, rows: ColumnarTable, columns: List[str], texts: List[Optional[str]],
+                   postings: Dict[str, Sequence[int]], overlay: Optional[Dict[str, List[int]]] = None) -> "TrigramIndex":
+        """Index from prebuilt search texts and posting lists (e.g. a snapshot)"""
+        index = cls.__new__(cls)
+        index.rows = rows
+        index.columns = columns
+        index.texts = texts
+        index.postings = postings
+        index.overlay = overlay if overlay is not None else {}
+        index.patched = overlay is not None
+        return index
+
+    def patch(self, updates: Dict[int, Optional[dict]], appended: List[dict]) -> "TrigramIndex":
+        """Copy of the index with rows replaced by id (None deletes) and rows appended; self is left as is"""
+        rows = self.rows.patch(updates, appended)
+        texts = list(self.texts)
+        overlay = {gram: list(posting) for gram, posting in self.overlay.items()}
+
+        def index_row(row_id: int, row: Optional[dict]):
+            texts[row_id] = None if row is None else row_search_text(row, self.columns)
+            if row is not None:
+                for gram in trigrams(texts[row_id]):
+                    overlay.setdefault(gram, []).append(row_id)
+
+        for row_id, row in updates.items():
+            index_row(row_id, row)
+        for row in appended:
+            texts.append(None)
+            index_row(len(texts) - 1, row)
+        return TrigramIndex.from_parts(rows, self.columns, texts, self.postings, overlay)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def candidates(self, words: List[str]) -> Optional[set]:
+        """Row ids that contain every trigram of every word (None means all rows)"""
+        grams = set()
+        for word in words:
+            grams |= trigrams(word)
+        if not grams:
+            # Only words shorter than a trigram, nothing to narrow down with
+            return None
+
+        postings = []
+        for gram in grams:
+            posting = self.postings.get(gram)
+            extra = self.overlay.get(gram)
+            if extra:
+                posting = set(posting or ()).union(extra)
+            elif posting is None:
+                return set()
+            postings.append(posting)
+
+        # Intersect starting from the shortest posting list
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def search_ids(self, words: List[str]) -> List[int]:
+        """Ids of rows whose search text contains every word, in row order"""
+        if not words:
+            return []
+        texts = self.texts
+        candidate_ids = self.candidates(words)
+        if candidate_ids is None:
+            candidate_ids = range(len(texts))
+        else:
+            candidate_ids = sorted(candidate_ids)
+        # Deleted rows have no text
+        return [row_id for row_id in candidate_ids if texts[row_id] is not None and all(word in texts[row_id] for word in words)]
+
+    def search_any_ids(self, groups: List[List[str]]) -> List[int]:
+        """Ids of rows whose search text contains, for every group, at least one of its words (a query word
+        and its corrections), in row order"""
+        if not groups:
+            return []
+        texts = self.texts
+        candidate_ids = None
+        for group in groups:
+            group_ids = set()
+            for word in group:
+                word_ids = self.candidates([word])
+                if word_ids is None:
+                    # A word too short to narrow down with, so is the group
+                    group_ids = None
+                    break
+                group_ids |= word_ids
+            if group_ids is not None:
+                candidate_ids = group_ids if candidate_ids is None else candidate_ids & group_ids
+                if not candidate_ids:
+                    return []
+        candidate_ids = range(len(texts)) if candidate_ids is None else sorted(candidate_ids)
+        return [row_id for row_id in candidate_ids if texts[row_id] is not None
+                and all(any(word in texts[row_id] for word in group) for group in groups)]
+
+    def search(self, words: List[str]) -> List[dict]:
+        """Rows whose search text contains every word, in row order (only these are built as dicts)"""
+        return self.rows.take(self.search_ids(words))
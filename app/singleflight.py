@@ -0,0 +1,37 @@
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable]):
+        """Run func() unless a call for key is already in flight, then share its result"""
+        task = self.calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        # Shielded so one cancelled waiter (e.g. a dropped client) doesn't cancel it for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced
+        }
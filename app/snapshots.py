@@ -0,0 +1,233 @@
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.columnar import ColumnarTable
+from app.search_columns import TABLE_SEARCH_COLUMNS
+from app.search_index import TrigramIndex, row_search_text, trigrams
+from app.versions import read_source, read_version
+
+# Compiled per-dataset snapshot files, written at ingestion next to the
+# database (data/snapshots/<table>.snap) and memory-mapped when a worker
+# loads the dataset, so a cold start skips SQLite -> pandas -> dicts.
+# Columns are decoded straight into a ColumnarTable (see app/columnar.py).
+#
+# Layout: MAGIC, a uint32 header length, a JSON header, then 8-byte aligned
+# sections the header points to (offset, length relative to the data start):
+# - "str" columns: null flags (uint8 per row), char offsets (uint32[n + 1])
+#   into one UTF-8 blob, so each column is decoded once and sliced
+# - "int" / "float" columns: null flags and int64 / float64 values
+# - "json" columns (mixed types): char offsets into a blob of JSON values
+# - the index: the row search texts (as a "str" column), the sorted trigrams
+#   (also a "str" column), posting offsets (uint32[grams + 1]) and row ids.
+#   Posting lists are used straight from the mapping, without copying.
+# - the rows' SQLite rowids (int64), to patch in incremental uploads
+# The snapshot is only used when its dataset version and source (the hash of
+# the ingested file and the time of the version bump, see read_source) match
+# the database: a rebuilt database reuses version numbers.
+
+MAGIC = b"CSSNAP02"
+ALIGNMENT = 8
+
+def snapshot_path(db_file: Path, table: str) -> Path:
+    return Path(db_file).parent / "snapshots" / f"{table}.snap"
+
+def _column_kind(values: list) -> str:
+    kinds = {type(value) for value in values if value is not None}
+    if kinds <= {str}:
+        return "str"
+    if kinds == {int} and all(-2 ** 63 <= value < 2 ** 63 for value in values if value is not None):
+        return "int"
+    if kinds == {float}:
+        return "float"
+    return "json"
+
+class _SnapshotWriter:
+    def __init__(self):
+        self.data = bytearray()
+
+    def section(self, payload: bytes) -> List[int]:
+        self.data += b"\0" * (-len(self.data) % ALIGNMENT)
+        offset = len(self.data)
+        self.data += payload
+        return [offset, len(payload)]
+
+    def strings(self, values: List[Optional[str]]) -> Dict[str, list]:
+        offsets = array("I", [0])
+        total = 0
+        for value in values:
+            total += len(value) if value is not None else 0
+            offsets.append(total)
+        return {
+            "nulls": self.section(bytes(value is None for value in values)),
+            "offsets": self.section(offsets.tobytes()),
+            "data": self.section("".join(value for value in values if value is not None).encode("utf-8"))
+        }
+
+    def numbers(self, values: list, typecode: str) -> Dict[str, list]:
+        return {
+            "nulls": self.section(bytes(value is None for value in values)),
+            "values": self.section(array(typecode, (0 if value is None else value for value in values)).tobytes())
+        }
+
+def build_snapshot(conn: sqlite3.Connection, table: str, version: int) -> bytes:
+    """Compile a table (as seen by conn, including uncommitted changes) into snapshot bytes"""
+    search_columns = TABLE_SEARCH_COLUMNS.get(table)
+    if search_columns is None:
+        raise ValueError(f"No search columns configured for table: {table}")
+
+    cursor = conn.execute(f'SELECT rowid, * FROM "{table}"')
+    names = [description[0] for description in cursor.description][1:]
+    records = cursor.fetchall()
+    rowids = [record[0] for record in records]
+    records = [record[1:] for record in records]
+    columns = list(zip(*records)) if records else [() for _ in names]
+
+    writer = _SnapshotWriter()
+    header = {"table": table, "version": version, "source": read_source(conn, table), "rows": len(records),
+              "byteorder": sys.byteorder, "search_columns": search_columns, "columns": []}
+    for name, values in zip(names, columns):
+        kind = _column_kind(values)
+        if kind == "str":
+            sections = writer.strings(values)
+        elif kind == "int":
+            sections = writer.numbers(values, "q")
+        elif kind == "float":
+            sections = writer.numbers(values, "d")
+        else:
+            sections = writer.strings([json.dumps(value) for value in values])
+        header["columns"].append({"name": name, "kind": kind, **sections})
+
+    # Prebuilt trigram index over the search texts
+    texts = [row_search_text(dict(zip(names, record)), search_columns) for record in records]
+    postings: Dict[str, List[int]] = {}
+    for row_id, text in enumerate(texts):
+        for gram in trigrams(text):
+            postings.setdefault(gram, []).append(row_id)
+    grams = sorted(postings)
+    posting_offsets = array("I", [0])
+    row_ids = array("I")
+    for gram in grams:
+        row_ids.extend(postings[gram])
+        posting_offsets.append(len(row_ids))
+    header["index"] = {
+        "texts": writer.strings(texts),
+        "grams": writer.strings(grams),
+        "posting_offsets": writer.section(posting_offsets.tobytes()),
+        "row_ids": writer.section(row_ids.tobytes())
+    }
+    header["rowids"] = writer.section(array("q", rowids).tobytes())
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + bytes(writer.data)
+
+def write_snapshot(conn: sqlite3.Connection, db_file: Path, table: str, version: int) -> Path:
+    """Build a table's snapshot and atomically replace the file workers map"""
+    path = snapshot_path(db_file, table)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp_path, "wb") as f:
+        f.write(build_snapshot(conn, table, version))
+    # Workers that already mapped the old file keep reading it until they reload
+    os.replace(tmp_path, path)
+    return path
+
+def _strings(data: memoryview, sections: Dict[str, list]) -> List[Optional[str]]:
+    def view(name):
+        offset, length = sections[name]
+        return data[offset:offset + length]
+    text = str(view("data"), "utf-8")
+    offsets = view("offsets").cast("I").tolist()
+    values = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    if "nulls" in sections:
+        nulls = bytes(view("nulls"))
+        if any(nulls):
+            values = [None if null else value for value, null in zip(values, nulls)]
+    return values
+
+def _numbers(data: memoryview, sections: Dict[str, list], typecode: str) -> list:
+    offset, length = sections["values"]
+    values = data[offset:offset + length].cast(typecode).tolist()
+    offset, length = sections["nulls"]
+    nulls = bytes(data[offset:offset + length])
+    if any(nulls):
+        values = [None if null else value for value, null in zip(values, nulls)]
+    return values
+
+def _header(view) -> Optional[Tuple[dict, int]]:
+    """A snapshot's JSON header and where its data starts, None if it isn't a snapshot"""
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        return None
+    header_length = struct.unpack_from("<I", view, len(MAGIC))[0]
+    header_end = len(MAGIC) + 4 + header_length
+    return json.loads(bytes(view[len(MAGIC) + 4:header_end])), header_end
+
+def snapshot_is_current(conn: sqlite3.Connection, db_file: Path, table: str) -> bool:
+    """Whether a table's snapshot exists and was built from its current version and source"""
+    path = snapshot_path(db_file, table)
+    try:
+        with open(path, "rb") as f:
+            prefix = f.read(len(MAGIC) + 4)
+            if len(prefix) < len(MAGIC) + 4:
+                return False
+            header_length = struct.unpack_from("<I", prefix, len(MAGIC))[0]
+            parsed = _header(prefix + f.read(header_length))
+    except (OSError, ValueError, struct.error):
+        return False
+    if parsed is None:
+        return False
+    header = parsed[0]
+    return header.get("version") == read_version(conn, table) and header.get("source") == read_source(conn, table)
+
+def load_snapshot(db_file: Path, table: str, version: Optional[int], source: Dict[str, Optional[str]],
+                  search_columns: List[str]) -> Optional[Tuple[ColumnarTable, TrigramIndex, List[int]]]:
+    """Rows, search index and rowids from a table's snapshot, or None if there's no snapshot matching version and source"""
+    path = snapshot_path(db_file, table)
+    if version is None or not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        parsed = _header(view)
+        if parsed is None:
+            return None
+        header, header_end = parsed
+        if (header["version"] != version or header.get("source") != source
+                or header["search_columns"] != search_columns or header["byteorder"] != sys.byteorder):
+            return None
+        data = view[header_end:]
+
+        names, columns = [], []
+        for column in header["columns"]:
+            names.append(column["name"])
+            if column["kind"] == "str":
+                columns.append(_strings(data, column))
+            elif column["kind"] == "int":
+                columns.append(_numbers(data, column, "q"))
+            elif column["kind"] == "float":
+                columns.append(_numbers(data, column, "d"))
+            else:
+                columns.append([json.loads(value) for value in _strings(data, column)])
+        rows = ColumnarTable.from_columns(names, columns)
+
+        index_sections = header["index"]
+        texts = _strings(data, index_sections["texts"])
+        grams = _strings(data, index_sections["grams"])
+        offset, length = index_sections["posting_offsets"]
+        posting_offsets = data[offset:offset + length].cast("I").tolist()
+        offset, length = index_sections["row_ids"]
+        row_ids = data[offset:offset + length].cast("I")
+        postings = {gram: row_ids[start:end] for gram, start, end in zip(grams, posting_offsets, posting_offsets[1:])}
+        offset, length = header["rowids"]
+        rowids = data[offset:offset + length].cast("q").tolist()
+        return rows, TrigramIndex.from_parts(rows, search_columns, texts, postings), rowids
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"[Snapshots] Warning: Could not load snapshot {path}: {e}")
+        return None
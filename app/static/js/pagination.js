@@ -0,0 +1,170 @@
+// Paged search results: the search endpoints return the best page of matches
+// (ranked by relevance) as JSON, served from the search cache when it can be.
+// addLoadMore fetches the following pages on demand, and its "Show all"
+// button streams every remaining match (stream=1) as NDJSON: a "meta" record
+// with total_matches, the "result" records, then a "summary" record with
+// next_offset, rendered as the records arrive. Streams skip the cache, so
+// only pages larger than the JSON limit are streamed. Searches are fuzzy
+// (typo tolerant) when the search form's "fuzzy" checkbox is ticked.
+// SEARCH_LIMITS (maxLimit, streamMaxLimit) is set by base.html from
+// the server's config.
+
+// Whether the page's search form asks for a fuzzy search
+function fuzzySearchChecked() {
+    const checkbox = document.querySelector('#searchForm input[name="fuzzy"]');
+    return Boolean(checkbox && checkbox.checked);
+}
+
+// Form body of a search request
+function searchBody(query, offset, fuzzy, limit) {
+    return `query=${encodeURIComponent(query)}&offset=${offset}${limit ? `&limit=${limit}` : ''}${fuzzy ? '&fuzzy=1' : ''}`;
+}
+
+// Fetches one page of a search. start(meta) runs with the page's header fields
+// (query, total_matches, limit, offset, timestamp) and returns the function
+// rendering rows (or nothing when there are none), which is then called with
+// {query, results}. Resolves to {summary, appendRows}; summary has next_offset.
+async function searchPage(endpoint, query, offset, start, fuzzy = fuzzySearchChecked(), limit = null) {
+    if (limit && limit > SEARCH_LIMITS.maxLimit) {
+        return streamSearchPage(endpoint, query, offset, start, fuzzy, limit);
+    }
+    const response = await fetch(`${endpoint}?t=${Date.now()}`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+        body: searchBody(query, offset, fuzzy, limit)
+    });
+
+    if (!response.ok) {
+        throw new Error(`Server error: ${response.status}`);
+    }
+
+    const data = await response.json();
+    const appendRows = start(data) || null;
+    if (appendRows && data.results.length) {
+        appendRows(data);
+    }
+    const summary = {
+        query: query,
+        total_matches: data.total_matches,
+        limit: data.limit,
+        offset: data.offset,
+        returned: data.results.length,
+        next_offset: data.next_offset,
+        // Later pages keep the mode of the first one
+        fuzzy: fuzzy
+    };
+    return {summary, appendRows};
+}
+
+// Streams one page of a search, same arguments and result as searchPage; rows
+// are rendered as the records arrive.
+async function streamSearchPage(endpoint, query, offset, start, fuzzy = fuzzySearchChecked(), limit = null) {
+    const response = await fetch(`${endpoint}?t=${Date.now()}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/x-ndjson',
+        },
+        body: `${searchBody(query, offset, fuzzy, limit)}&stream=1`
+    });
+
+    if (!response.ok) {
+        throw new Error(`Server error: ${response.status}`);
+    }
+
+    let appendRows = null;
+    let summary = null;
+    let pending = [];
+    const handle = line => {
+        if (!line.trim()) return;
+        const record = JSON.parse(line);
+        if (record.type === 'meta') {
+            appendRows = start(record) || null;
+        } else if (record.type === 'result') {
+            pending.push(record);
+        } else if (record.type === 'summary') {
+            summary = record;
+        } else if (record.type === 'error') {
+            throw new Error(record.error);
+        }
+    };
+    const flush = () => {
+        if (pending.length && appendRows) {
+            appendRows({query: query, results: pending});
+        }
+        pending = [];
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const {done, value} = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), {stream: !done});
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(handle);
+        if (done) break;
+        // Render what arrived in this chunk before waiting for the next one
+        flush();
+    }
+    handle(buffer);
+    flush();
+
+    if (!summary) {
+        throw new Error('Incomplete search response');
+    }
+    // Later pages keep the mode of the first one
+    summary.fuzzy = fuzzy;
+    return {summary, appendRows};
+}
+
+function addLoadMore(container, endpoint, summary, appendRows) {
+    let shown = summary.offset + summary.returned;
+    let nextOffset = summary.next_offset;
+
+    const buttons = document.createElement('div');
+    buttons.className = 'mt-4 flex gap-2';
+    const button = document.createElement('button');
+    button.type = 'button';
+    button.className = 'px-4 py-2 bg-blue-600 text-white rounded hover:bg-blue-700 disabled:opacity-50';
+    // Streams the rest in one go, rendering rows as they arrive
+    const showAll = document.createElement('button');
+    showAll.type = 'button';
+    showAll.className = 'px-4 py-2 bg-gray-200 text-gray-800 rounded hover:bg-gray-300 disabled:opacity-50';
+    buttons.append(button, showAll);
+
+    const remaining = () => summary.total_matches - shown;
+    const update = () => {
+        container.querySelectorAll('.shown-count').forEach(counter => counter.textContent = shown);
+        const done = nextOffset === null || nextOffset === undefined;
+        button.textContent = `Load more (${remaining()} remaining)`;
+        button.classList.toggle('hidden', done);
+        showAll.textContent = `Show all ${remaining() > SEARCH_LIMITS.streamMaxLimit ? `(next ${SEARCH_LIMITS.streamMaxLimit})` : `(${remaining()})`}`;
+        // One more page shows everything anyway
+        showAll.classList.toggle('hidden', done || remaining() <= summary.limit);
+    };
+
+    const load = async (clicked, limit) => {
+        button.disabled = showAll.disabled = true;
+        clicked.textContent = 'Loading...';
+        try {
+            const page = await searchPage(endpoint, summary.query, nextOffset, () => appendRows, summary.fuzzy, limit);
+            shown += page.summary.returned;
+            nextOffset = page.summary.next_offset;
+            update();
+        } catch (err) {
+            clicked.textContent = 'Failed to load, try again';
+            console.error(err);
+        } finally {
+            button.disabled = showAll.disabled = false;
+        }
+    };
+
+    button.addEventListener('click', () => load(button, summary.limit));
+    // Past the JSON limit searchPage streams the page
+    showAll.addEventListener('click', () => load(showAll, Math.min(remaining(), SEARCH_LIMITS.streamMaxLimit)));
+
+    update();
+    container.appendChild(buttons);
+}
@@ -14,20 +14,10 @@ document.getElementById('searchForm').addEventListener('submit', async (e) => {
     resultsDiv.innerHTML = '';
     
     try {
-        const response = await fetch(`/search?t=${Date.now()}`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/x-www-form-urlencoded',
-            },
-            body: `query=${encodeURIComponent(query)}`
-        });
-        
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
+        const {summary, appendRows} = await searchPage('/search', query, 0, displayResults);
+        if (appendRows) {
+            addLoadMore(resultsDiv, '/search', summary, appendRows);
         }
-        
-        const data = await response.json();
-        displayResults(data);
     } catch (error) {
         resultsDiv.innerHTML = `<p class="error">Error: ${error.message}</p>`;
     } finally {
@@ -35,23 +25,25 @@ document.getElementById('searchForm').addEventListener('submit', async (e) => {
     }
 });
 
+// Renders a search's header from its page fields and returns the row renderer
 function displayResults(data) {
     const resultsDiv = document.getElementById('results');
     resultsDiv.innerHTML = '';
 
     if (data.total_matches === 0) {
         resultsDiv.innerHTML = `<p class="text-gray-600 italic">No results found for "${data.query}"</p>`;
-        return;
+        return null;
     }
 
     const header = document.createElement('div');
     header.innerHTML = `
-        <h2 class="text-xl font-bold text-gray-800 mb-1">${data.total_matches} results for "${data.query}"</h2>
+        <h2 class="text-xl font-bold text-gray-800 mb-1">Showing <span class="shown-count">${Math.min(data.limit, data.total_matches - data.offset)}</span> of ${data.total_matches} results for "${data.query}"</h2>
         <p class="text-sm text-gray-500 mb-4">Last updated: ${new Date(data.timestamp).toLocaleString()}</p>
     `;
     resultsDiv.appendChild(header);
 
-    const allKeys = Object.keys(data.results[0].row_data);
+    // Columns come from the first row that arrives
+    let allKeys = null;
 
     // Table container for horizontal scroll
     const scrollWrapper = document.createElement('div');
@@ -62,16 +54,19 @@ function displayResults(data) {
 
     // Header
     const thead = document.createElement('thead');
-    thead.innerHTML = `
-        <tr class="bg-gray-100 text-gray-700 border-b border-gray-300">
-            ${allKeys.map(key => `<th class="px-4 py-2 border-r font-semibold">${key}</th>`).join('')}
-        </tr>
-    `;
     table.appendChild(thead);
 
     // Body
     const tbody = document.createElement('tbody');
-    data.results.forEach(result => {
+    const appendRows = data => data.results.forEach(result => {
+        if (!allKeys) {
+            allKeys = Object.keys(result.row_data);
+            thead.innerHTML = `
+                <tr class="bg-gray-100 text-gray-700 border-b border-gray-300">
+                    ${allKeys.map(key => `<th class="px-4 py-2 border-r font-semibold">${key}</th>`).join('')}
+                </tr>
+            `;
+        }
         const row = document.createElement('tr');
         row.className = 'hover:bg-blue-50 border-b border-gray-200';
 
@@ -94,6 +89,7 @@ function displayResults(data) {
     table.appendChild(tbody);
     scrollWrapper.appendChild(table);
     resultsDiv.appendChild(scrollWrapper);
+    return appendRows;
 }
 
 
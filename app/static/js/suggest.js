@@ -0,0 +1,46 @@
+// Typeahead for the search inputs: an input with data-suggest="<endpoint>"
+// gets a datalist filled from the dataset's /suggest endpoint as the user
+// types. Requests are debounced and answers to stale prefixes are dropped.
+
+const SUGGEST_DELAY_MS = 120;
+
+function attachSuggest(input) {
+    const endpoint = input.dataset.suggest;
+    const datalist = document.createElement('datalist');
+    datalist.id = `suggestions-${Math.random().toString(36).slice(2)}`;
+    input.setAttribute('list', datalist.id);
+    input.after(datalist);
+
+    let timer = null;
+    let latest = '';
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const prefix = input.value.trim();
+        latest = prefix;
+        if (!prefix) {
+            datalist.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(async () => {
+            try {
+                const response = await fetch(`${endpoint}?q=${encodeURIComponent(prefix)}&limit=10`);
+                if (!response.ok) return;
+                const data = await response.json();
+                if (prefix !== latest) return;
+                datalist.innerHTML = '';
+                data.suggestions.forEach(suggestion => {
+                    const option = document.createElement('option');
+                    option.value = suggestion.value;
+                    option.label = `${suggestion.column} (${suggestion.count})`;
+                    datalist.appendChild(option);
+                });
+            } catch (err) {
+                console.error(err);
+            }
+        }, SUGGEST_DELAY_MS);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('input[data-suggest]').forEach(attachSuggest);
+});
@@ -0,0 +1,80 @@
+import bisect
+import re
+from typing import Dict, List, Tuple
+
+from app.columnar import ColumnarTable
+
+# Prefix autocomplete over a dataset's key columns (brand, ptype, attribute
+# names...), built whenever the dataset loads. Every distinct value is
+# normalized (lowercased, whitespace collapsed) into a sorted array of keys;
+# a second sorted array holds the value from each later word on, so "shirt"
+# also suggests "Men's Shirt". A lookup bisects to the first key with the
+# prefix and reads the k keys from there: O(log n + k), cheap enough to
+# answer on the event loop. With SEARCH_ENGINE=fts the dataset isn't loaded,
+# so the index is built from per-column value counts read from SQLite.
+
+# Largest number of suggestions a request can ask for
+MAX_SUGGESTIONS = 50
+
+# A word character right after a non-word character starts a later word
+_WORD_START = re.compile(r"\W(?=\w)")
+
+def normalize(text: str) -> str:
+    """Key a value or prefix is compared by"""
+    return " ".join(str(text).split()).lower()
+
+class SuggestIndex:
+    """Sorted keys of the distinct values of some columns, for prefix lookups"""
+
+    def __init__(self, value_counts: List[Tuple[str, Dict[object, int]]]):
+        """Index of (column, {value: rows holding it}) pairs"""
+        # (value, column, rows holding it) per distinct value
+        self.values: List[Tuple[str, str, int]] = []
+        # (key, value, column, value id); values sharing a key are ordered by how they're shown, then by column
+        whole: List[Tuple[str, str, str, int]] = []
+        words: List[Tuple[str, str, str, int]] = []
+        for name, counts in value_counts:
+            for value, count in counts.items():
+                text = str(value).strip()
+                key = normalize(text)
+                if not key:
+                    continue
+                value_id = len(self.values)
+                self.values.append((text, name, count))
+                whole.append((key, text, name, value_id))
+                if " " in key or not key.isalnum():
+                    words.extend((key[match.end():], text, name, value_id) for match in _WORD_START.finditer(key))
+        whole.sort()
+        words.sort()
+        self.keys = [entry[0] for entry in whole]
+        self.ids = [entry[3] for entry in whole]
+        self.word_keys = [entry[0] for entry in words]
+        self.word_ids = [entry[3] for entry in words]
+
+    @classmethod
+    def build(cls, table: ColumnarTable, columns: List[str]) -> "SuggestIndex":
+        """Index of the values of a loaded table's columns"""
+        return cls([(name, table.value_counts(name)) for name in columns if name in table.names])
+
+    def __len__(self):
+        return len(self.values)
+
+    def lookup(self, prefix: str, limit: int) -> List[dict]:
+        """Values starting with prefix, then values with a later word starting with it, each in key order"""
+        prefix = normalize(prefix)
+        if not prefix or limit <= 0:
+            return []
+        found: List[int] = []
+        seen = set()
+        for keys, ids in ((self.keys, self.ids), (self.word_keys, self.word_ids)):
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+                value_id = ids[position]
+                if value_id not in seen:
+                    seen.add(value_id)
+                    found.append(value_id)
+                position += 1
+        return [
+            {"value": value, "column": column, "count": count}
+            for value, column, count in (self.values[value_id] for value_id in found)
+        ]
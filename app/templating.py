@@ -0,0 +1,14 @@
+from pathlib import Path
+
+from fastapi.templating import Jinja2Templates
+
+from app.config import config
+
+# One Jinja2 environment (and template cache) shared by the app and every router
+templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
+
+# Page size limits the search pages need, read at render time so they follow reload_env
+templates.env.globals["search_limits"] = lambda: {
+    "maxLimit": config.SEARCH_MAX_LIMIT,
+    "streamMaxLimit": config.SEARCH_STREAM_MAX_LIMIT
+}
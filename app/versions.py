@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# Every ingestion bumps the dataset's row in dataset_versions. Workers compare
+# that number with the snapshot they hold, so an upload handled by one worker
+# is picked up by all the others without waiting for a TTL.
+
+VERSIONS_TABLE = "dataset_versions"
+
+# Incremental uploads also record which rows each version touched, with the
+# search text of every row before and after, so workers can patch their copy
+# and keep cached results the change can't affect. A version without entries
+# (a full replace) means a full reload.
+CHANGES_TABLE = "dataset_changes"
+# How many versions back the change log goes, per dataset
+CHANGE_LOG_VERSIONS = 20
+
+# SHA-256 of the file each dataset was last ingested from, so uploading or
+# syncing the same workbook again is skipped
+SOURCES_TABLE = "dataset_sources"
+
+def ensure_versions_table(conn: sqlite3.Connection):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} ("
+        "dataset TEXT PRIMARY KEY, "
+        "version INTEGER NOT NULL DEFAULT 0, "
+        "updated_at TEXT)"
+    )
+
+def bump_version(conn: sqlite3.Connection, table: str) -> int:
+    """Record a change to a dataset's table, in the caller's transaction"""
+    ensure_versions_table(conn)
+    conn.execute(
+        f"INSERT INTO {VERSIONS_TABLE} (dataset, version, updated_at) VALUES (?, 1, ?) "
+        "ON CONFLICT(dataset) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+        (table, datetime.now().isoformat())
+    )
+    return conn.execute(f"SELECT version FROM {VERSIONS_TABLE} WHERE dataset = ?", (table,)).fetchone()[0]
+
+def ensure_changes_table(conn: sqlite3.Connection):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} ("
+        "dataset TEXT NOT NULL, "
+        "version INTEGER NOT NULL, "
+        "row_id INTEGER NOT NULL, "
+        "old_text TEXT, "
+        "new_text TEXT, "
+        "PRIMARY KEY (dataset, version, row_id))"
+    )
+
+def record_changes(conn: sqlite3.Connection, table: str, version: int, changes: List[Tuple[int, Optional[str], Optional[str]]]):
+    """Log the (rowid, old search text, new search text) of the rows a version changed, in the caller's transaction"""
+    ensure_changes_table(conn)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {CHANGES_TABLE} (dataset, version, row_id, old_text, new_text) VALUES (?, ?, ?, ?, ?)",
+        [(table, version, row_id, old_text, new_text) for row_id, old_text, new_text in changes]
+    )
+    conn.execute(f"DELETE FROM {CHANGES_TABLE} WHERE dataset = ? AND version <= ?", (table, version - CHANGE_LOG_VERSIONS))
+
+def _logged_changes(conn: sqlite3.Connection, table: str, from_version: int, to_version: int, columns: str) -> Optional[list]:
+    # Every version in between must be an incremental one still in the log
+    try:
+        logged = conn.execute(
+            f"SELECT COUNT(DISTINCT version) FROM {CHANGES_TABLE} WHERE dataset = ? AND version > ? AND version <= ?",
+            (table, from_version, to_version)
+        ).fetchone()[0]
+        if logged != to_version - from_version:
+            return None
+        return conn.execute(
+            f"SELECT {columns} FROM {CHANGES_TABLE} WHERE dataset = ? AND version > ? AND version <= ?",
+            (table, from_version, to_version)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # No change log in this database
+        return None
+
+def read_changed_rowids(conn: sqlite3.Connection, table: str, from_version: int, to_version: int) -> Optional[Set[int]]:
+    """Rowids changed after from_version up to to_version, or None if that can't be told from the log"""
+    changes = _logged_changes(conn, table, from_version, to_version, "row_id")
+    return None if changes is None else {row_id for row_id, in changes}
+
+def read_change_texts(conn: sqlite3.Connection, table: str, from_version: int, to_version: int) -> Optional[List[str]]:
+    """Search texts (before and after) of the rows changed after from_version up to to_version, or None if unknown"""
+    changes = _logged_changes(conn, table, from_version, to_version, "old_text, new_text")
+    if changes is None:
+        return None
+    return [text for texts in changes for text in texts if text is not None]
+
+def record_content_hash(conn: sqlite3.Connection, table: str, content_hash: str):
+    """Remember the hash of the file a dataset was ingested from, in the caller's transaction"""
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} ("
+        "dataset TEXT PRIMARY KEY, "
+        "content_hash TEXT NOT NULL, "
+        "updated_at TEXT)"
+    )
+    conn.execute(
+        f"INSERT OR REPLACE INTO {SOURCES_TABLE} (dataset, content_hash, updated_at) VALUES (?, ?, ?)",
+        (table, content_hash, datetime.now().isoformat())
+    )
+
+def read_content_hash(conn: sqlite3.Connection, table: str) -> Optional[str]:
+    """Hash of the file a dataset was last ingested from, None if unknown"""
+    try:
+        row = conn.execute(f"SELECT content_hash FROM {SOURCES_TABLE} WHERE dataset = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def read_versions(conn: sqlite3.Connection) -> Optional[Dict[str, int]]:
+    """All dataset versions, or None if the database predates the versions table"""
+    try:
+        return dict(conn.execute(f"SELECT dataset, version FROM {VERSIONS_TABLE}").fetchall())
+    except sqlite3.OperationalError:
+        return None
+
+def read_version(conn: sqlite3.Connection, table: str) -> Optional[int]:
+    versions = read_versions(conn)
+    if versions is None:
+        return None
+    return versions.get(table, 0)
+
+class VersionTracker:
+    """Per-process view of dataset_versions, refreshed only when the database changed"""
+
+    def __init__(self, db_file: Path, check_interval: float):
+        self.db_file = db_file
+        self.check_interval = check_interval
+        self.conn: Optional[sqlite3.Connection] = None
+        self.data_version = None
+        self.versions: Optional[Dict[str, int]] = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def _poll(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        # Called on the event loop: never wait for another thread's poll,
+        # keep serving the versions read last time instead
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = now
+            try:
+                if self.conn is None:
+                    if not self.db_file.exists():
+                        return
+                    # timeout=0: never wait on a writer's lock, just try again next time
+                    self.conn = sqlite3.connect(self.db_file, timeout=0, check_same_thread=False)
+                # data_version only changes when another connection commits,
+                # so the versions table is re-read only after a write
+                data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != self.data_version:
+                    self.versions = read_versions(self.conn)
+                    self.data_version = data_version
+            except sqlite3.Error as e:
+                print(f"[Versions] Warning: Could not check dataset versions: {e}")
+                self.checked_at = 0.0
+        finally:
+            self.lock.release()
+
+    def refresh(self):
+        """Re-read the versions on the next get, e.g. right after this process wrote them"""
+        self.checked_at = 0.0
+
+    def get(self, table: str) -> Optional[int]:
+        """Current version of a dataset, or None if versions aren't tracked in this database"""
+        self._poll()
+        if self.versions is None:
+            return None
+        return self.versions.get(table, 0)
+
+def read_source(conn: sqlite3.Connection, table: str) -> Dict[str, Optional[str]]:
+    """What a dataset's current version was built from: the source file's hash and when the version was bumped
+
+    A rebuilt database starts counting versions again, so a version number
+    alone can't tell its tables apart from the ones a snapshot was built from.
+    """
+    try:
+        row = conn.execute(f"SELECT updated_at FROM {VERSIONS_TABLE} WHERE dataset = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    return {"content_hash": read_content_hash(conn, table), "updated_at": row[0] if row else None}
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from app.config import config
+from app.executor import run_io
+from app.responses import page_bounds, search_response_bodies, search_result_data
+from app.routes import pdp_plp, attributes, concat_rule, category_tree, rejections, ptypes_dump, color_code, rms_manufacturer_brand, magazine
+
+# Loads every dataset (and its search index) when the app starts instead of on
+# the first request, then optionally replays known top queries so they're
+# already in search_cache. Progress is reported by the /ready endpoint.
+
+SEARCH_MODULES = [pdp_plp, attributes, concat_rule, category_tree, rejections, ptypes_dump, color_code, rms_manufacturer_brand, magazine]
+
+DEFAULT_QUERIES_FILE = Path(__file__).parent.parent / "data" / "warmup_queries.json"
+
+warmup_status = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "rss_mb_before": None,
+    "rss_mb_after": None,
+    "datasets": {}
+}
+
+# Helper to report resident memory (MB), None where it can't be measured
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# Helper to read the queries to replay per dataset table
+def load_warmup_queries() -> Dict[str, List[str]]:
+    path = Path(config.WARMUP_QUERIES_FILE) if config.WARMUP_QUERIES_FILE else DEFAULT_QUERIES_FILE
+    if not path.exists():
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[Warmup] Warning: Could not read warmup queries from {path}: {e}")
+        return {}
+
+async def replay_query(module, query: str):
+    """Run a search the way the module's route does and store the response in search_cache"""
+    from app.main import search_cache
+    dataset = module.dataset
+    query = query.strip()
+    if not query:
+        return
+    # The first page at the default size, which is what the search pages ask for
+    limit, offset = page_bounds(None, 0)
+    cache_key = module.generate_cache_key(query, limit, offset)
+    version = dataset.current_version()
+    query_words = query.lower().split()
+    results, total = await dataset.search(query_words, offset, limit)
+    result_data = search_result_data(query, results, total, limit, offset)
+    _, cached_body = await run_io(search_response_bodies, result_data)
+    await run_io(search_cache.set, dataset.table, cache_key, cached_body, version, query_words)
+
+async def warm_dataset(module, queries: List[str]):
+    dataset = module.dataset
+    status = warmup_status["datasets"][dataset.table] = {"status": "loading"}
+    try:
+        start = time.perf_counter()
+        # The FTS engine searches SQLite in place, there is nothing to preload
+        if config.SEARCH_ENGINE != "fts":
+            rows = await dataset.load()
+            status["rows"] = len(rows)
+            status["source"] = dataset.load_stats.get("source")
+            status["memory_kb"] = dataset.load_stats.get("memory_kb")
+            status["suggestions"] = dataset.load_stats.get("suggestions")
+            status["fuzzy_words"] = dataset.load_stats.get("fuzzy_words")
+        status["load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        start = time.perf_counter()
+        for query in queries:
+            await replay_query(module, query)
+        status["queries"] = len(queries)
+        status["queries_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        status["status"] = "ready"
+    except Exception as e:
+        print(f"[Warmup] Warning: Failed to warm up {dataset.table}: {e}")
+        status["status"] = "failed"
+        status["error"] = str(e)
+
+async def warm_up():
+    """Preload all datasets concurrently and replay the warmup queries"""
+    warmup_status["started_at"] = datetime.now().isoformat()
+    warmup_status["rss_mb_before"] = current_rss_mb()
+    start = time.perf_counter()
+    queries = load_warmup_queries()
+    await asyncio.gather(*(warm_dataset(module, queries.get(module.dataset.table, [])) for module in SEARCH_MODULES))
+    warmup_status["finished_at"] = datetime.now().isoformat()
+    warmup_status["rss_mb_after"] = current_rss_mb()
+    warmup_status["ready"] = True
+    print(f"[Warmup] All datasets warmed up in {time.perf_counter() - start:.2f}s (RSS {warmup_status['rss_mb_before']} -> {warmup_status['rss_mb_after']} MB)")
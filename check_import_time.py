@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for Custom Search App
+Profiles a cold `import app.main` and fails if it exceeds the budget
+or pulls in modules that should only load on demand
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# Heavy modules that must only be imported by the code paths that need them
+# (openpyxl for Excel ingestion, requests for blob sync). pandas and numpy are
+# no longer dependencies, they are listed so they don't creep back in
+LAZY_MODULES = ["pandas", "numpy", "requests", "openpyxl"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def profile_import(module: str):
+    """Import module in a fresh interpreter; returns {name: (self_us, cumulative_us)} for it and everything it imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError(f"Importing {module} failed")
+    # Lines come in completion order, so everything the module imported is
+    # listed (indented) right before it, after the previous top-level import
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), len(match.group(3)), int(match.group(1)), int(match.group(2))))
+    end = next(i for i, entry in enumerate(entries) if entry[0] == module and entry[1] == 1)
+    start = end
+    while start > 0 and entries[start - 1][1] > 1:
+        start -= 1
+    return {name: (self_us, cumulative_us) for name, _, self_us, cumulative_us in entries[start:end + 1]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold import time of the app")
+    parser.add_argument("--module", default="app.main", help="Module to import (default: app.main)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "1000")),
+                        help="Maximum cumulative import time in ms (default: IMPORT_TIME_BUDGET_MS or 1000)")
+    parser.add_argument("--runs", type=int, default=3, help="Best of this many cold imports (default: 3)")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest modules to show (default: 15)")
+    args = parser.parse_args()
+
+    print(f"⏱️  Profiling cold import of {args.module} ({args.runs} runs)...")
+    runs = [profile_import(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda timings: timings[args.module][1])
+    total_ms = best[args.module][1] / 1000
+
+    print("\n📋 Slowest imports (cumulative):")
+    for name, (_, cumulative) in sorted(best.items(), key=lambda item: item[1][1], reverse=True)[:args.top]:
+        print(f"  • {name}: {cumulative / 1000:.1f} ms")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in best]
+    if eager:
+        print(f"\n❌ Imported at startup but should be lazy: {', '.join(eager)}")
+        failed = True
+
+    if total_ms > args.budget_ms:
+        print(f"\n❌ Import of {args.module} took {total_ms:.1f} ms, budget is {args.budget_ms:.0f} ms")
+        failed = True
+    else:
+        print(f"\n✅ Import of {args.module} took {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
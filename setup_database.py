@@ -2,172 +2,313 @@
 """
 Database Setup Script for Custom Search App
 Converts Excel files to SQLite database
+
+Workbooks are parsed in parallel worker processes; each table is then
+loaded, indexed, FTS-indexed and versioned in a single transaction, so the
+script is safe to rerun. Files whose content is unchanged since the last
+run are skipped.
+
+Usage: python setup_database.py [--only DATASET ...] [--force] [--workers N]
 """
 
+import argparse
+import os
 import sqlite3
-import pandas as pd
-from pathlib import Path
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from app.config import Config
+from app.fts import build_fts_table, fts_table_name
+from app.ingest import file_digest, infer_column_types, insert_rows, read_workbook
+from app.snapshots import snapshot_is_current, write_snapshot
+from app.versions import bump_version, read_content_hash, read_version, record_content_hash
+
+DATA_DIR = Path("data")
+DB_FILE = DATA_DIR / "custom_search.db"
+
+# Excel file configurations (same as in admin.py)
+EXCEL_FILES = {
+    "attributes": {
+        "filename": "attributes.xlsx",
+        "required_columns": ["AttributeID", "AttributeName", "Source", "2"],
+        "description": "Attributes data"
+    },
+    "category_pdp_plp": {
+        "filename": "category_pdp_plp.xlsx",
+        "required_columns": ["L0_category", "L1_category", "L1_category_id", "L2_category", "L2_category_id"],
+        "description": "Category PDP/PLP data"
+    },
+    "concat_rule": {
+        "filename": "concat_rule.xlsx",
+        "required_columns": ["Category Name", "L1", "L2", "Concat Rule"],
+        "description": "Concat rule data"
+    },
+    "category_tree": {
+        "filename": "category_tree.xlsx",
+        "required_columns": ["l0_category_id", "l0_category", "l1_category_id", "l1_category", "l2_category_id", "l2_category"],
+        "description": "Category tree data"
+    },
+    "rejection_reasons": {
+        "filename": "rejection_reasons.xlsx",
+        "required_columns": ["Reason", "Justification"],
+        "description": "Rejection reasons data"
+    },
+    "ptypes_dump": {
+        "filename": "ptypes_dump.xlsx",
+        "required_columns": ["ptype_id", "ptype_name"],
+        "description": "Product types data"
+    },
+    "color_code": {
+        "filename": "colour_code.xlsx",
+        "required_columns": ["Color Name", "Hex Code"],
+        "description": "Color code data"
+    },
+    "rms_manufacturer_brand": {
+        "filename": "rms_manufacturer_brand.xlsx",
+        "required_columns": ["ManufacturerID", "ManufacturerName", "BrandID", "BrandName", "Description"],
+        "description": "RMS Manufacturer Brand data"
+    },
+    "magazine": {
+        "filename": "Magazine.xlsx",
+        "required_columns": ["brand_name", "l2_category", "ptype"],
+        "description": "Magazine data"
+    }
+}
+
+# Table mapping
+TABLE_MAPPING = {
+    "attributes": "attributes",
+    "category_pdp_plp": "category_pdp_plp",
+    "concat_rule": "concat_rule",
+    "category_tree": "category_tree",
+    "rejection_reasons": "rejection_reasons",
+    "ptypes_dump": "ptypes_dump",
+    "color_code": "color_codes",
+    "rms_manufacturer_brand": "rms_manufacturer_brands",
+    "magazine": "magazine"
+}
+
+# Indexes per table, created once the rows are loaded
+INDEXES = {
+    "attributes": ["AttributeName", "AttributeID"],
+    "category_pdp_plp": ["L1_category", "L2_category"],
+    "concat_rule": ["Category Name"],
+    "category_tree": ["l1_category", "l2_category"],
+    "rejection_reasons": ["Reason"],
+    "ptypes_dump": ["ptype_name"],
+    "color_codes": ["Color Name", "Hex Code"],
+    "rms_manufacturer_brands": ["MfgID", "MfgName", "BrandID", "BrandName"]
+}
+
+# Connection settings for the bulk load
+BULK_LOAD_PRAGMAS = [
+    # With WAL, NORMAL only syncs at checkpoints and can't corrupt the database
+    "PRAGMA synchronous=NORMAL",
+    # 64MB page cache so inserts and index builds stay in memory
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY"
+]
+
+# Helper to time a stage in milliseconds
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def parse_workbook(path: Path):
+    """Parse a workbook (runs in a worker process); returns columns, rows, declared types and parse time"""
+    start = time.perf_counter()
+    columns, rows = read_workbook(path)
+    return columns, rows, infer_column_types(columns, rows), elapsed_ms(start)
 
-def create_database():
+def build_table_snapshot(db_file: Path, table: str) -> float:
+    """Compile a table's snapshot from the committed database (runs in a worker process); returns the time taken"""
+    start = time.perf_counter()
+    with sqlite3.connect(db_file) as conn:
+        # One read transaction, so the rows match the version
+        conn.execute("BEGIN")
+        write_snapshot(conn, db_file, table, read_version(conn, table))
+    return elapsed_ms(start)
+
+def create_indexes(conn: sqlite3.Connection, table: str):
+    existing_columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+    for column in INDEXES.get(table, []):
+        if column not in existing_columns:
+            print(f"  ⚠️  Could not create index on {table}.{column}: no such column")
+            continue
+        index_name = f"idx_{table}_{column.replace(' ', '_').lower()}"
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ("{column}")')
+
+def load_table(conn: sqlite3.Connection, table: str, columns, rows, types, content_hash: str) -> dict:
+    """Replace a table with the parsed rows in one transaction; returns per-stage timings"""
+    timings = {}
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        start = time.perf_counter()
+        conn.execute(f'DROP TABLE IF EXISTS "{fts_table_name(table)}"')
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        column_defs = ", ".join(f'"{column}" {column_type}' for column, column_type in zip(columns, types))
+        conn.execute(f'CREATE TABLE "{table}" ({column_defs})')
+        insert_rows(conn, f'"{table}"', columns, iter(rows))
+        timings["write"] = elapsed_ms(start)
+
+        # Indexes are built after the load rather than maintained row by row
+        start = time.perf_counter()
+        create_indexes(conn, table)
+        timings["indexes"] = elapsed_ms(start)
+
+        # FTS5 trigram table so searches can run inside SQLite
+        start = time.perf_counter()
+        build_fts_table(conn, table)
+        timings["fts"] = elapsed_ms(start)
+
+        record_content_hash(conn, table, content_hash)
+        # Bump the dataset version so running workers reload the new data
+        bump_version(conn, table)
+    return timings
+
+def create_empty_table(conn: sqlite3.Connection, table: str, columns) -> bool:
+    """Create a table with the expected columns unless it exists; returns whether it was created"""
+    with conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table,)).fetchone():
+            return False
+        column_defs = ", ".join(f'"{column}" TEXT' for column in columns)
+        conn.execute(f'CREATE TABLE "{table}" ({column_defs})')
+        create_indexes(conn, table)
+        build_fts_table(conn, table)
+        bump_version(conn, table)
+    return True
+
+def create_database(only=None, force: bool = False, workers: int = None):
     """Create SQLite database with all required tables"""
-    
-    # Database file path
-    data_dir = Path("data")
-    db_file = data_dir / "custom_search.db"
-    
+    total_start = time.perf_counter()
+
     # Ensure data directory exists
-    data_dir.mkdir(exist_ok=True)
-    
-    # Excel file configurations (same as in admin.py)
-    EXCEL_FILES = {
-        "attributes": {
-            "filename": "attributes.xlsx",
-            "required_columns": ["AttributeID", "AttributeName", "Source", "2"],
-            "description": "Attributes data"
-        },
-        "category_pdp_plp": {
-            "filename": "category_pdp_plp.xlsx",
-            "required_columns": ["L0_category", "L1_category", "L1_category_id", "L2_category", "L2_category_id"],
-            "description": "Category PDP/PLP data"
-        },
-        "concat_rule": {
-            "filename": "concat_rule.xlsx",
-            "required_columns": ["Category Name", "L1", "L2", "Concat Rule"],
-            "description": "Concat rule data"
-        },
-        "category_tree": {
-            "filename": "category_tree.xlsx",
-            "required_columns": ["l0_category_id", "l0_category", "l1_category_id", "l1_category", "l2_category_id", "l2_category"],
-            "description": "Category tree data"
-        },
-        "rejection_reasons": {
-            "filename": "rejection_reasons.xlsx",
-            "required_columns": ["Reason", "Justification"],
-            "description": "Rejection reasons data"
-        },
-        "ptypes_dump": {
-            "filename": "ptypes_dump.xlsx",
-            "required_columns": ["ptype_id", "ptype_name"],
-            "description": "Product types data"
-        },
-        "color_code": {
-            "filename": "colour_code.xlsx",
-            "required_columns": ["Color Name", "Hex Code"],
-            "description": "Color code data"
-        },
-        "rms_manufacturer_brand": {
-            "filename": "rms_manufacturer_brand.xlsx",
-            "required_columns": ["ManufacturerID", "ManufacturerName", "BrandID", "BrandName", "Description"],
-            "description": "RMS Manufacturer Brand data"
-        },
-        "magazine": {
-            "filename": "Magazine.xlsx",
-            "required_columns": ["brand_name", "l2_category", "ptype"],
-            "description": "Magazine data"
-        }
-    }
-    
-    # Table mapping
-    table_mapping = {
-        "attributes": "attributes",
-        "category_pdp_plp": "category_pdp_plp", 
-        "concat_rule": "concat_rule",
-        "category_tree": "category_tree",
-        "rejection_reasons": "rejection_reasons",
-        "ptypes_dump": "ptypes_dump",
-        "color_code": "color_codes",
-        "rms_manufacturer_brand": "rms_manufacturer_brands",
-        "magazine": "magazine"
-    }
-    
+    DATA_DIR.mkdir(exist_ok=True)
+
+    selected = [file_type for file_type in EXCEL_FILES if not only or file_type in only or TABLE_MAPPING[file_type] in only]
+
     print("🔧 Setting up SQLite database...")
-    
-    # Create database connection
-    with sqlite3.connect(db_file) as conn:
-        print(f"✓ Connected to database: {db_file}")
-        
-        # Process each Excel file
-        for file_type, config in EXCEL_FILES.items():
-            excel_file = data_dir / config["filename"]
-            table_name = table_mapping[file_type]
-            
+
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    try:
+        print(f"✓ Connected to database: {DB_FILE}")
+
+        # WAL lets the snapshot workers read committed tables while the next ones load;
+        # the file is switched back to a rollback journal once the load is done
+        if Config.SQLITE_WAL:
+            conn.execute("PRAGMA journal_mode=WAL")
+            print("✓ Enabled WAL journal mode")
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+
+        existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+        # Work out what needs loading: same file as last time means no parsing at all
+        start = time.perf_counter()
+        to_load = {}
+        changed_tables = []
+        skipped_tables = []
+        for file_type in selected:
+            config = EXCEL_FILES[file_type]
+            excel_file = DATA_DIR / config["filename"]
+            table_name = TABLE_MAPPING[file_type]
+
             if excel_file.exists():
+                content_hash = file_digest(excel_file)
+                if not force and table_name in existing_tables and read_content_hash(conn, table_name) == content_hash:
+                    print(f"⏭️  {config['filename']} is unchanged, skipping")
+                    skipped_tables.append(table_name)
+                else:
+                    to_load[file_type] = (excel_file, content_hash)
+            else:
+                print(f"⚠️  File not found: {config['filename']}")
+                if create_empty_table(conn, table_name, config["required_columns"]):
+                    changed_tables.append(table_name)
+                    print(f"  ✓ Created empty table '{table_name}'")
+        print(f"⏱️  Checked {len(selected)} files in {elapsed_ms(start)}ms, {len(to_load)} to load")
+
+        timings = {}
+        failed = []
+        if to_load:
+            workers = workers or min(len(to_load), os.cpu_count() or 1)
+            print(f"\n📊 Parsing {len(to_load)} workbooks with {workers} worker processes...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parses = {pool.submit(parse_workbook, excel_file): file_type for file_type, (excel_file, _) in to_load.items()}
+                snapshots = {}
+                # Load each table as soon as its workbook is parsed; SQLite has a single writer anyway
+                for future in as_completed(parses):
+                    file_type = parses[future]
+                    config = EXCEL_FILES[file_type]
+                    table_name = TABLE_MAPPING[file_type]
+                    try:
+                        columns, rows, types, parse_ms = future.result()
+                        table_timings = timings[table_name] = {"rows": len(rows), "parse": parse_ms}
+                        table_timings.update(load_table(conn, table_name, columns, rows, types, to_load[file_type][1]))
+                        changed_tables.append(table_name)
+                        print(f"  ✓ Loaded {len(rows)} rows from {config['filename']} into '{table_name}'")
+                    except Exception as e:
+                        failed.append(table_name)
+                        print(f"  ❌ Error processing {config['filename']}: {e}")
+                        continue
+                    # Snapshots are compiled from the committed table, also in the pool
+                    snapshots[pool.submit(build_table_snapshot, DB_FILE, table_name)] = table_name
+
+                for future in as_completed(snapshots):
+                    table_name = snapshots[future]
+                    try:
+                        timings[table_name]["snapshot"] = future.result()
+                    except Exception as e:
+                        print(f"  ⚠️  Could not write snapshot for {table_name}: {e}")
+
+        # Snapshots aren't committed with the database, so build the ones an unchanged table is missing
+        for table_name in skipped_tables:
+            if not snapshot_is_current(conn, DB_FILE, table_name):
                 try:
-                    print(f"\n📊 Processing {config['filename']}...")
-                    
-                    # Read Excel file
-                    df = pd.read_excel(excel_file)
-                    print(f"  ✓ Loaded {len(df)} rows from {config['filename']}")
-                    
-                    # Create table and insert data
-                    df.to_sql(table_name, conn, if_exists='replace', index=False)
-                    print(f"  ✓ Created table '{table_name}' with {len(df)} rows")
-                    
+                    snapshot_ms = build_table_snapshot(DB_FILE, table_name)
+                    print(f"  ✓ Rebuilt snapshot for '{table_name}' in {snapshot_ms}ms")
                 except Exception as e:
-                    print(f"  ❌ Error processing {config['filename']}: {e}")
-            else:
-                print(f"\n⚠️  File not found: {config['filename']}")
-                print(f"  Creating empty table '{table_name}'...")
-                
-                # Create empty table with expected columns
-                columns = config["required_columns"]
-                create_sql = f"CREATE TABLE {table_name} ("
-                create_sql += ", ".join([f"{col} TEXT" for col in columns])
-                create_sql += ")"
-                
-                conn.execute(create_sql)
-                print(f"  ✓ Created empty table '{table_name}'")
-        
-        # Create indexes for better performance
-        print("\n🔍 Creating indexes...")
-        indexes = [
-            ("attributes", "AttributeName"),
-            ("attributes", "AttributeID"),
-            ("category_pdp_plp", "L1_category"),
-            ("category_pdp_plp", "L2_category"),
-            ("concat_rule", "Category Name"),
-            ("category_tree", "l1_category"),
-            ("category_tree", "l2_category"),
-            ("rejection_reasons", "Reason"),
-            ("ptypes_dump", "ptype_name"),
-            ("color_codes", "Color Name"),
-            ("color_codes", "Hex Code"),
-            ("rms_manufacturer_brands", "MfgID"),
-            ("rms_manufacturer_brands", "MfgName"),
-            ("rms_manufacturer_brands", "BrandID"),
-            ("rms_manufacturer_brands", "BrandName")
-        ]
-        
-        for table, column in indexes:
-            try:
-                # Quote column names with spaces for SQLite
-                if ' ' in column:
-                    quoted_column = f'"{column}"'
-                else:
-                    quoted_column = column
-                conn.execute(f"CREATE INDEX idx_{table}_{column.replace(' ', '_').lower()} ON {table}({quoted_column})")
-                print(f"  ✓ Created index on {table}.{column}")
-            except Exception as e:
-                print(f"  ⚠️  Could not create index on {table}.{column}: {e}")
-        
-        print(f"\n✅ Database setup complete!")
-        print(f"📁 Database file: {db_file}")
-        
+                    print(f"  ⚠️  Could not write snapshot for {table_name}: {e}")
+
+        if timings:
+            print("\n⏱️  Per-stage timings (ms):")
+            stages = ["parse", "write", "indexes", "fts", "snapshot"]
+            for table_name, table_timings in timings.items():
+                stage_text = ", ".join(f"{stage} {table_timings[stage]}" for stage in stages if stage in table_timings)
+                print(f"  • {table_name} ({table_timings['rows']} rows): {stage_text}")
+
+        print(f"\n✅ Database setup complete in {time.perf_counter() - total_start:.2f}s!")
+        print(f"📁 Database file: {DB_FILE}")
+        print(f"🔄 Updated tables: {', '.join(changed_tables) if changed_tables else 'none'}")
+
         # Show table summary
         print("\n📋 Database Summary:")
-        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        for table in tables:
-            table_name = table[0]
-            cursor = conn.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
-            print(f"  • {table_name}: {count} rows")
+        for table_name in TABLE_MAPPING.values():
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table_name,)).fetchone():
+                count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+                print(f"  • {table_name}: {count} rows")
+
+        # The journal mode is stored in the database file: ship it in rollback-journal mode so
+        # read-only deployments (e.g. Vercel) can open it; the app turns WAL on where it can write
+        if conn.execute("PRAGMA journal_mode=DELETE").fetchone()[0] != "delete":
+            print("⚠️  Could not switch the database out of WAL mode")
+
+        if failed:
+            raise RuntimeError(f"Could not load: {', '.join(failed)}")
+    finally:
+        conn.close()
+
+def main():
+    datasets = sorted(set(EXCEL_FILES) | set(TABLE_MAPPING.values()))
+    parser = argparse.ArgumentParser(description="Load the Excel files in data/ into the SQLite database")
+    parser.add_argument("--only", action="append", choices=datasets, metavar="DATASET",
+                        help="Only load this dataset (file type or table name); repeatable")
+    parser.add_argument("--force", action="store_true", help="Reload files even if their content is unchanged")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: one per file, up to the CPU count)")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
     try:
-        create_database()
+        create_database(only=args.only, force=args.force, workers=args.workers)
         print("\n🎉 Setup completed successfully!")
         print("\nNext steps:")
         print("1. Start your application")
@@ -175,4 +316,7 @@ if __name__ == "__main__":
         print("3. Use admin interface to upload new Excel files")
     except Exception as e:
         print(f"\n❌ Setup failed: {e}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
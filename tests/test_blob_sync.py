@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.blob_sync import MANIFEST_FILE, sync_blobs
+
+# sync_blobs against a local stand-in for the blob store: it serves each file
+# with an ETag, answers If-None-Match with 304 and records every request.
+
+class BlobStore:
+    def __init__(self):
+        self.files = {}  # path -> body
+        self.requests = []  # (path, If-None-Match header)
+
+    def put(self, path: str, body: bytes):
+        self.files[path] = body
+
+    def etag(self, path: str) -> str:
+        return f'"{hashlib.md5(self.files[path]).hexdigest()}"'
+
+class BlobHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        store = self.server.store
+        store.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path not in store.files:
+            self.send_error(404)
+            return
+        etag = store.etag(self.path)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = store.files[self.path]
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def store():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BlobHandler)
+    server.store = BlobStore()
+    server.store.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.store
+    server.shutdown()
+    server.server_close()
+
+# Helper to build the listing entry of a stored file, as vercel_blob.list returns it
+def listing(store: BlobStore, filename: str, uploaded_at: str) -> dict:
+    url = f"{store.base_url}/{filename}"
+    return {"pathname": filename, "url": url, "downloadUrl": url, "size": len(store.files[f"/{filename}"]), "uploadedAt": uploaded_at}
+
+def test_first_sync_downloads_and_writes_manifest(store, tmp_path):
+    store.put("/a.xlsx", b"first version")
+    results = sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-01-01")})
+
+    assert results["a.xlsx"]["status"] == "downloaded"
+    assert (tmp_path / "a.xlsx").read_bytes() == b"first version"
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())
+    assert manifest["a.xlsx"]["sha256"] == hashlib.sha256(b"first version").hexdigest()
+    assert manifest["a.xlsx"]["etag"] == store.etag("/a.xlsx")
+
+def test_unchanged_listing_makes_no_request(store, tmp_path):
+    store.put("/a.xlsx", b"first version")
+    blobs = {"a.xlsx": listing(store, "a.xlsx", "2024-01-01")}
+    sync_blobs(["a.xlsx"], tmp_path, blobs)
+    store.requests.clear()
+
+    results = sync_blobs(["a.xlsx"], tmp_path, blobs)
+
+    assert results["a.xlsx"]["status"] == "unchanged"
+    assert store.requests == []
+
+def test_relisted_blob_with_same_etag_gets_304(store, tmp_path):
+    store.put("/a.xlsx", b"first version")
+    sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-01-01")})
+    mtime = (tmp_path / "a.xlsx").stat().st_mtime_ns
+    store.requests.clear()
+
+    # Re-uploaded with the same content: the listing changed, the ETag didn't
+    results = sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-02-01")})
+
+    assert results["a.xlsx"]["status"] == "unchanged"
+    assert store.requests == [("/a.xlsx", store.etag("/a.xlsx"))]
+    assert (tmp_path / "a.xlsx").stat().st_mtime_ns == mtime
+    assert json.loads((tmp_path / MANIFEST_FILE).read_text())["a.xlsx"]["uploaded_at"] == "2024-02-01"
+
+def test_changed_blob_is_downloaded_again(store, tmp_path):
+    store.put("/a.xlsx", b"first version")
+    sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-01-01")})
+    old_etag = store.etag("/a.xlsx")
+
+    store.put("/a.xlsx", b"second, longer version")
+    results = sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-02-01")})
+
+    assert results["a.xlsx"]["status"] == "downloaded"
+    assert store.requests[-1] == ("/a.xlsx", old_etag)
+    assert (tmp_path / "a.xlsx").read_bytes() == b"second, longer version"
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())
+    assert manifest["a.xlsx"]["sha256"] == hashlib.sha256(b"second, longer version").hexdigest()
+    # No temp files left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([MANIFEST_FILE, "a.xlsx"])
+
+def test_missing_blob_is_reported_and_others_still_sync(store, tmp_path):
+    store.put("/a.xlsx", b"first version")
+    results = sync_blobs(["a.xlsx", "b.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-01-01")})
+
+    assert results["b.xlsx"] == {"status": "missing"}
+    assert results["a.xlsx"]["status"] == "downloaded"
+    assert not (tmp_path / "b.xlsx").exists()
+    assert "b.xlsx" not in json.loads((tmp_path / MANIFEST_FILE).read_text())
+
+def test_failed_download_keeps_local_copy(store, tmp_path):
+    store.put("/a.xlsx", b"first version")
+    sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": listing(store, "a.xlsx", "2024-01-01")})
+    blob = listing(store, "a.xlsx", "2024-02-01")
+    del store.files["/a.xlsx"]
+
+    results = sync_blobs(["a.xlsx"], tmp_path, {"a.xlsx": blob})
+
+    assert results["a.xlsx"]["status"] == "failed"
+    assert (tmp_path / "a.xlsx").read_bytes() == b"first version"
+    assert json.loads((tmp_path / MANIFEST_FILE).read_text())["a.xlsx"]["uploaded_at"] == "2024-01-01"
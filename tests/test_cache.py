@@ -0,0 +1,83 @@
+import random
+
+from app.cache import CacheShard, FrequencySketch, estimate_size
+
+# The memory cache is an LRU with a byte budget and a TinyLFU admission
+# policy: a new entry only evicts entries requested less often than it.
+
+def test_sketch_counts_and_ages():
+    sketch = FrequencySketch(width=4096, sample_size=100)
+    for _ in range(20):
+        sketch.record("hot")
+    sketch.record("cold")
+    assert sketch.estimate("hot") == 20
+    assert sketch.estimate("cold") == 1
+    assert sketch.estimate("never") == 0
+
+    # Every sample_size additions all counters are halved
+    for i in range(78):
+        sketch.record(f"other{i % 3}")
+    assert sketch.additions == 99
+    sketch.record("other")
+    assert sketch.additions == 50
+    assert sketch.estimate("hot") == 10
+    assert sketch.estimate("cold") == 0
+
+def test_sketch_counters_saturate():
+    sketch = FrequencySketch(width=4096, sample_size=10 ** 6)
+    for _ in range(300):
+        sketch.record("hot")
+    assert sketch.estimate("hot") == 255
+
+def test_get_and_set_count_a_request_once():
+    shard = CacheShard(max_bytes=10 ** 6, ttl=600)
+    assert shard.get("a") is None
+    shard.set("a", b"x" * 10)
+    assert shard.sketch.estimate("a") == 1
+    assert shard.get("a") == b"x" * 10
+    assert shard.sketch.estimate("a") == 2
+
+def test_one_off_key_cannot_push_out_a_hot_one():
+    value = b"x" * 1000
+    shard = CacheShard(max_bytes=estimate_size(value) + 500, ttl=600)
+    for _ in range(5):
+        shard.get("hot")
+    assert shard.set("hot", value)
+
+    assert shard.get("cold") is None
+    assert not shard.set("cold", value)
+    assert shard.get("hot") == value
+    assert shard.rejections == 1
+
+    # Once requested more often than the resident entry, it's admitted
+    for _ in range(10):
+        shard.get("cold")
+    assert shard.set("cold", value)
+    assert shard.get("hot") is None
+    assert shard.evictions == 1
+
+def test_stored_bytes_stay_within_budget():
+    budget = 20000
+    shard = CacheShard(max_bytes=budget, ttl=600)
+    rnd = random.Random(1)
+    for _ in range(2000):
+        key = f"q{int(rnd.paretovariate(1.2)) % 200}"
+        if shard.get(key) is None:
+            shard.set(key, b"x" * rnd.randint(10, 3000))
+        assert shard.bytes <= budget
+        assert shard.bytes == sum(entry[1] for entry in shard.entries.values())
+    assert shard.hits > 0 and shard.evictions > 0
+
+def test_value_over_budget_is_rejected():
+    shard = CacheShard(max_bytes=100, ttl=600)
+    assert not shard.set("big", b"x" * 1000)
+    assert shard.bytes == 0 and not shard.entries
+
+def test_expired_and_outdated_entries_miss():
+    shard = CacheShard(max_bytes=10 ** 6, ttl=0)
+    shard.set("a", b"x")
+    assert shard.get("a") is None
+    shard = CacheShard(max_bytes=10 ** 6, ttl=600)
+    shard.set("a", b"x", version=1)
+    assert shard.get("a", version=2) is None
+    assert shard.bytes == 0
@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.config import config
+from app.datasets import DATASETS, Dataset
+from app.fuzzy import FuzzyIndex, deletions, edit_distance, max_distance
+
+# Typo-tolerant search: a bounded Damerau-Levenshtein distance, a SymSpell
+# deletion dictionary over the vocabulary, and corrections that rank below
+# the words as typed.
+
+TABLE = "ptypes_dump"
+COLUMNS = ["ptype_id", "ptype_name"]
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("nestle", "nestle", 0),
+    ("nestle", "nesle", 1),        # deletion
+    ("nestle", "nesttle", 1),      # insertion
+    ("nestle", "nestla", 1),       # substitution
+    ("chocolate", "choclate", 1),
+    ("chocolate", "chcoolate", 1),  # swapped letters count as one edit
+    ("nestle", "entsle", 2),
+    ("abc", "", 3),
+])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 3) == distance
+    assert edit_distance(b, a, 3) == distance
+
+def test_edit_distance_stops_past_limit():
+    assert edit_distance("nestle", "unilever", 2) == 3
+    assert edit_distance("abc", "abcdefgh", 2) == 3  # length gap alone rules it out
+    assert edit_distance("kitten", "sitting", 2) == 3
+    assert edit_distance("kitten", "sitting", 3) == 3
+
+def test_deletions():
+    assert deletions("abc", 0) == {"abc"}
+    assert deletions("abc", 1) == {"abc", "bc", "ac", "ab"}
+    assert deletions("abc", 2) == {"abc", "bc", "ac", "ab", "a", "b", "c"}
+
+def test_max_distance_by_word_length():
+    assert [max_distance("x" * length, 2) for length in range(1, 11)] == [0, 0, 0, 1, 1, 1, 2, 2, 2, 2]
+    assert max_distance("chocolate", 1) == 1
+    assert max_distance("chocolate", 0) == 0
+
+def test_corrections():
+    index = FuzzyIndex(["chocolate", "nestle", "nestea", "oil", "olive"], 2)
+    assert index.corrections("nesle") == [("nestle", 1)]
+    assert index.corrections("choclate") == [("chocolate", 1)]
+    assert index.corrections("chcolaet") == [("chocolate", 2)]
+    # Closest first
+    assert index.corrections("nestlee") == [("nestle", 1), ("nestea", 2)]
+    # The word itself isn't a correction, short words and ids aren't corrected
+    assert index.corrections("nestle") == []
+    assert index.corrections("oel") == []
+    assert index.corrections("12345") == []
+
+def test_build_reuses_previous_index_when_vocabulary_is_unchanged():
+    texts = ["nestle milo", "chocolate bar", None]
+    index = FuzzyIndex.build(texts, 2)
+    assert FuzzyIndex.build(["milo nestle", "bar chocolate", "nestle"], 2, index) is index
+    assert FuzzyIndex.build(texts + ["olive oil"], 2, index) is not index
+    assert FuzzyIndex.build(texts, 1, index) is not index
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setitem(DATASETS, TABLE, DATASETS.get(TABLE))
+    db_file = tmp_path / "test.db"
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute(f'CREATE TABLE {TABLE} ("ptype_id" INTEGER, "ptype_name" TEXT)')
+        conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?)",
+                         [(1, "Chocolate"), (2, "Dark Chocolate Bar"), (3, "Choclate"), (4, "Olive Oil")])
+    conn.close()
+    return Dataset(db_file, TABLE, COLUMNS, label="Test")
+
+# Helper to run a search, as (ptype names, scores, total)
+def search(dataset, words, fuzzy):
+    results, total = asyncio.run(dataset.search(words, 0, 10, fuzzy=fuzzy))
+    return [result["row_data"]["ptype_name"] for result in results], [result["score"] for result in results], total
+
+def test_corrections_rank_below_exact_hits(dataset):
+    assert search(dataset, ["choclate"], fuzzy=False)[0] == ["Choclate"]
+    names, scores, total = search(dataset, ["choclate"], fuzzy=True)
+    assert total == 3
+    # The field spelled like the query beats the same match through a correction
+    assert names == ["Choclate", "Chocolate", "Dark Chocolate Bar"]
+    assert scores[0] > scores[1] > scores[2]
+
+def test_fuzzy_max_distance_zero_turns_fuzzy_search_off(dataset, monkeypatch):
+    monkeypatch.setattr(config, "FUZZY_MAX_DISTANCE", 0)
+    assert search(dataset, ["choclate"], fuzzy=True)[0] == ["Choclate"]
+    assert dataset.fuzzy is None
+    assert dataset.load_stats["fuzzy_words"] == 0
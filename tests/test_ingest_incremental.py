@@ -0,0 +1,145 @@
+import sqlite3
+
+import pytest
+
+from app.ingest import IngestionError, ingest_excel_incremental
+from app.versions import read_changed_rowids, read_version
+
+# ingest_excel_incremental diffs a workbook against the live table on its
+# natural key: rows sharing a key pair up in rowid order, paired rows that
+# differ are updated in place, the rest are inserted or deleted.
+
+TABLE = "rms_manufacturer_brands"
+COLUMNS = ["MfgID", "MfgName", "BrandID", "BrandName"]
+KEY = ["BrandID"]
+
+ROWS = [
+    (1, "Nestle", 10, "Milo"),
+    (1, "Nestle", 11, "Nescafe"),
+    (2, "Unilever", 20, "Dove"),
+    (2, "Unilever", 21, "Lux"),
+]
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_file = tmp_path / "test.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(f'CREATE TABLE {TABLE} ("MfgID" INTEGER, "MfgName" TEXT, "BrandID" INTEGER, "BrandName" TEXT)')
+    conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?)", ROWS)
+    conn.commit()
+    conn.close()
+    return db_file
+
+# Helper to write rows to a workbook with the table's header
+def workbook(path, rows, columns=COLUMNS):
+    from openpyxl import Workbook
+    book = Workbook()
+    sheet = book.active
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(list(row))
+    book.save(path)
+    return path
+
+# Helper to read the table as {rowid: row}
+def table_rows(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(f"SELECT rowid, * FROM {TABLE} ORDER BY rowid")}
+    finally:
+        conn.close()
+
+# Helper to read a dataset's version and the rowids changed since from_version
+def changes(db_file, from_version):
+    conn = sqlite3.connect(db_file)
+    try:
+        version = read_version(conn, TABLE)
+        return version, read_changed_rowids(conn, TABLE, from_version, version or 0)
+    finally:
+        conn.close()
+
+def apply(db_file, tmp_path, rows, name="upload.xlsx"):
+    return ingest_excel_incremental(db_file, workbook(tmp_path / name, rows), TABLE, COLUMNS, KEY)
+
+def test_insert_update_delete_and_unchanged(db_file, tmp_path):
+    before = table_rows(db_file)
+    counts = apply(db_file, tmp_path, [
+        (1, "Nestle", 10, "Milo"),            # unchanged
+        (1, "Nestle S.A.", 11, "Nescafe"),    # updated
+        (2, "Unilever", 21, "Lux"),           # unchanged, 20 is deleted
+        (3, "Mars", 30, "Snickers"),          # inserted
+    ])
+
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 2}
+    after = table_rows(db_file)
+    assert sorted(after.values()) == sorted([(1, "Nestle", 10, "Milo"), (1, "Nestle S.A.", 11, "Nescafe"),
+                                             (2, "Unilever", 21, "Lux"), (3, "Mars", 30, "Snickers")])
+    # Unchanged and updated rows keep their rowids, inserted rows come after every existing one
+    assert after[1] == before[1] and after[4] == before[4]
+    assert after[2] == (1, "Nestle S.A.", 11, "Nescafe")
+    assert 3 not in after
+    assert after[5] == (3, "Mars", 30, "Snickers")
+
+    version, changed = changes(db_file, 0)
+    assert version == 1
+    assert changed == {2, 3, 5}
+
+def test_unchanged_upload_writes_nothing(db_file, tmp_path):
+    apply(db_file, tmp_path, ROWS[:3], name="first.xlsx")
+    version, _ = changes(db_file, 0)
+    before = table_rows(db_file)
+
+    counts = apply(db_file, tmp_path, ROWS[:3], name="second.xlsx")
+
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 3}
+    assert table_rows(db_file) == before
+    assert changes(db_file, 0)[0] == version
+
+def test_duplicate_keys_pair_in_order(db_file, tmp_path):
+    conn = sqlite3.connect(db_file)
+    conn.execute(f"INSERT INTO {TABLE} VALUES (1, 'Nestle', 10, 'Milo 2')")
+    conn.commit()
+    conn.close()
+
+    # Key 10 is in the table twice and three times in the workbook: the first
+    # pair differs, the second matches and the third occurrence is new
+    counts = apply(db_file, tmp_path, [
+        (1, "Nestle", 10, "Milo Gold"),
+        (1, "Nestle", 10, "Milo 2"),
+        (1, "Nestle", 10, "Milo 3"),
+        *ROWS[1:],
+    ])
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 0, "unchanged": 4}
+    rows = table_rows(db_file)
+    assert rows[1] == (1, "Nestle", 10, "Milo Gold")
+    assert rows[5] == (1, "Nestle", 10, "Milo 2")
+    assert rows[6] == (1, "Nestle", 10, "Milo 3")
+
+    # Down to one occurrence: it pairs with the first row, the later ones are deleted
+    counts = apply(db_file, tmp_path, [(1, "Nestle", 10, "Milo Gold"), *ROWS[1:]], name="fewer.xlsx")
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 2, "unchanged": 4}
+    rows = table_rows(db_file)
+    assert [row for row in rows.values() if row[2] == 10] == [(1, "Nestle", 10, "Milo Gold")]
+    assert 1 in rows
+
+def test_null_values_compare_equal(db_file, tmp_path):
+    conn = sqlite3.connect(db_file)
+    conn.execute(f"UPDATE {TABLE} SET BrandName = NULL WHERE BrandID = 20")
+    conn.commit()
+    conn.close()
+
+    counts = apply(db_file, tmp_path, [row if row[2] != 20 else (2, "Unilever", 20, None) for row in ROWS])
+
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 4}
+
+def test_missing_key_column_is_rejected(db_file, tmp_path):
+    path = workbook(tmp_path / "no_key.xlsx", [(1, "Nestle", "Milo")], columns=["MfgID", "MfgName", "BrandName"])
+    with pytest.raises(IngestionError):
+        ingest_excel_incremental(db_file, path, TABLE, ["MfgID"], KEY)
+    assert sorted(table_rows(db_file).values()) == sorted(ROWS)
+
+def test_missing_table_is_rejected(tmp_path):
+    db_file = tmp_path / "empty.db"
+    sqlite3.connect(db_file).close()
+    with pytest.raises(IngestionError):
+        apply(db_file, tmp_path, ROWS)
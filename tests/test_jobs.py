@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+from app import jobs
+from app.jobs import IngestionJob, IngestionQueue
+
+# Uploads run as background jobs: one at a time per dataset, a newer upload
+# replaces one still waiting, and finished jobs are kept for status polling
+# up to MAX_FINISHED_JOBS.
+
+class Work:
+    """Fake ingestion recording which jobs ran, each held until release()"""
+
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+
+    def __call__(self, name, stages=("parse", "write"), error=None):
+        async def work(job):
+            self.started.append(name)
+            for stage in stages:
+                job.enter_stage(stage)
+                await asyncio.sleep(0.01)
+            await self.gates.setdefault(name, asyncio.Event()).wait()
+            if error is not None:
+                raise error
+            return {"name": name}
+        return work
+
+    def release(self, name):
+        self.gates.setdefault(name, asyncio.Event()).set()
+
+# Helper to wait until the queue is idle
+async def drain(queue):
+    while queue.workers:
+        await asyncio.sleep(0.005)
+
+def test_one_job_per_dataset_runs_at_a_time():
+    async def main():
+        queue, work = IngestionQueue(), Work()
+        first = queue.submit(IngestionJob("attributes", {}, work("first")))
+        other = queue.submit(IngestionJob("magazine", {}, work("other")))
+        await asyncio.sleep(0.05)
+        second = queue.submit(IngestionJob("attributes", {}, work("second")))
+        await asyncio.sleep(0.05)
+        # Different datasets run side by side, the second attributes job waits
+        assert work.started == ["first", "other"]
+        assert (first.status, second.status) == ("running", "queued")
+        for name in ("first", "other", "second"):
+            work.release(name)
+        await drain(queue)
+        assert work.started == ["first", "other", "second"]
+        assert [job.status for job in (first, other, second)] == ["succeeded"] * 3
+        assert second.result == {"name": "second"}
+    asyncio.run(main())
+
+def test_newer_upload_supersedes_a_queued_one():
+    async def main():
+        queue, work = IngestionQueue(), Work()
+        cleaned = []
+        running = queue.submit(IngestionJob("attributes", {}, work("running")))
+        await asyncio.sleep(0)
+        queued = queue.submit(IngestionJob("attributes", {}, work("queued"), cleanup=lambda: cleaned.append("queued")))
+        newest = queue.submit(IngestionJob("attributes", {}, work("newest")))
+        assert queued.status == "superseded"
+        assert queued.superseded_by == newest.id
+        assert cleaned == ["queued"]
+        work.release("running")
+        work.release("newest")
+        await drain(queue)
+        assert work.started == ["running", "newest"]
+        assert (running.status, newest.status) == ("succeeded", "succeeded")
+    asyncio.run(main())
+
+def test_failed_job_keeps_its_error_and_the_queue_goes_on():
+    async def main():
+        queue, work = IngestionQueue(), Work()
+        failed = queue.submit(IngestionJob("attributes", {}, work("bad", error=ValueError("Missing required columns"))))
+        await asyncio.sleep(0)
+        after = queue.submit(IngestionJob("attributes", {}, work("after")))
+        work.release("bad")
+        work.release("after")
+        await drain(queue)
+        assert failed.status == "failed"
+        assert failed.error == "Missing required columns"
+        assert after.status == "succeeded"
+    asyncio.run(main())
+
+def test_to_dict_reports_stage_timings():
+    async def main():
+        queue, work = IngestionQueue(), Work()
+        job = queue.submit(IngestionJob("attributes", {"file_type": "attributes", "mode": "replace"},
+                                        work("timed", stages=("parse", "validate", "write"))))
+        await asyncio.sleep(0.05)
+        running = job.to_dict()
+        assert running["status"] == "running"
+        assert running["stage"] == "write"
+        assert [stage["name"] for stage in running["stages"]] == ["parse", "validate", "write"]
+        assert running["stages"][-1]["ms"] is None
+        work.release("timed")
+        await drain(queue)
+        done = job.to_dict()
+        assert done["status"] == "succeeded"
+        assert done["file_type"] == "attributes" and done["mode"] == "replace"
+        assert done["stage"] is None
+        assert all(stage["ms"] >= 5 for stage in done["stages"])
+        assert done["started_at"] and done["finished_at"]
+    asyncio.run(main())
+
+def test_finished_jobs_are_pruned(monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_FINISHED_JOBS", 3)
+
+    async def main():
+        queue, work = IngestionQueue(), Work()
+        submitted = []
+        for i in range(6):
+            work.release(f"job{i}")
+            submitted.append(queue.submit(IngestionJob("attributes", {}, work(f"job{i}", stages=()))))
+            await drain(queue)
+        # Pruned when the next job is submitted: the newest finished ones are kept
+        assert [job["job_id"] for job in queue.list()] == [job.id for job in reversed(submitted[2:])]
+        assert queue.get(submitted[0].id) is None
+    asyncio.run(main())
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    # Without the context manager the app's startup (warmup) doesn't run
+    return TestClient(app)
+
+def test_job_status_needs_the_admin_password(client, monkeypatch):
+    from app.config import config
+    from app.routes import admin
+    monkeypatch.setattr(config, "ADMIN_PASSWORD", "secret")
+    job = IngestionJob("attributes", {"file_type": "attributes"}, None)
+    job.finish("succeeded")
+    monkeypatch.setitem(admin.ingestion_jobs.jobs, job.id, job)
+
+    for url in ("/admin/jobs", f"/admin/jobs/{job.id}"):
+        assert client.get(url).status_code == 401
+        assert client.get(url, headers={"X-Admin-Password": "wrong"}).status_code == 401
+        assert client.get(url, headers={"X-Admin-Password": "secret"}).status_code == 200
+    assert client.get(f"/admin/jobs/{job.id}", headers={"X-Admin-Password": "secret"}).json()["status"] == "succeeded"
+    assert client.get("/admin/jobs/missing", headers={"X-Admin-Password": "secret"}).status_code == 404
+
+def test_upload_needs_the_admin_password_and_returns_a_job(client, monkeypatch):
+    from app.config import config
+    from app.routes import admin
+    monkeypatch.setattr(config, "ADMIN_PASSWORD", "secret")
+    queued = []
+
+    # Queue nothing for real, the upload would be written to the shipped database
+    def queue_ingestion(file_type, path, content_hash, mode="replace", **kwargs):
+        job = IngestionJob(admin.TABLE_MAPPING[file_type], {"file_type": file_type, "mode": mode}, None)
+        queued.append((job, path))
+        return job
+    monkeypatch.setattr(admin, "queue_ingestion", queue_ingestion)
+    files = {"file": ("Magazine.xlsx", b"not really a workbook")}
+
+    response = client.post("/admin/upload/magazine", data={"admin_password": "wrong"}, files=files)
+    assert response.status_code == 401
+    assert queued == []
+
+    response = client.post("/admin/upload/magazine", data={"admin_password": "secret"}, files=files)
+    assert response.status_code == 202
+    job, path = queued[0]
+    assert response.json()["job_id"] == job.id
+    assert response.json()["status_url"] == f"/admin/jobs/{job.id}"
+    assert path.read_bytes() == b"not really a workbook"
+    path.unlink()
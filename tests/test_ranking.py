@@ -0,0 +1,104 @@
+import asyncio
+import random
+import sqlite3
+
+import pytest
+
+from app.columnar import ColumnarTable
+from app.config import config
+from app.datasets import DATASETS, Dataset
+from app.fts import build_fts_table
+from app.ranking import ranked_matches, row_scorer, score_value, score_word, top_matches
+
+# Ranking: a word equal to a field beats a field prefix, which beats a later
+# word's prefix, which beats a substring; earlier columns and shorter fields
+# weigh more. Pages come off a bounded heap and must line up with a full
+# sort, whichever engine matched the rows.
+
+TABLE = "rms_manufacturer_brands"
+COLUMNS = ["MfgID", "MfgName", "BrandID", "BrandName"]
+
+def test_score_word_order():
+    exact = score_word("milo", "milo")
+    prefix = score_word("milo gold", "milo")
+    word_prefix = score_word("gold milo", "milo")
+    substring = score_word("camilo", "milo")
+    assert exact > prefix > word_prefix > substring > 0
+    assert score_word("nescafe", "milo") == 0.0
+
+def test_shorter_fields_score_higher():
+    assert score_word("milo bar", "milo") > score_word("milo chocolate bar", "milo")
+    assert score_value("milo gold", ["milo", "gold"]) > score_value("milo gold extra", ["milo", "gold"])
+
+def test_earlier_columns_weigh_more():
+    table = ColumnarTable.from_records(["Name", "Notes"], [("other", "milo"), ("milo", "other")])
+    score_row = row_scorer(table, ["Name", "Notes"], ["milo"])
+    assert score_row(1) > score_row(0)
+
+def test_ranking_on_small_table():
+    table = ColumnarTable.from_records(["Name"], [("Camilo",), ("Gold Milo",), ("Milo",), ("Milo Gold",), ("Milo Gold Extra",)])
+    ranked = [row_id for row_id, _ in top_matches(table, range(5), ["Name"], ["milo"], 5)]
+    assert ranked == [2, 3, 4, 1, 0]
+
+def test_top_matches_equals_full_sort():
+    rnd = random.Random(3)
+    words = ["milo", "gold", "nestle", "camilo", "milo's", "bar", "mi", "lo"]
+    records = [(" ".join(rnd.choice(words) for _ in range(rnd.randint(1, 3))), rnd.choice(words)) for _ in range(500)]
+    table = ColumnarTable.from_records(["Name", "Brand"], records)
+    row_ids = [row_id for row_id, (name, brand) in enumerate(records) if "mi" in f"{name} {brand}".lower()]
+    score_row = row_scorer(table, ["Name", "Brand"], ["mi"])
+    full = sorted(((row_id, score_row(row_id)) for row_id in row_ids), key=lambda match: (-match[1], match[0]))
+    for count in (1, 7, 50, len(row_ids), len(row_ids) + 10):
+        assert top_matches(table, row_ids, ["Name", "Brand"], ["mi"], count) == full[:count]
+    assert list(ranked_matches(table, row_ids, ["Name", "Brand"], ["mi"])) == full
+    assert top_matches(table, row_ids, ["Name", "Brand"], ["mi"], 0) == []
+
+@pytest.fixture
+def db_file(tmp_path):
+    rnd = random.Random(5)
+    makers = ["Nestle", "Nestle India", "Mars", "Mars Nestle Foods", "Unilever"]
+    brands = ["Milo", "Milo Gold", "Nescafe", "Snickers", "Dove", "Nestea", "Smarties"]
+    db_file = tmp_path / "test.db"
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute(f'CREATE TABLE {TABLE} ("MfgID" INTEGER, "MfgName" TEXT, "BrandID" INTEGER, "BrandName" TEXT)')
+        conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?)",
+                         [(rnd.randint(1, 50), rnd.choice(makers), brand_id, rnd.choice(brands)) for brand_id in range(300)])
+        build_fts_table(conn, TABLE)
+    conn.close()
+    return db_file
+
+# Helper to run a search through one engine, as (BrandIDs, scores, total)
+def search(dataset, monkeypatch, engine, words, offset, limit):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", engine)
+    results, total = asyncio.run(dataset.search(words, offset, limit))
+    return [result["row_data"]["BrandID"] for result in results], [result["score"] for result in results], total
+
+@pytest.mark.parametrize("engine", ["memory", "fts"])
+@pytest.mark.parametrize("words", [["nes"], ["nestle"], ["milo", "nestle"], ["s"]])
+def test_pages_line_up_with_one_big_page(db_file, monkeypatch, engine, words):
+    monkeypatch.setitem(DATASETS, TABLE, DATASETS.get(TABLE))
+    dataset = Dataset(db_file, TABLE, COLUMNS, label="Test")
+    everything, scores, total = search(dataset, monkeypatch, engine, words, 0, 1000)
+    assert total == len(everything) > 10
+    assert scores == sorted(scores, reverse=True)
+
+    pages = []
+    for offset in range(0, total, 7):
+        page, _, page_total = search(dataset, monkeypatch, engine, words, offset, 7)
+        assert page_total == total
+        pages.extend(page)
+    assert pages == everything
+    assert len(set(pages)) == len(pages)
+
+    # total_matches doesn't depend on the page asked for
+    for offset, limit in ((0, 1), (5, 3), (total - 1, 50), (total + 5, 10)):
+        assert search(dataset, monkeypatch, engine, words, offset, limit)[2] == total
+    # The FTS engine answered from SQLite, it didn't fall back to loading the rows
+    assert (dataset.rows is None) == (engine == "fts")
+
+def test_engines_rank_alike(db_file, monkeypatch):
+    monkeypatch.setitem(DATASETS, TABLE, DATASETS.get(TABLE))
+    dataset = Dataset(db_file, TABLE, COLUMNS, label="Test")
+    for words in (["nes"], ["milo", "gold"], ["mars"]):
+        assert search(dataset, monkeypatch, "fts", words, 0, 100) == search(dataset, monkeypatch, "memory", words, 0, 100)
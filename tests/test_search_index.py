@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from app.columnar import ColumnarTable
+from app.search_index import TrigramIndex
+
+# The trigram index must return exactly the rows the routers' original scan
+# matched: every query word a substring of the row's lowercased search
+# columns joined by spaces, NULLs skipped, in row order.
+
+COLUMNS = ["Name", "Code", "Category"]
+
+def scan(rows, columns, words):
+    """The routers' original per-row scan"""
+    matched = []
+    for row_id, row in enumerate(rows):
+        if row is None:
+            continue
+        row_text = ' '.join(str(row[col]).lower() for col in columns if col in row and row[col] is not None)
+        if all(word in row_text for word in words):
+            matched.append(row_id)
+    return matched
+
+def random_records(seed: int, count: int):
+    rnd = random.Random(seed)
+    words = ["Nestle", "Chocolate", "Dark", "MILK", "oil", "Olive", "a", "Ab", "x-ray", "Café", "1166", "12.5", "Men's", "é"]
+    records = []
+    for _ in range(count):
+        name = " ".join(rnd.choice(words) for _ in range(rnd.randint(1, 3)))
+        code = rnd.choice([None, rnd.randint(0, 5000), rnd.random() * 100, f"C{rnd.randint(0, 99)}"])
+        category = rnd.choice([None, "Food", "Food > Snacks", "Home Care", ""])
+        records.append((name, code, category))
+    return records
+
+QUERIES = [
+    ["oil"], ["olive", "oil"], ["a"], ["ab"], ["é"], ["café"], ["116"], ["12.5"], ["men's"], ["x-ray"],
+    ["food"], ["food", ">"], ["snacks", "dark"], ["c1"], ["none"], ["zzz"], ["k o"], ["milk", "chocolate", "nestle"],
+    ["nestle dark"], ["e n"], [" "], ["lk c"],
+]
+
+@pytest.fixture(scope="module")
+def table():
+    return ColumnarTable.from_records(COLUMNS, random_records(7, 2000))
+
+@pytest.mark.parametrize("words", QUERIES)
+def test_matches_original_scan(table, words):
+    index = TrigramIndex(table, COLUMNS)
+    assert index.search_ids(words) == scan(list(table), COLUMNS, words)
+
+def test_matches_original_scan_on_random_substrings(table):
+    index = TrigramIndex(table, COLUMNS)
+    rows = list(table)
+    rnd = random.Random(11)
+    for _ in range(300):
+        text = index.texts[rnd.randrange(len(rows))]
+        start = rnd.randrange(len(text))
+        words = [text[start:start + rnd.randint(1, 6)]]
+        if rnd.random() < 0.3:
+            words.append(rnd.choice(["oil", "food", "a", "12"]))
+        words = [word for word in words if word.strip()]
+        if not words:
+            continue
+        assert index.search_ids(words) == scan(rows, COLUMNS, words), words
+
+def test_only_search_columns_are_searched():
+    table = ColumnarTable.from_records(["Name", "Hidden"], [("Olive Oil", "secret"), ("Ghee", None)])
+    index = TrigramIndex(table, ["Name"])
+    assert index.search_ids(["secret"]) == []
+    assert index.search_ids(["oil"]) == [0]
+
+def test_empty_query_matches_nothing(table):
+    assert TrigramIndex(table, COLUMNS).search_ids([]) == []
+
+def test_patched_index_matches_scan_of_patched_rows(table):
+    index = TrigramIndex(table, COLUMNS)
+    updates = {0: {"Name": "Fresh Quuxberry", "Code": 1, "Category": "Food"}, 1: None, 5: {"Name": "Olive Oil", "Code": None, "Category": None}}
+    appended = [{"Name": "Quuxberry Jam", "Code": "Q1", "Category": "Food > Snacks"}]
+    patched = index.patch(updates, appended)
+    rows = list(patched.rows)
+    for words in QUERIES + [["quuxberry"], ["quux", "food"], ["jam"]]:
+        assert patched.search_ids(words) == scan(rows, COLUMNS, words), words
+    # The original index is left as it was
+    assert index.search_ids(["quuxberry"]) == []
+
+def test_search_any_ids_with_single_word_groups_matches_search_ids(table):
+    index = TrigramIndex(table, COLUMNS)
+    for words in QUERIES:
+        assert index.search_any_ids([[word] for word in words]) == index.search_ids(words), words
+
+def test_matches_original_scan_on_shipped_database():
+    from pathlib import Path
+    from app.datasets import read_table
+    db_file = Path(__file__).parent.parent / "data" / "custom_search.db"
+    if not db_file.exists():
+        pytest.skip("no database in data/")
+    columns = ["MfgID", "MfgName", "BrandID", "BrandName"]
+    table = read_table(db_file, "rms_manufacturer_brands")
+    index = TrigramIndex(table, columns)
+    rows = list(table)
+    for words in (["nestle"], ["a"], ["oil"], ["10"], ["foods", "pvt"], ["zzqx"]):
+        assert index.search_ids(words) == scan(rows, columns, words), words
@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.datasets import DATASETS, Dataset
+from app.singleflight import SingleFlight
+
+# Concurrent calls with the same key share one execution: its result, or its
+# exception, goes to every waiter, and the key is released once it finishes.
+
+class Counter:
+    """Coroutine function counting its runs, each one held until release()"""
+
+    def __init__(self, result="done", error=None):
+        self.runs = 0
+        self.result = result
+        self.error = error
+        self.gate = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self.gate.set()
+
+def test_concurrent_calls_run_once():
+    async def main():
+        flights = SingleFlight()
+        work = Counter()
+        waiters = [asyncio.ensure_future(flights.do("key", work)) for _ in range(10)]
+        await asyncio.sleep(0)
+        work.release()
+        assert await asyncio.gather(*waiters) == ["done"] * 10
+        assert work.runs == 1
+        assert flights.get_stats() == {"in_flight": 0, "executed": 1, "coalesced": 9}
+    asyncio.run(main())
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flights = SingleFlight()
+        work = Counter(error=ValueError("boom"))
+        waiters = [asyncio.ensure_future(flights.do("key", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        work.release()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert work.runs == 1
+        assert all(isinstance(result, ValueError) and str(result) == "boom" for result in results)
+        assert flights.calls == {}
+    asyncio.run(main())
+
+def test_key_is_released_so_the_next_call_runs_again():
+    async def main():
+        flights = SingleFlight()
+        work = Counter()
+        work.release()
+        assert await flights.do("key", work) == "done"
+        assert "key" not in flights.calls
+        assert await flights.do("key", work) == "done"
+        assert work.runs == 2
+        # Different keys never share a run
+        await asyncio.gather(flights.do("a", work), flights.do("b", work))
+        assert work.runs == 4
+    asyncio.run(main())
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    async def main():
+        flights = SingleFlight()
+        work = Counter()
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        work.release()
+        assert await second == "done"
+        assert first.cancelled()
+    asyncio.run(main())
+
+TABLE = "rms_manufacturer_brands"
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setitem(DATASETS, TABLE, DATASETS.get(TABLE))
+    db_file = tmp_path / "test.db"
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute(f'CREATE TABLE {TABLE} ("MfgID" INTEGER, "MfgName" TEXT, "BrandID" INTEGER, "BrandName" TEXT)')
+        conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?)", [(1, "Nestle", 10, "Milo"), (2, "Mars", 20, "Snickers")])
+    conn.close()
+    return Dataset(db_file, TABLE, ["MfgID", "MfgName", "BrandID", "BrandName"], label="Test")
+
+def test_concurrent_dataset_loads_and_searches_run_once(dataset, monkeypatch):
+    loads, searches = [], []
+    load_snapshot, search = dataset._load_snapshot, dataset._search
+    monkeypatch.setattr(dataset, "_load_snapshot", lambda: loads.append(1) or load_snapshot())
+
+    async def counted_search(*args):
+        searches.append(args)
+        return await search(*args)
+    monkeypatch.setattr(dataset, "_search", counted_search)
+
+    async def main():
+        results = await asyncio.gather(*(dataset.search(["milo"]) for _ in range(8)))
+        assert all(result == results[0] for result in results)
+        assert results[0][1] == 1
+        # A different query is a different flight
+        await asyncio.gather(dataset.search(["milo"]), dataset.search(["mars"]))
+    asyncio.run(main())
+    assert len(loads) == 1
+    assert len(searches) == 3
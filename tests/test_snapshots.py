@@ -0,0 +1,59 @@
+import sqlite3
+
+from app.snapshots import load_snapshot, snapshot_is_current, write_snapshot
+from app.versions import bump_version, read_source, read_version, record_content_hash
+
+# A snapshot is only loaded for the version and source it was built from: a
+# database rebuilt from other files counts its versions from 1 again.
+
+TABLE = "rms_manufacturer_brands"
+COLUMNS = ["MfgID", "MfgName", "BrandID", "BrandName"]
+
+# Helper to (re)build the database the way an ingestion does: replace the table, bump its version, record the file's hash
+def build_database(db_file, rows, content_hash):
+    if db_file.exists():
+        db_file.unlink()
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute(f'CREATE TABLE {TABLE} ("MfgID" INTEGER, "MfgName" TEXT, "BrandID" INTEGER, "BrandName" TEXT)')
+        conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?)", rows)
+        bump_version(conn, TABLE)
+        record_content_hash(conn, TABLE, content_hash)
+    return conn
+
+# Helper to load a table's snapshot against the database's current version and source
+def load(conn, db_file):
+    return load_snapshot(db_file, TABLE, read_version(conn, TABLE), read_source(conn, TABLE), COLUMNS)
+
+def test_snapshot_loads_for_the_database_it_was_built_from(tmp_path):
+    db_file = tmp_path / "test.db"
+    conn = build_database(db_file, [(1, "Nestle", 10, "Milo"), (2, "Mars", 20, "Snickers")], "hash-a")
+    write_snapshot(conn, db_file, TABLE, read_version(conn, TABLE))
+
+    assert snapshot_is_current(conn, db_file, TABLE)
+    rows, index, rowids = load(conn, db_file)
+    assert [row["BrandName"] for row in rows] == ["Milo", "Snickers"]
+    assert index.search_ids(["snick"]) == [1]
+    assert rowids == [1, 2]
+    conn.close()
+
+def test_snapshot_of_a_rebuilt_database_is_not_used(tmp_path):
+    db_file = tmp_path / "test.db"
+    conn = build_database(db_file, [(1, "Nestle", 10, "Milo")], "hash-a")
+    write_snapshot(conn, db_file, TABLE, read_version(conn, TABLE))
+    conn.close()
+
+    # Rebuilt from another file: same version number, other rows
+    conn = build_database(db_file, [(2, "Mars", 20, "Snickers")], "hash-b")
+    assert read_version(conn, TABLE) == 1
+
+    assert not snapshot_is_current(conn, db_file, TABLE)
+    assert load(conn, db_file) is None
+    conn.close()
+
+def test_missing_snapshot_is_not_current(tmp_path):
+    db_file = tmp_path / "test.db"
+    conn = build_database(db_file, [(1, "Nestle", 10, "Milo")], "hash-a")
+    assert not snapshot_is_current(conn, db_file, TABLE)
+    assert load(conn, db_file) is None
+    conn.close()
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+
+from app.config import config
+from app.datasets import DATASETS, Dataset
+from app.ingest import ingest_excel_incremental
+from app.versions import bump_version
+
+# With SEARCH_ENGINE=fts the rows are never loaded, so suggestions come from
+# an index built from the suggest columns alone. It must answer like the one
+# built from the loaded rows, and be rebuilt when the dataset changes.
+
+TABLE = "rms_manufacturer_brands"
+COLUMNS = ["MfgID", "MfgName", "BrandID", "BrandName"]
+
+ROWS = [
+    (1, "Nestle", 10, "Milo"),
+    (1, "Nestle", 11, "Nescafe Gold"),
+    (2, "Unilever", 20, "Dove Men+Care"),
+    (2, "unilever ", 21, None),
+    (3, "Mars", 30, "Snickers"),
+]
+
+PREFIXES = ["n", "ne", "nes", "U", "gold", "men", "care", "mars", "x", " ", "mi"]
+
+def make_dataset(tmp_path, monkeypatch, versioned=True):
+    # Datasets register themselves, put back whatever the app registered under this table
+    monkeypatch.setitem(DATASETS, TABLE, DATASETS.get(TABLE))
+    db_file = tmp_path / "test.db"
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute(f'CREATE TABLE {TABLE} ("MfgID" INTEGER, "MfgName" TEXT, "BrandID" INTEGER, "BrandName" TEXT)')
+        conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?)", ROWS)
+        if versioned:
+            bump_version(conn, TABLE)
+    conn.close()
+    return Dataset(db_file, TABLE, COLUMNS, label="Test", suggest_columns=["MfgName", "BrandName"])
+
+def suggestions(dataset, engine, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", engine)
+    return {prefix: asyncio.run(dataset.suggest(prefix, 10)) for prefix in PREFIXES}
+
+def test_fts_suggestions_match_loaded_rows_without_loading_them(tmp_path, monkeypatch):
+    dataset = make_dataset(tmp_path, monkeypatch)
+    fts = suggestions(dataset, "fts", monkeypatch)
+    assert dataset.rows is None
+    assert fts["nes"] == [{"value": "Nescafe Gold", "column": "BrandName", "count": 1},
+                          {"value": "Nestle", "column": "MfgName", "count": 2}]
+    assert suggestions(dataset, "memory", monkeypatch) == fts
+
+def test_fts_suggestions_without_versions_table(tmp_path, monkeypatch):
+    dataset = make_dataset(tmp_path, monkeypatch, versioned=False)
+    fts = suggestions(dataset, "fts", monkeypatch)
+    assert dataset.rows is None
+    assert suggestions(dataset, "memory", monkeypatch) == fts
+
+def test_fts_suggestions_follow_new_versions(tmp_path, monkeypatch):
+    from openpyxl import Workbook
+    monkeypatch.setattr(config, "VERSION_CHECK_INTERVAL", 0)
+    dataset = make_dataset(tmp_path, monkeypatch)
+    assert suggestions(dataset, "fts", monkeypatch)["mars"][0]["value"] == "Mars"
+
+    book = Workbook()
+    book.active.append(COLUMNS)
+    for row in ROWS[:4] + [(3, "Mars Wrigley", 30, "Snickers")]:
+        book.active.append(list(row))
+    book.save(tmp_path / "upload.xlsx")
+    ingest_excel_incremental(dataset.db_file, tmp_path / "upload.xlsx", TABLE, COLUMNS, ["BrandID"])
+
+    assert [found["value"] for found in suggestions(dataset, "fts", monkeypatch)["mars"]] == ["Mars Wrigley"]
+    assert dataset.rows is None
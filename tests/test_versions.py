@@ -0,0 +1,39 @@
+import sqlite3
+
+from app.versions import VersionTracker, bump_version
+
+# VersionTracker is read on the event loop for every search: it re-reads the
+# versions only after another connection committed, and never waits for a
+# poll running in another thread.
+
+def bump(db_file, table):
+    conn = sqlite3.connect(db_file)
+    with conn:
+        version = bump_version(conn, table)
+    conn.close()
+    return version
+
+def test_tracker_sees_versions_written_by_other_connections(tmp_path):
+    db_file = tmp_path / "test.db"
+    tracker = VersionTracker(db_file, check_interval=0)
+    assert tracker.get("magazine") is None
+    bump(db_file, "magazine")
+    assert tracker.get("magazine") == 1
+    assert tracker.get("attributes") == 0
+    bump(db_file, "magazine")
+    assert tracker.get("magazine") == 2
+
+def test_busy_lock_serves_the_cached_versions(tmp_path):
+    db_file = tmp_path / "test.db"
+    bump(db_file, "magazine")
+    tracker = VersionTracker(db_file, check_interval=0)
+    assert tracker.get("magazine") == 1
+    bump(db_file, "magazine")
+
+    # Another thread is polling: get returns at once with what it read last
+    tracker.lock.acquire()
+    try:
+        assert tracker.get("magazine") == 1
+    finally:
+        tracker.lock.release()
+    assert tracker.get("magazine") == 2